@@ -0,0 +1,255 @@
+import sys
+sys.dont_write_bytecode = True
+
+import os
+# one math thread per process; the process pool does the parallel work (avoids oversubscribing the node)
+for _env in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+    os.environ.setdefault(_env, '1')
+
+import json
+import time
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import xarray as xr
+import numpy as np
+
+from lazy_imports import lazy_import
+from regrid_funcs import grid_fingerprint
+from data_funcs import get_xy_coords, regrid_like
+
+# plotting is only set up inside the worker processes
+mpl = lazy_import('matplotlib')
+
+#############################
+# Headless map atlas: every (model x field x season) panel from a json spec, rendered across a process pool
+#   - python atlas.py atlas_spec.json [--workers N] [--force] [--dry-run]
+#   - each task is one (model, field): the file is opened once and all of its seasons are drawn
+#   - panels whose output files are newer than the input data are skipped (--force redraws them)
+#   - each worker keeps a few MapTemplates (one per grid & map layout) and reuses them across tasks
+#
+# spec layout:
+#   {"output_dir": "atlas",
+#    "output": "{output_dir}/{field}/{model}_{field}_{season}",    (optional, extension is added)
+#    "formats": ["png"],
+#    "dpi": 150,
+#    "seasons": ["DJF", "MAM", "JJA", "SON", "ANN"],
+#    "models": {"GISS-E2-1-G": "/path/to/{var}_GISS-E2-1-G_clim.nc", ...},
+#    "reference": "ERA5",                                          (optional, a key of "models")
+#    "map": {"boundaries": null, "central_longitude": 0, "mask": null},
+#    "fields": [{"var": "pr", "field": "prec", "scale": 86400, "units": "mm/day"},
+#               {"var": "pr", "field": "prec", "scale": 86400, "diff": true, "name": "prec_bias"}, ...]}
+#   - "field" is a get_settings name; "diff": true plots model minus the reference with the diff settings
+#   - input files hold a monthly climatology ('month' dim), monthly data ('time' dim), or a 'season' dim
+#############################
+
+# per-worker map templates, keyed by grid fingerprint + map layout
+_TEMPLATES = OrderedDict()
+# most templates (open figures) a worker keeps at once
+MAX_TEMPLATES = 4
+
+DEFAULT_OUTPUT = '{output_dir}/{field}/{model}_{field}_{season}'
+DEFAULT_SEASONS = ['DJF', 'MAM', 'JJA', 'SON', 'ANN']
+
+###
+
+def load_spec(path):
+    """
+    Read an atlas spec (json) and fill in the defaults
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    spec.setdefault('output_dir', 'atlas')
+    spec.setdefault('output', DEFAULT_OUTPUT)
+    spec.setdefault('formats', ['png'])
+    spec.setdefault('dpi', 150)
+    spec.setdefault('seasons', DEFAULT_SEASONS)
+    spec.setdefault('map', {})
+    spec.setdefault('reference', None)
+    return(spec)
+
+def atlas_tasks(spec):
+    """
+    One task per (model, field) in the spec, each with its input files and the output path of every season
+    """
+    tasks = []
+    ref = spec['reference']
+    for model, path in spec['models'].items():
+        for fld in spec['fields']:
+            diff = fld.get('diff', False)
+            if diff and (ref is None or model == ref):
+                continue
+            name = fld.get('name', fld['field'])
+            inputs = [path.format(var=fld['var'], model=model)]
+            if diff:
+                inputs.append(spec['models'][ref].format(var=fld['var'], model=ref))
+            outputs = {season: spec['output'].format(output_dir=spec['output_dir'], field=name,
+                                                     model=model, season=season, var=fld['var'])
+                       for season in fld.get('seasons', spec['seasons'])}
+            tasks.append({'model': model, 'name': name, 'var': fld['var'], 'field': fld['field'],
+                          'diff': diff, 'scale': fld.get('scale', 1.), 'units': fld.get('units'),
+                          'label': fld.get('label', '{model} {name} {season}'),
+                          'inputs': inputs, 'outputs': outputs,
+                          'formats': spec['formats'], 'dpi': spec['dpi'], 'map': spec['map']})
+    return(tasks)
+
+def is_up_to_date(ofile, formats, inputs):
+    """
+    True if every output format exists and is newer than all the input files
+    """
+    newest = max([os.path.getmtime(f) for f in inputs if os.path.exists(f)], default=0.)
+    for fmt in formats:
+        out = '{}.{}'.format(ofile, fmt)
+        if (not os.path.exists(out)) or (os.path.getmtime(out) < newest):
+            return(False)
+    return(True)
+
+###
+
+def _init_worker():
+    """
+    Headless matplotlib in every worker
+    """
+    mpl.use('Agg')
+
+def _load_field(path, var, scale=1.):
+    """
+    Open one variable as a monthly (or seasonal) climatology
+    """
+    with xr.open_dataset(path) as ds:
+        da = ds[var].load()
+    if ('time' in da.dims) and ('month' not in da.dims):
+        da = da.groupby('time.month').mean('time', keep_attrs=True)
+    if scale != 1.:
+        da = (da*scale).assign_attrs(da.attrs)
+    return(da)
+
+def _align_reference(var, ref):
+    """
+    Reference field on exactly the grid of var (for model minus reference)
+        - regridded whenever the lat/lon values differ, not just the shape (e.g. 0:360 vs -180:180
+          longitudes or north-to-south latitudes on a grid of the same size)
+        - relabeled with var's coordinate names & values, so the two line up in var - ref
+    """
+    x_var, y_var = get_xy_coords(var)
+    x_ref, y_ref = get_xy_coords(ref)
+    same = (x_ref.shape == x_var.shape and y_ref.shape == y_var.shape
+            and np.allclose(x_ref.values, x_var.values) and np.allclose(y_ref.values, y_var.values))
+    if not same:
+        ref = regrid_like(var, ref)
+        x_ref, y_ref = get_xy_coords(ref)
+    ref = ref.rename({y_ref.dims[0]: y_var.dims[0], x_ref.dims[-1]: x_var.dims[-1]})
+    ref = ref.drop_vars([c for c in [y_ref.name, x_ref.name] if c in ref.coords and c not in ref.dims])
+    return(ref.assign_coords({y_var.name: y_var, x_var.name: x_var}))
+
+def _get_template(lons, lats, layout, dpi):
+    """
+    MapTemplate for a grid & map layout, created once per worker and reused across tasks
+    """
+    from map_plot_tools import MapTemplate, ccrs
+    key = grid_fingerprint(lons, lats, tag=repr(sorted(layout.items()))+str(dpi))
+    if key in _TEMPLATES:
+        _TEMPLATES.move_to_end(key)
+        return(_TEMPLATES[key])
+    if len(_TEMPLATES) >= MAX_TEMPLATES:
+        _TEMPLATES.popitem(last=False)[1].close()
+    proj = ccrs.PlateCarree(central_longitude=layout.get('central_longitude', 0))
+    _TEMPLATES[key] = MapTemplate(lons, lats, proj=proj, boundaries=layout.get('boundaries'),
+                                  mask=layout.get('mask'), dpi=dpi)
+    return(_TEMPLATES[key])
+
+def render_task(task, force=False):
+    """
+    Draw every season of one (model, field) that isn't up to date
+
+    Returns
+    -------
+    (model, name, number of panels drawn)
+    """
+    seasons = [s for s, ofile in task['outputs'].items()
+               if force or not is_up_to_date(ofile, task['formats'], task['inputs'])]
+    if len(seasons) == 0:
+        return(task['model'], task['name'], 0)
+
+    var = _load_field(task['inputs'][0], task['var'], task['scale'])
+    if task['diff']:
+        ref = _align_reference(var, _load_field(task['inputs'][1], task['var'], task['scale']))
+        var = (var - ref).assign_attrs(var.attrs)
+    if task['units'] is not None:
+        var.attrs['units'] = task['units']
+
+    lons, lats = get_xy_coords(var)
+    tmpl = _get_template(lons, lats, task['map'], task['dpi'])
+    for season in seasons:
+        ofile = task['outputs'][season]
+        os.makedirs(os.path.dirname(ofile) or '.', exist_ok=True)
+        label = task['label'].format(model=task['model'], name=task['name'], field=task['field'], season=season)
+        tmpl.render(var, season=season, field=task['field'], diff=task['diff'], label=label)
+        tmpl.save(ofile, formats=task['formats'])
+    return(task['model'], task['name'], len(seasons))
+
+###
+
+def default_workers():
+    """
+    Number of cores available to this job (respects SLURM/cgroup CPU limits)
+    """
+    try:
+        return(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return(os.cpu_count() or 1)
+
+def run_atlas(spec, workers=None, force=False, dry_run=False):
+    """
+    Render every panel in an atlas spec across a process pool
+
+    Parameters
+    ----------
+    spec : spec dict (see load_spec) or path to a json spec
+    workers : number of processes (default: all cores available to the job)
+    force : redraw panels even if they are up to date
+    dry_run : only list the panels that would be drawn
+
+    Returns
+    -------
+    number of panels drawn, list of (model, name, error) for the tasks that failed
+    """
+    if isinstance(spec, str):
+        spec = load_spec(spec)
+    tasks = atlas_tasks(spec)
+    if dry_run:
+        todo = [(t['model'], t['name'], s) for t in tasks for s, ofile in t['outputs'].items()
+                if force or not is_up_to_date(ofile, t['formats'], t['inputs'])]
+        for panel in todo:
+            print(*panel)
+        return(len(todo), [])
+
+    workers = min(workers or default_workers(), max(len(tasks), 1))
+    n_drawn, failed = 0, []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(render_task, task, force): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                n_drawn += future.result()[2]
+            except Exception as err:
+                failed.append((task['model'], task['name'], repr(err)))
+                print(f"FAILED {task['model']} {task['name']}: {err!r}", file=sys.stderr)
+    print(f'{n_drawn} panels drawn from {len(tasks)} tasks on {workers} workers '
+          f'in {time.perf_counter()-start:.1f} s ({len(failed)} failed)')
+    return(n_drawn, failed)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a map atlas from a json spec')
+    parser.add_argument('spec', help='json atlas spec')
+    parser.add_argument('-n', '--workers', type=int, default=None, help='number of processes (default: all available cores)')
+    parser.add_argument('-f', '--force', action='store_true', help='redraw panels that are already up to date')
+    parser.add_argument('--dry-run', action='store_true', help='list the panels that would be drawn')
+    args = parser.parse_args(argv)
+    n_drawn, failed = run_atlas(args.spec, workers=args.workers, force=args.force, dry_run=args.dry_run)
+    return(1 if failed else 0)
+
+if __name__ == '__main__':
+    sys.exit(main())
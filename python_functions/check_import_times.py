@@ -0,0 +1,83 @@
+import sys
+sys.dont_write_bytecode = True
+
+import os
+import subprocess
+import time
+
+#############################
+# Import-time budget for each module
+#   - every module is imported in a fresh interpreter (a cold start, like a new SLURM array task)
+#   - the time includes the interpreter itself, numpy & xarray; heavy plotting/scipy libraries
+#     should only load when a function that needs them is called
+#   - usage: python check_import_times.py [module ...]   (exits with 1 if any module is over budget)
+#############################
+
+# seconds per cold import (numpy + xarray alone take ~0.5-0.8 s depending on the node)
+#   - plot_tools is not listed since it needs misc_functions, which isn't in this folder
+IMPORT_BUDGET = {'lazy_imports': 0.2,
+                 'regrid_funcs': 1.5,
+                 'data_funcs': 1.5,
+                 'stats_funcs': 1.5,
+                 'region_funcs': 1.5,
+                 'point_funcs': 1.5,
+                 'colorbar_funcs': 1.5,
+                 'diagnostic_funcs': 1.5,
+                 'line_plot_tools': 1.5,
+                 'map_plot_tools': 1.5}
+
+# number of imports per module; the fastest is kept to reduce noise from the file system
+REPEATS = 3
+
+###
+
+def import_time(module, repeats=REPEATS):
+    """
+    Fastest wall-clock time [s] to import a module in a fresh interpreter
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f'import {module}'], cwd=here, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return(min(times))
+
+def check_imports(modules=None):
+    """
+    Time the cold import of each module against its budget
+
+    Parameters
+    ----------
+    modules : list of module names (default: all modules in IMPORT_BUDGET)
+
+    Returns
+    -------
+    dict of module -> (import time [s], budget [s])
+    """
+    modules = modules or list(IMPORT_BUDGET)
+    results = {}
+    for module in modules:
+        try:
+            results[module] = (import_time(module), IMPORT_BUDGET.get(module, 1.5))
+        except subprocess.CalledProcessError:
+            results[module] = (float('nan'), IMPORT_BUDGET.get(module, 1.5))
+    return(results)
+
+###
+
+if __name__ == '__main__':
+    results = check_imports(sys.argv[1:])
+    over = False
+    for module, (t, budget) in results.items():
+        if t != t:
+            status = 'FAILED'
+            over = True
+        elif t > budget:
+            status = 'OVER'
+            over = True
+        else:
+            status = 'ok'
+        print(f'{module:<18} {t:6.2f} s  (budget {budget:.2f} s)  {status}')
+    sys.exit(1 if over else 0)
@@ -1,15 +1,19 @@
 import sys
 sys.dont_write_bytecode = True
 
+import os
+import json
 import xarray as xr
 import numpy as np
+from functools import lru_cache
 
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-from matplotlib import cm
-import matplotlib.colors as mcolors
-from matplotlib.colors import ListedColormap,LinearSegmentedColormap
-import cmocean
+from lazy_imports import lazy_import
+
+# plotting libraries are imported on first use
+mpl = lazy_import('matplotlib')
+cm = lazy_import('matplotlib.cm')
+mcolors = lazy_import('matplotlib.colors')
+cmocean = lazy_import('cmocean')
 
 
 ###
@@ -20,7 +24,7 @@ def clip_cmap(cmap, l_bnd, u_bnd):
     - be cautious when applying to divergent colormaps if clipping unequally from both ends
     """
     cmap_full = cmap
-    cmap_clip = ListedColormap(cmap_full(np.linspace(l_bnd, u_bnd)))
+    cmap_clip = mcolors.ListedColormap(cmap_full(np.linspace(l_bnd, u_bnd)))
     return(cmap_clip)
 
 ###
@@ -74,298 +78,112 @@ def combine_cmaps_white_center(cmap_low, cmap_up, range_low=[0,1], range_up=[0,1
 
 ###
 
-def get_settings(field=None, diff=False):
+# plot settings for each field, keyed by canonical name, and alias -> canonical name lookup
+FIELD_SETTINGS = {}
+_ALIASES = {}
+
+# default settings shipped with the functions; set FIELD_SETTINGS_FILE to add or override fields
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'field_settings.json')
+
+###
+
+def register_field(name, field, diff, aliases=()):
     """
-    Determines bounds, levels, and colormap for various climate model fields
+    Add (or replace) the plot settings for a field
+
+    Parameters
+    ----------
+    name : canonical field name
+    field, diff : dicts of cmap, vmin, vmax, lvls for the field itself and for differences
+                  (cmap can be any spec accepted by build_cmap, see field_settings.json)
+    aliases : other names that map to this field
     """
-    ################################
-    #   +++ ATMOSPHERIC VARS +++   
-    #### 
-    if field in ['prec', 'precip', 'precipiation']:
-        if diff==False:
-            cmap=cm.Blues
-            vmin=0
-            vmax=10
-            lvls=21
-        if diff==True:
-            cmap=combine_cmaps(cm.BrBG, cm.Blues, range_low=[0,.5], range_up=[0,.95], n_low=128, n_up=128)
-            vmin=-6
-            vmax=6
-            lvls=25
+    FIELD_SETTINGS[name] = {'field': dict(field), 'diff': dict(diff)}
+    for alias in [name, *aliases]:
+        _ALIASES[alias] = name
 
-    if field in ['ts', 'tsurf', 't', 'temp', 'temperature']:
-        if diff==False:
-            cmap=cm.RdYlBu_r
-            vmin=-30
-            vmax=30
-            lvls=21
-        if diff==True:
-            cmap=cm.RdBu_r
-            vmin=-10
-            vmax=10
-            lvls=21
+def load_settings(path):
+    """
+    Register every field in a json settings file (same layout as field_settings.json)
+        - fields already registered under the same name or alias are overridden
+    """
+    with open(path) as f:
+        settings = json.load(f)
+    for name, entry in settings.items():
+        if name.startswith('_'):
+            continue
+        register_field(name, entry['field'], entry['diff'], entry.get('aliases', ()))
 
-    if field in ['u', 'U', 'uwind', 'usurf', 'v', 'V', 'vwind', 'vsurf']:
-        if diff==False:
-            cmap=combine_cmaps(cm.YlOrBr_r, cm.BuPu, range_low=[0,1], range_up=[0,1], n_low=128, n_up=128)
-            vmin=-10
-            vmax=10
-            lvls=21
-        if diff==True:
-            cmap=cm.RdBu_r
-            vmin=-5
-            vmax=5
-            lvls=11
-    
-    if field in ['sfc_wind_speed', 'sfcWind', 'sfcwind', 'sfc_wind', 'wsurf']:
-        if diff==False:
-            cmap=cmocean.cm.matter_r
-            vmin=0
-            vmax=10
-            lvls=21
-        if diff==True:
-            cmap=cm.RdBu
-            vmin=-5
-            vmax=5
-            lvls=21
+###
 
-    if field in ['wind', 'windSpd', 'windspeed', 'windSpeed']:
-        if diff==False:
-            cmap=cmocean.cm.matter_r
-            vmin=5
-            vmax=45
-            lvls=21
-        if diff==True:
-            cmap=cm.RdBu
-            vmin=-10
-            vmax=10
-            lvls=21
-    
-    if field in ['mfc', 'moist_flux_convergence', 'mfcvg', 'mf_cvg', 'vimfc']:
-        if diff==False:
-            cmap=combine_cmaps(cm.YlOrBr_r, cmocean.cm.tempo, range_low=[0,1], range_up=[0,1], n_low=128, n_up=128) 
-            vmin=-0.00006
-            vmax=0.00006
-            lvls=25
-        if diff==True:
-            cmap=combine_cmaps(cm.YlOrBr_r, cmocean.cm.tempo, range_low=[0,1], range_up=[0,1], n_low=128, n_up=128)
-            vmin=-0.00004
-            vmax=0.00004
-            lvls=17
-    
-    if field in ['rh', 'rel_hum', 'relative_humidity']:
-        if diff==False:
-            cmap=clip_cmap(cmocean.cm.delta_r, 0.5, 1.0)
-            vmin=0
-            vmax=100
-            lvls=21
-        if diff==True:
-            cmap=combine_cmaps(cm.BrBG, cm.Blues, range_low=[0,.5], range_up=[0,.95], n_low=128, n_up=128)
-            vmin=-50
-            vmax=50
-            lvls=21
-    
-    if field in ['qv', 'q', 'Q', 'QV', 'specific_humidity']:
-        if diff==False:
-            cmap=clip_cmap(cmocean.cm.delta_r, 0.5, 1.0)
-            vmin=0
-            vmax=0.1
-            lvls=21
-        if diff==True:
-            cmap=combine_cmaps_white_center(cm.BrBG, cmocean.cm.delta_r, range_low=[0,0.5], range_up=[0.51,1.0], n_low=128, n_up=128, n_white=3)
-            vmin=-0.015
-            vmax=0.015
-            lvls=31
-    
-    if field in ['cvg', 'convergence']:
-        if diff==False:
-            cmap=cm.RdBu
-            vmin=-5e-05
-            vmax=5e-05
-            lvls=21
-        if diff==True:
-            cmap=cm.RdBu
-            vmin=-5e-06
-            vmax=5e-06
-            lvls=21
-    
-    if field in ['div', 'dvg', 'divergence']:
-        if diff==False:
-            cmap=cm.RdBu_r
-            vmin=-5e-05
-            vmax=5e-05
-            lvls=21
-        if diff==True:
-            cmap=cm.RdBu_r
-            vmin=-5e-05
-            vmax=5e-05
-            lvls=21
-    
-    if field in ['omega', 'w']:
-        if diff==False:
-            cmap=cmocean.cm.curl
-            vmin=-0.1
-            vmax=0.1
-            lvls=21
-        if diff==True:
-            cmap=cmocean.cm.curl
-            vmin=-0.05
-            vmax=0.05
-            lvls=21
-    
-    if field in ['lh_flux', 'lhflx', 'LH', 'lhf']:
-        if diff==False:
-            cmap=cmocean.cm.amp
-            vmin=0
-            vmax=300
-            lvls=16
-        if diff==True:
-            cmap=cm.RdBu_r
-            vmin=-50
-            vmax=50
-            lvls=21
-    
-    if field in ['sh_flux', 'shflx', 'SH', 'shf']:
-        if diff==False:
-            cmap=cm.RdBu_r
-            vmin=-100
-            vmax=100
-            lvls=21
-        if diff==True:
-            cmap=cm.RdBu_r
-            vmin=-20
-            vmax=20
-            lvls=21
-    
-    if field in ['cloud', 'cloud_frac', 'fcloud', 'pcldl', 'pcldm', 'pcldh', 'pcldt']:
-        if diff==False:
-            cmap=cmocean.cm.ice
-            vmin=0
-            vmax=100
-            lvls=21
-        if diff==True:
-            cmap=cmocean.cm.diff_r
-            vmin=-20
-            vmax=20
-            lvls=21
-    
-    if field in ['sw_flux', 'sw_toa', 'swcrf']:
-        if diff==False:
-            cmap=cmocean.cm.thermal_r
-            vmin=-100
-            vmax=0
-            lvls=21
-        if diff==True:
-            cmap=combine_cmaps(cmocean.cm.gray, cmocean.cm.amp, range_low=[.1,.95], range_up=[0,.95], n_low=128, n_up=128)
-            vmin=-50
-            vmax=50
-            lvls=21
-    
-    if field in ['lw_flux', 'lw_toa', 'lwcrf']:
-        if diff==False:
-            cmap=cmocean.cm.thermal
-            vmin=0
-            vmax=100
-            lvls=21
-        if diff==True:
-            cmap=combine_cmaps(cm.bone, cmocean.cm.amp, range_low=[.1,.95], range_up=[0,.95], n_low=128, n_up=128)
-            vmin=-50
-            vmax=50
-            lvls=21
+def _named_cmap(name):
+    """
+    Look up a matplotlib ('Blues') or cmocean ('cmocean.matter_r') colormap by name
+    """
+    if name.startswith('cmocean.'):
+        return(getattr(cmocean.cm, name.split('.', 1)[1]))
+    return(mpl.colormaps[name])
+
+@lru_cache(maxsize=256)
+def _build_cmap(key):
+    spec = json.loads(key)
+    if isinstance(spec, str):
+        return(_named_cmap(spec))
+    kw = {k: spec[k] for k in ['range_low', 'range_up', 'n_low', 'n_up', 'n_white'] if k in spec}
+    if 'clip' in spec:
+        return(clip_cmap(build_cmap(spec['clip']), *spec['range']))
+    if 'combine' in spec:
+        low, up = spec['combine']
+        return(combine_cmaps(build_cmap(low), build_cmap(up), **kw))
+    if 'white_center' in spec:
+        low, up = spec['white_center']
+        return(combine_cmaps_white_center(build_cmap(low), build_cmap(up), **kw))
+    raise ValueError(f'unknown colormap spec {spec}')
+
+def build_cmap(spec):
+    """
+    Colormap from a spec, built once per distinct spec and cached
+        - 'Blues' / 'cmocean.matter_r'
+        - {'clip': spec, 'range': [l_bnd, u_bnd]}  (see clip_cmap)
+        - {'combine': [spec_low, spec_up], 'range_low': ..., 'range_up': ..., 'n_low': ..., 'n_up': ...}  (see combine_cmaps)
+        - {'white_center': [spec_low, spec_up], ..., 'n_white': ...}  (see combine_cmaps_white_center)
+    The cached colormaps are shared between calls, so copy one before changing it (e.g. set_bad)
+    """
+    # the canonical json string of the spec is the cache key
+    return(_build_cmap(json.dumps(spec, sort_keys=True)))
 
-    if field in ['slp', 'pressure']:
-        if diff==False:
-            cmap=cm.RdBu
-            vmin=975
-            vmax=1025
-            lvls=11
-        if diff==True:
-            cmap=cm.RdBu
-            vmin=-10
-            vmax=10
-            lvls=11
-    
-    if field in ['z200', 'z700', 'z_200', 'z_700', 'stationary_wave']:
-        if diff==False:
-            cmap=cm.seismic
-            vmin=-150
-            vmax=150
-            lvls=31
-        if diff==True:
-            cmap=cm.seismic
-            vmin=-30
-            vmax=30
-            lvls=21
-    
-    ##########################
-    #   +++ OCEAN VARS +++   
-    ####                        
-    if field in ['sst', 'SST', 'sea_surface_temperature', 'sea_surface_temp']:
-        if diff==False:
-            cmap=cm.RdYlBu_r
-            vmin=-5
-            vmax=30
-            lvls=36
-        if diff==True:
-            cmap=cm.RdBu_r
-            vmin=-10
-            vmax=10
-            lvls=21
-    
-    if field in ['ice', 'seaice', 'seaIce', 'oicefr']:
-        if diff==False:
-            cmap=cmocean.cm.ice
-            vmin=0
-            vmax=100
-            lvls=26
-        if diff==True:
-            cmap=cm.RdBu
-            vmin=-50
-            vmax=50
-            lvls=26
-    
-    if field in ['ocean_streamfunction', 'sf_Atl', 'sf_atl', 'sf_pac', 'sf_ind', 'sf_Pac', 'sf_Ind', 'sf_ocn']:
-        if diff==False:
-            cmap=cm.YlGnBu
-            vmin=-10
-            vmax=30
-            lvls=21
-        if diff==True:
-            cmap=cmocean.cm.delta_r
-            vmin=-20
-            vmax=20
-            lvls=21
+@lru_cache(maxsize=256)
+def get_norm(vmin, vmax, lvls, ncolors):
+    """
+    BoundaryNorm for lvls evenly spaced levels from vmin to vmax, cached
+    """
+    levels = np.linspace(vmin, vmax, lvls)
+    return(mcolors.BoundaryNorm(levels, ncolors))
 
-    ##########################
-    #   +++ OTHER VARS +++   
-    #### 
-    if field in ['topo_real', 'topo', 'topography', 'surface_height', 'zatmo', 'zsurf']:
-        if diff==False:
-            cmap=clip_cmap(cmocean.cm.topo, 0.5, 1.0)
-            vmin=0
-            vmax=5000
-            lvls=26
-        if diff==True:
-            cmap=combine_cmaps(cm.twilight_shifted, cm.afmhot_r, range_low=[0,0.5], range_up=[0,1.0], n_low=128, n_up=128)
-            vmin=-2000
-            vmax=2000
-            lvls=21
+###
 
-    if field in ['bathymetry', 'bathy', 'depth']:
-        if diff==False:
-            cmap=cmocean.cm.deep_r
-            vmin=-4000
-            vmax=0
-            lvls=21
-        if diff==True:
-            cmap=cmocean.cm.diff
-            vmin=-1000
-            vmax=1000
-            lvls=21
-    
-    # save output
-    levels = np.linspace(vmin, vmax, lvls)
-    norm = mpl.colors.BoundaryNorm(levels, cmap.N)
-    cf = mpl.cm.ScalarMappable(norm=norm, cmap=cmap)
+def get_settings(field=None, diff=False):
+    """
+    Determines bounds, levels, and colormap for various climate model fields
+        - fields and their aliases are looked up in FIELD_SETTINGS (field_settings.json + load_settings)
+        - colormaps and norms are built once and reused, so repeated calls (e.g. atlas panels) are cheap
+
+    Returns
+    -------
+    cmap, vmin, vmax, cf (ScalarMappable for the colorbar)
+    """
+    if field not in _ALIASES:
+        raise ValueError(f"no plot settings for field '{field}'; add them with register_field or load_settings")
+    settings = FIELD_SETTINGS[_ALIASES[field]]['diff' if diff else 'field']
+    cmap = build_cmap(settings['cmap'])
+    vmin = settings['vmin']
+    vmax = settings['vmax']
+    norm = get_norm(vmin, vmax, settings['lvls'], cmap.N)
+    cf = cm.ScalarMappable(norm=norm, cmap=cmap)
     return(cmap, vmin, vmax, cf)
-    
\ No newline at end of file
+
+###
+
+load_settings(SETTINGS_FILE)
+if os.environ.get('FIELD_SETTINGS_FILE'):
+    load_settings(os.environ['FIELD_SETTINGS_FILE'])
@@ -1,24 +1,104 @@
 import os
 import sys
 import xarray as xr
-import netCDF4 as nc
 import numpy as np
-import cf-xarray
-import metpy.calc as mp
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+from regrid_funcs import regrid, get_weights, apply_weights, cell_bounds, grid_fingerprint
+
+# only needed when writing to a Zarr store
+dask_array = lazy_import('dask.array')
 
 
 #############################
 
+# coordinate names, attributes & units that identify the longitude (X) and latitude (Y) axes
+COORD_ALIASES = {
+    'X': ['lon', 'longitude', 'nav_lon', 'x', 'grid_xt', 'xlon', 'glamt'],
+    'Y': ['lat', 'latitude', 'nav_lat', 'y', 'grid_yt', 'xlat', 'gphit'],
+}
+COORD_STANDARD_NAMES = {'X': ['longitude', 'grid_longitude'], 'Y': ['latitude', 'grid_latitude']}
+COORD_UNITS = {
+    'X': ['degrees_east', 'degree_east', 'degrees_e', 'degree_e', 'degreese', 'degreee'],
+    'Y': ['degrees_north', 'degree_north', 'degrees_n', 'degree_n', 'degreesn', 'degreen'],
+}
+
+# coordinate name found for each (coordinate set signature, axis)
+_COORD_NAMES = {}
+
+def _find_coord_name(var, axis):
+    """
+    Search the coordinates of var for the X or Y axis: CF 'axis' attribute, then standard_name,
+    then units, then common names; 1D (dimension) coordinates are preferred over 2D ones
+    """
+    coords = sorted(var.coords.values(), key=lambda c: (c.ndim != 1, c.name not in var.dims))
+    tests = [lambda c: str(c.attrs.get('axis', '')).upper() == axis,
+             lambda c: c.attrs.get('standard_name') in COORD_STANDARD_NAMES[axis],
+             lambda c: str(c.attrs.get('units', '')).lower() in COORD_UNITS[axis],
+             lambda c: str(c.name).lower() in COORD_ALIASES[axis]]
+    for test in tests:
+        for c in coords:
+            if test(c):
+                return c.name
+    # dimensions without coordinate variables
+    for d in var.dims:
+        if str(d).lower() in COORD_ALIASES[axis]:
+            return d
+    return None
+
+def get_coord(var, axis):
+    """
+    Get the longitude ('X') or latitude ('Y') coordinate without knowing its name
+        - uses CF attributes (axis, standard_name, units) and common coordinate names
+        - the result is memoized per set of coordinate names/attributes, so repeated calls on data with
+          the same layout only cost a dictionary lookup
+
+    Parameters
+    ----------
+    var : xr.DataArray or xr.Dataset
+    axis : 'X' or 'Y'
+    """
+    # signature from the lightweight coordinate Variables (no DataArrays are built)
+    signature = (axis,) + tuple((name, c.dims, c.attrs.get('axis'), c.attrs.get('standard_name'), c.attrs.get('units'))
+                                for name, c in var.coords.variables.items()) + tuple(var.dims)
+    if signature not in _COORD_NAMES:
+        _COORD_NAMES[signature] = _find_coord_name(var, axis)
+    name = _COORD_NAMES[signature]
+    if name is None:
+        raise ValueError(f'could not find the {axis} coordinate of {var.name if isinstance(var, xr.DataArray) else "dataset"}')
+    return var[name]
+
 def get_xy_coords(var):
     """
     Get lon and lat arrays without knowing coordinate names
+        - works for both DataArrays and Datasets
     """
-    if isinstance(var, xr.DataArray):
-        x,y=var.metpy.coordinates('x','y')
-        return(x,y)
-    if isinstance(var, xr.Dataset):
-        print('This is a dataset. Please use an xarray DataArray')
+    x=get_coord(var, 'X')
+    y=get_coord(var, 'Y')
+    return(x,y)
+
+def match_lat_lon_names(ds):
+    """
+    Rename common latitude/longitude aliases ('y', 'latitude', 'nav_lat', ...) to 'lat' and 'lon'
+    """
+    for lat_name in ['y', 'latitude', 'nav_lat']:
+        if (lat_name in ds.coords) and ('lat' not in ds.coords):
+            ds=ds.rename({lat_name: 'lat'})
+    for lon_name in ['x', 'longitude', 'nav_lon']:
+        if (lon_name in ds.coords) and ('lon' not in ds.coords):
+            ds=ds.rename({lon_name: 'lon'})
+    return ds
+
+def drop_all_bounds(ds):
+    """
+    Drop all coordinate bounds variables (e.g. lat_bnds, time_bounds)
+    """
+    drop_vars = [vname for vname in ds.coords
+                 if (('_bounds') in vname) or (('_bnds') in vname)]
+    return ds.drop_vars(drop_vars)
 
 def get_season(season='ann'):
     """
@@ -45,34 +125,186 @@ def get_season(season='ann'):
         pass
     return mons
 
-def lonFlip(var):
+# days in each month of the year for the CF calendars (February is averaged over the leap cycle)
+DAYS_PER_MONTH = {
+    'standard':            [31, 28.2425, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'gregorian':           [31, 28.2425, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'proleptic_gregorian': [31, 28.2425, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'julian':              [31, 28.25, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'noleap':              [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    '365_day':             [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'all_leap':            [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    '366_day':             [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    '360_day':             [30]*12,
+}
+
+@lru_cache(maxsize=None)
+def _season_weight_matrix(seasons, calendar=None):
+    """
+    [season x month] averaging weights, built once per (seasons, calendar) combination
+    """
+    wgts = np.zeros((len(seasons), 12))
+    for i, seas in enumerate(seasons):
+        wgts[i, get_season(seas)] = 1.
+    if calendar is not None:
+        # weight each month by its length
+        wgts = wgts*np.asarray(DAYS_PER_MONTH[calendar])
+    wgts = wgts/wgts.sum(axis=1, keepdims=True)
+    wgts.flags.writeable = False
+    return(wgts)
+
+def season_weights(seasons=['DJF','MAM','JJA','SON','ANN'], calendar=None, month=None):
+    """
+    Weights to average a monthly climatology over one or more seasons
+        - rows sum to 1; with a calendar, months are weighted by their number of days
+
+    Parameters
+    ----------
+    seasons : season name or list of season names understood by get_season
+    calendar : None for equal month weights, or a CF calendar name ('standard', 'noleap', '360_day', ...)
+    month : optional month coordinate values to attach (to align with the data)
+    """
+    if isinstance(seasons, str):
+        seasons = [seasons]
+    wgts = _season_weight_matrix(tuple(seasons), calendar)
+    coords = {'season': list(seasons)}
+    if month is not None:
+        coords['month'] = np.asarray(month)
+    return(xr.DataArray(wgts, dims=['season','month'], coords=coords))
+
+def seasonal_climatology(var, seasons=['DJF','MAM','JJA','SON','ANN'], calendar=None):
+    """
+    Average a monthly climatology over several seasons in a single reduction
+        - replaces calling var[get_season(season)].mean(dim='month') once per season
+        - returns the data with a 'season' dimension in place of 'month'
+        - if seasons is a single string, the 'season' dimension is dropped
+        - data that already has a 'season' dimension (e.g. a precomputed atlas climatology) is just indexed
+        - missing months are skipped: a season is NaN only where all of its months are missing
+
+    Parameters
+    ----------
+    var : xr.DataArray or xr.Dataset with a 12-step 'month' dimension
+    seasons : season name or list of season names understood by get_season
+    calendar : None for equal month weights, or a CF calendar name to weight months by their length
+    """
+    if ('month' not in var.dims) and ('season' in var.dims):
+        return(var.sel(season=seasons))
+    month = var['month'].values if 'month' in var.coords else None
+    wgts = season_weights(seasons, calendar=calendar, month=month)
+    # weights are renormalized over the months with data, so missing months are skipped (as with .mean('month'))
+    def _average(da):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return(xr.dot(da.fillna(0), wgts, dim='month')/xr.dot(da.notnull(), wgts, dim='month'))
+    if isinstance(var, xr.Dataset):
+        clim = var.map(lambda da: _average(da) if 'month' in da.dims else da, keep_attrs=True)
+    else:
+        clim = _average(var)
+        clim.attrs = var.attrs
+        clim.name = var.name
+    clim = clim.transpose('season', ...)
+    if isinstance(seasons, str):
+        clim = clim.squeeze('season', drop=True)
+    return(clim)
+
+def seasonal_wind(u, v, seasons=['DJF','MAM','JJA','SON','ANN'], calendar=None):
+    """
+    Seasonal means of the u & v wind components and of the wind speed in a single reduction
+        - u, v and the monthly speed are stacked and averaged with one seasonal_climatology call
+        - 'speed' is the mean of the monthly speeds (not the speed of the mean wind)
+
+    Parameters
+    ----------
+    u, v : DataArrays of the wind components with a 12-step 'month' dimension
+    seasons : season name or list of season names understood by get_season (None: no averaging)
+    calendar : None for equal month weights, or a CF calendar name (see seasonal_climatology)
+
+    Returns
+    -------
+    Dataset with 'u', 'v' & 'speed'
+    """
+    speed = np.hypot(u, v)
+    speed.attrs = {'long_name': 'wind speed', 'units': u.attrs.get('units', 'm/s')}
+    wind = xr.concat([u, v, speed], dim='component', coords='minimal', compat='override', join='override')
+    if seasons is not None:
+        wind = seasonal_climatology(wind, seasons, calendar=calendar)
+    ds = xr.Dataset({'u': wind.isel(component=0, drop=True).assign_attrs(u.attrs),
+                     'v': wind.isel(component=1, drop=True).assign_attrs(v.attrs),
+                     'speed': wind.isel(component=2, drop=True).assign_attrs(speed.attrs)})
+    return(ds)
+
+# longitude reordering for each (grid, target convention), keyed by grid fingerprint
+_LON_FLIPS = {}
+
+def lon_flip_index(lon, target=None):
+    """
+    New longitude values and the index that reorders the data into them, for a change of convention
+        - computed once per (longitude coordinate, target convention) and cached
+        - works for global and clipped (regional) longitude ranges
+        - a regional subset that straddles the seam of the target convention keeps a contiguous,
+          monotonic longitude axis (e.g. 170:190 instead of being split into 170:180 and -180:-170)
+
+    Parameters
+    ----------
+    lon : longitude coordinate values
+    target : '0:360', '-180:180', or None to switch to the opposite of the current convention
+
+    Returns
+    -------
+    new_lon : sorted longitude values in the target convention
+    index : integer positions of the original longitudes in the new order (None if no reordering is needed)
+    target : the target convention
+    """
+    lon = np.asarray(lon, dtype='float64')
+    if target is None:
+        target = '0:360' if lon.min() < 0 else '-180:180'
+    key = grid_fingerprint(lon, tag=target)
+    if key not in _LON_FLIPS:
+        lo = 0. if target == '0:360' else -180.
+        new_lon = (lon - lo) % 360. + lo
+        index = np.argsort(new_lon, kind='stable')
+        new_lon = new_lon[index]
+        if new_lon.size > 1:
+            gaps = np.diff(new_lon)
+            k = np.argmax(gaps)
+            # a gap only splits the data if it is clearly wider than the gap across the seam
+            # (float noise on global grids, e.g. float32 0.1° IMERG, must not trigger the unwrap)
+            if gaps[k] > new_lon[0] + 360. - new_lon[-1] + 0.5*np.median(gaps):
+                # the data are split by the seam: start after the largest gap and unwrap past the seam
+                index = np.roll(index, -(k+1))
+                new_lon = np.concatenate([new_lon[k+1:], new_lon[:k+1] + 360.])
+        if np.array_equal(index, np.arange(lon.size)):
+            index = None
+        _LON_FLIPS[key] = (new_lon, index)
+    new_lon, index = _LON_FLIPS[key]
+    return new_lon, index, target
+
+def lonFlip(var, target=None):
     """
     Convert longitude values from the -180:180 to 0:360 convention or vice versa.
 
-    ** Works for both global data due to auto-detection of longitude convention **
-    More efficient than rolling: only relabels coordinates + sorts.
+    ** Works for both global and clipped data due to auto-detection of longitude convention **
+    Only relabels coordinates + applies a cached integer index along longitude, so:
+        - dask-backed data stay lazy (the reorder happens when chunks are computed)
+        - data opened from netCDF/Zarr without dask stay lazily indexed until they are read
+        - no sort is done, and data that are already in order are not copied at all
 
     Parameters
     ----------
     var : xr.DataArray or xr.Dataset
+    target : '0:360', '-180:180', or None to switch to the opposite of the current convention
     """
 
     #=== Get var info
-    lon_name=var.cf.axes["X"][0]    # find longitude axis and store coordinate name
-    lon=var[lon_name]               # extract lon array
-
-    #=== Detect current longitude convention and wrap values
-    if lon.min() < 0:
-        # -180:180 -> 0:360
-        new_lon = lon % 360
-        target_range = "0:360"
-    else:
-        # 0:360 -> -180:180
-        new_lon = ((lon + 180) % 360) - 180
-        target_range = "-180:180"
+    lon=get_coord(var, 'X')         # find longitude axis
+    lon_name=lon.name               # store coordinate name
+
+    #=== Find the new longitudes and the index that puts the data in order
+    new_lon, index, target_range = lon_flip_index(lon.values, target=target)
 
-    #=== Assign and sort
-    var = var.assign_coords({lon_name: new_lon}).sortby(lon_name)
+    #=== Reorder (lazily) and relabel
+    if index is not None:
+        var = var.isel({lon_name: index})
+    var = var.assign_coords({lon_name: lon.copy(data=new_lon.astype(lon.dtype))})
 
     #=== Add history
     timestamp = datetime.now().strftime("%B %d, %Y, %r")
@@ -88,10 +320,8 @@ def lonFlip(var):
 def longitude_flip(var):
     """
     Convert longitude values from the -180:180 to 0:360 convention or vice versa.
-        
-    ** Only works for global data. Do not apply to data with a clipped longitude range **
-    ** Is computationally expensive because it forces a particular layout of the data in memory **
-    ** Probably not optimal to use for most scenarios **
+
+    ** Now a thin wrapper around lonFlip: works for clipped longitude ranges and does not copy the data **
 
     Parameters
     ----------
@@ -99,89 +329,643 @@ def longitude_flip(var):
     """    
     # get var info
     x,_=get_xy_coords(var) # extract original longitude values
-    lon_name=x.name        # store name of longitude coordinate
-    nx=len(x)              # longitude resolution
-    
-    # determine longitude format and create an array of new lons in opposite convention
-    if min(x)<0: 
-        # if there are negative values, data is -180:180 and need to switch to 0:360
-        new_lons=np.linspace((min(x)+180), (max(x)+180), nx)
-    elif max(x)>180:
-        # if the max value is >180, data is in 0:360 format and need to switch to -180:180
-        new_lons=np.linspace((min(x)-180), (max(x)-180), nx)
-        
-    # shift the data by 180° of longitude
-    nshift=nx//2
-    var=var.roll({lon_name: nshift}, roll_coords=False)
-            
-    # update longitude coord with new values
-    var=var.assign_coords({lon_name: new_lons})
-    
+    original_lons=x.values
+
+    # reorder & relabel longitudes
+    var=lonFlip(var)
+
     # add attributes documenting change
     timestamp=datetime.now().strftime("%B %d, %Y, %r")
     var.attrs['history']=f'flipped longitudes {timestamp}'
-    var.attrs['original_lons']=x.values
+    var.attrs['original_lons']=original_lons
     
     return(var)
 
-def regrid_like(ref, var):
+# index slices of lat/lon boxes, keyed by grid + box fingerprint
+_BOX_SLICES = {}
+
+def box_slices(lat, lon, boundaries):
+    """
+    Integer index slices that select a lat/lon box on a grid, in whatever longitude convention the grid uses
+        - boxes that cross the grid's longitude seam (0° for 0:360 data, 180° for -180:180 data) become two
+          longitude slices, ordered west to east
+        - computed once per (grid, box) and cached
+
+    Parameters
+    ----------
+    lat, lon : 1D latitude & longitude coordinate values (monotonic)
+    boundaries : [lon_min, lon_max, lat_min, lat_max], the same order as the map 'boundaries' argument;
+                 longitudes can be given in either convention
+
+    Returns
+    -------
+    lat_slice : slice along latitude
+    lon_slices : list of one or two slices along longitude
+    """
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    key = grid_fingerprint(lat, lon, np.asarray(boundaries, dtype='float64'), tag='box')
+    if key not in _BOX_SLICES:
+        lon_min, lon_max, lat_min, lat_max = boundaries
+        # latitude: one contiguous run for increasing or decreasing latitudes
+        i_lat = np.flatnonzero((lat >= min(lat_min, lat_max)) & (lat <= max(lat_min, lat_max)))
+        if i_lat.size == 0:
+            raise ValueError(f'no latitudes between {lat_min} and {lat_max}')
+        lat_slice = slice(int(i_lat[0]), int(i_lat[-1])+1)
+        # longitude: distance east of the western edge, measured on a circle
+        span = (lon_max - lon_min) % 360.
+        if span == 0 and lon_max != lon_min:
+            span = 360.
+        i_lon = np.flatnonzero((lon - lon_min) % 360. <= span)
+        if i_lon.size == 0:
+            raise ValueError(f'no longitudes between {lon_min} and {lon_max}')
+        # split into runs of consecutive indices (two runs if the box crosses the seam)
+        breaks = np.flatnonzero(np.diff(i_lon) > 1) + 1
+        runs = [slice(int(r[0]), int(r[-1])+1) for r in np.split(i_lon, breaks)]
+        if len(runs) == 2 and runs[0].start == 0 and runs[1].stop == lon.size:
+            # the eastern part of the box sits at the start of the array
+            runs = [runs[1], runs[0]]
+        _BOX_SLICES[key] = (lat_slice, runs)
+    return _BOX_SLICES[key]
+
+def subset_box(var, boundaries):
+    """
+    Select a lat/lon box from data in any longitude convention, without a lonFlip first
+        - the selection is integer-index based, so data opened from netCDF/Zarr only read the requested
+          hyperslab (like ncks -d) and dask-backed data stay lazy
+        - boxes that cross the longitude seam are stitched from two index ranges; longitudes past the
+          seam are unwrapped (+360°) so the longitude axis stays contiguous and increasing
+
+    Parameters
+    ----------
+    var : xr.DataArray or xr.Dataset
+    boundaries : [lon_min, lon_max, lat_min, lat_max]
+    """
+    lon_name = get_coord(var, 'X').name
+    lat_name = get_coord(var, 'Y').name
+    lat_slice, lon_slices = box_slices(var[lat_name].values, var[lon_name].values, boundaries)
+    if len(lon_slices) == 1:
+        return var.isel({lat_name: lat_slice, lon_name: lon_slices[0]})
+    # one orthogonal index over both ranges: still a lazy read of two hyperslabs
+    index = np.concatenate([np.arange(s.start, s.stop) for s in lon_slices])
+    var = var.isel({lat_name: lat_slice, lon_name: index})
+    lon = var[lon_name]
+    new_lon = np.where(np.arange(lon.size) >= (lon_slices[0].stop - lon_slices[0].start), lon.values + 360., lon.values)
+    return var.assign_coords({lon_name: lon.copy(data=new_lon.astype(lon.dtype))})
+
+def regrid_like(ref, var, method='bilinear'):
     """
     Regrid data to match a reference 
-    ** Only works for global data **
+    ** Only works for regular lat/lon grids **
+    ** Weights are built once per (source grid, reference grid, method) and reused for every later call **
     
     Parameters
     ----------
     ref : reference array
     var : variable array to regrid
+    method : 'bilinear', 'conservative' (use for fluxes such as precipitation), or 'nearest'
     """ 
     x_ref,y_ref=get_xy_coords(ref) # lat lon coords from reference variable
-    x_var,_=get_xy_coords(var) # lat lon coords from variable to be regridded
-    
-    # if longitudes are referenced differently, flip lons of variable
-    if np.sign(min(x_ref)) != np.sign(min(x_var)):
-        var=longitude_flip(var)
-        x_var,y_var=get_xy_coords(var)
-    
-    # rename coordinates to match reference
-    var=var.rename({x_var.name:x_ref.name, y_var.name:y_ref.name})
+    x_var,y_var=get_xy_coords(var) # lat lon coords from variable to be regridded
     
-    # interpolate var data
-    var_regridded=var.interp_like(ref, method='linear')
+    # longitudes are treated as periodic by the weights, so no need to flip the longitude convention
+    var_regridded=regrid(var, y_var, x_var, y_ref, x_ref, method=method)
     return(var_regridded)
 
+def ensemble_on_grid(ds_dict, lat_out, lon_out, var=None, method='bilinear', workers=4, store=None):
+    """
+    Regrid a dictionary of model datasets onto one grid and assemble them along a 'source_id' dimension
+        - the output [source_id x ... x lat x lon] array is allocated once and each model is written into
+          its own slot, so time and memory grow linearly with the number of models (no repeated xr.concat)
+        - models are regridded in a pool of worker threads; weights are shared between models on the same grid
+        - with a Zarr store, each model is written to its own region of the store instead of held in memory
+
+    Parameters
+    ----------
+    ds_dict : dict of xr.Dataset/xr.DataArray keyed by model name (e.g. after match_lat_lon_names & drop_all_bounds)
+              all models must have 'lat' and 'lon' coordinates and the same other dimensions (e.g. 12 months)
+    lat_out, lon_out : target grid coordinates
+    var : variable to extract when the values of ds_dict are Datasets
+    method : regridding method ('bilinear', 'conservative', or 'nearest')
+    workers : number of worker threads
+    store : optional path or mapping of a Zarr store to write to; the opened (lazy) store is returned
+    """
+    lat_out = lat_out if isinstance(lat_out, xr.DataArray) else xr.DataArray(lat_out, dims=['lat'], name='lat')
+    lon_out = lon_out if isinstance(lon_out, xr.DataArray) else xr.DataArray(lon_out, dims=['lon'], name='lon')
+    keys = list(ds_dict.keys())
+
+    def _get(key):
+        da = ds_dict[key]
+        da = da[var] if (var is not None and isinstance(da, xr.Dataset)) else da
+        return drop_all_bounds(match_lat_lon_names(da))
+
+    # use the first model as a template for the non-spatial dimensions
+    first = _get(keys[0])
+    other_dims = [d for d in first.dims if d not in ['lat', 'lon']]
+    shape = (len(keys),) + tuple(first.sizes[d] for d in other_dims) + (lat_out.size, lon_out.size)
+    dims = ['source_id'] + other_dims + ['lat', 'lon']
+    coords = {'source_id': keys, 'lat': lat_out.values, 'lon': lon_out.values}
+    coords.update({d: first[d].values for d in other_dims if d in first.coords})
+    name = first.name if first.name is not None else var
+    dtype = np.result_type(first.dtype, np.float32)
+
+    if store is None:
+        out = np.full(shape, np.nan, dtype=dtype)
+    else:
+        # write the metadata and an empty array, then fill it one model (region) at a time
+        template = xr.DataArray(dask_array.full(shape, np.nan, dtype=dtype, chunks=(1,)+shape[1:]),
+                                dims=dims, coords=coords, name=name, attrs=first.attrs)
+        template.to_dataset().to_zarr(store, mode='w', compute=False)
+
+    def _fill(i):
+        da = _get(keys[i])
+        if [da.sizes[d] for d in other_dims] != list(shape[1:-2]):
+            raise ValueError(f'{keys[i]} does not have the same {other_dims} sizes as {keys[0]}')
+        weights = get_weights(da['lat'], da['lon'], lat_out, lon_out, method=method)
+        regridded = apply_weights(da.transpose(*other_dims, 'lat', 'lon'), weights, 'lat', 'lon', lat_out, lon_out)
+        if store is None:
+            out[i] = regridded.values
+        else:
+            regridded = regridded.expand_dims(source_id=[keys[i]]).drop_vars(['source_id', 'lat', 'lon'] + other_dims, errors='ignore')
+            regridded.to_dataset(name=name).to_zarr(store, region={'source_id': slice(i, i+1)})
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_fill, range(len(keys))))
+
+    if store is not None:
+        return(xr.open_zarr(store)[name])
+    ensemble = xr.DataArray(out, dims=dims, coords=coords, name=name, attrs=first.attrs)
+    return(ensemble)
+
+# mean radius of the Earth [m]
+EARTH_RADIUS = 6371000.
+
+# grid cell areas & normalized area weights (numpy arrays), keyed by grid fingerprint
+_AREAS = {}
+
+def _grid_areas(lat, lon=None, lat_bounds=None, lon_bounds=None):
+    """
+    (cell area, normalized area weights) pair for a grid
+        - the numpy arrays are cached per grid; the DataArrays are built on every call with the
+          caller's coordinate names (lat/lon, latitude/longitude, ...)
+    """
+    key = grid_fingerprint(*[c for c in (lat, lon, lat_bounds, lon_bounds) if c is not None], tag='area')
+    if key not in _AREAS:
+        if lat_bounds is None:
+            lat_edges = cell_bounds(lat, lat=True)
+            lat_lo, lat_hi = lat_edges[:-1], lat_edges[1:]
+        else:
+            lat_lo, lat_hi = np.asarray(lat_bounds, dtype='float64').T
+        band = np.abs(np.sin(np.deg2rad(lat_hi)) - np.sin(np.deg2rad(lat_lo)))
+        if lon is None:
+            area = EARTH_RADIUS**2 * 2*np.pi * band
+        else:
+            if lon_bounds is None:
+                dlon = np.abs(np.diff(cell_bounds(lon)))
+            else:
+                dlon = np.abs(np.diff(np.asarray(lon_bounds, dtype='float64'), axis=1))[:,0]
+            area = EARTH_RADIUS**2 * np.outer(band, np.deg2rad(dlon))
+        wgts = area/area.sum()
+        area.flags.writeable = False
+        wgts.flags.writeable = False
+        _AREAS[key] = (area, wgts)
+    area, wgts = _AREAS[key]
+    coords = {lat.name: np.asarray(lat)}
+    dims = [lat.name]
+    if lon is not None:
+        coords[lon.name] = np.asarray(lon)
+        dims.append(lon.name)
+    area = xr.DataArray(area, dims=dims, coords=coords, name='cell_area', attrs={'units': 'm2'})
+    wgts = xr.DataArray(wgts, dims=dims, coords=coords, name='cell_area')
+    return(area, wgts)
+
+def grid_cell_area(lat, lon=None, lat_bounds=None, lon_bounds=None):
+    """
+    Exact area of each grid cell on a sphere [m^2]: R^2 * dlon * (sin(lat_north) - sin(lat_south))
+        - cell edges are taken from the bounds if given, otherwise inferred from the cell centers
+        - without lon, returns the area of each full latitude band
+        - results are cached per grid, so repeated calls on the same grid cost nothing
+
+    Parameters
+    ----------
+    lat : latitude coordinate (DataArray)
+    lon : longitude coordinate (DataArray), optional
+    lat_bounds, lon_bounds : optional [n x 2] cell bounds (e.g. ds.lat_bnds)
+    """
+    return(_grid_areas(lat, lon, lat_bounds=lat_bounds, lon_bounds=lon_bounds)[0])
+
+def area_weights(lat, lon=None, lat_bounds=None, lon_bounds=None):
+    """
+    Grid cell area weights normalized to sum to 1 (cached per grid, see grid_cell_area)
+    """
+    return(_grid_areas(lat, lon, lat_bounds=lat_bounds, lon_bounds=lon_bounds)[1])
+
+def area_weighted_mean(var, lat, lon=None, skipna=True, lat_bounds=None, lon_bounds=None):
+    """
+    Area-weighted mean over the lat (and lon) dimensions as a dot product with precomputed weights
+
+    Parameters
+    ----------
+    var : DataArray with lat (and lon) dimensions, plus any others (time, month, level, ...)
+    lat, lon : latitude & longitude coordinates of var (DataArrays); omit lon for zonal mean data
+    skipna : if True, renormalize the weights over non-missing cells (e.g. land/ocean masked fields);
+             if False, the mean is a single dot product
+    lat_bounds, lon_bounds : optional cell bounds
+    """
+    wgts = area_weights(lat, lon, lat_bounds=lat_bounds, lon_bounds=lon_bounds)
+    dims = list(wgts.dims)
+    if skipna:
+        mean = xr.dot(var.fillna(0), wgts, dim=dims)/xr.dot(var.notnull(), wgts, dim=dims)
+    else:
+        mean = xr.dot(var, wgts, dim=dims)
+    mean.attrs = var.attrs
+    mean.name = var.name
+    return(mean)
+
 def latitude_weighted_mean(var):
     """
     Calculate the mean of geospatial data taking into account unequal grid cell area
+        - uses exact spherical cell areas (cached per grid) rather than cos(lat)
     """
     # get x and y coordinate data
     lons,lats = get_xy_coords(var)
-    # determine weight based on latitude value
-    weights = np.cos(np.deg2rad(lats))
-    weights.name = 'weights'
-    # calculate area-weighted values
-    weighted_var = var.weighted(weights)
-    # calculate global mean of weighted data
-    weighted_mean = weighted_var.mean(dim=[lats.name,lons.name], keep_attrs=True)
+    # calculate area-weighted mean
+    weighted_mean = area_weighted_mean(var, lats, lons)
     return(weighted_mean)
 
 def season_mean(ds, calendar='standard'):
 	seas_mean = ds.groupby('time.season').mean(dim='time') #sum(dim='time')
 	return seas_mean
 
-def annual_season_mean(ds): #, calendar='standard'):
-	ds_seasonal = {}
-	ann_seasonal_mean = {}
-	for season in ['DJF','MAM','JJA','SON']:
-		# extract data for season
-		ds_seasonal[season] = ds.where(ds['time.season'] == season)
-		# I'm not sure what this step is doing
-		if season == 'DJF':
-			ds_seasonal[season] = ds_seasonal[season].shift(time=1)
-		# get timeseries of seasonal mean climatologies
-		ann_seasonal_mean[season] = ds_seasonal[season].groupby('time.year').mean(dim='time') #sum(dim='time')
-		# but, cut first year of DJF timeseries as there is no Dec data from year -1
-		if season == 'DJF':
-			year_min = ann_seasonal_mean[season].year.min()+1
-			year_max = ann_seasonal_mean[season].year.max()
-			ann_seasonal_mean[season] = ann_seasonal_mean[season].sel(year=slice(year_min, year_max)) #.isel(year=slice(1,len(ann_seas_mean['DJF'].year)))
-	return ann_seasonal_mean
+def annual_season_mean(ds, seasons=['DJF','MAM','JJA','SON'], complete=True):
+    """
+    Time series of seasonal means for every year, for all seasons in a single pass over time
+        - one resample into Dec-Jan-Feb, Mar-Apr-May, Jun-Jul-Aug, Sep-Oct-Nov blocks
+        - DJF is labeled by the year of its January (Dec 1999 + Jan/Feb 2000 -> 2000)
+        - lazy on dask-backed data: nothing is computed until the result is loaded
+
+    Parameters
+    ----------
+    ds : monthly (or daily, ...) xr.DataArray or xr.Dataset with a 'time' dimension
+    seasons : seasons to return
+    complete : if True, drop seasons that are missing months (e.g. the first DJF of a record starting in January)
+
+    Returns
+    -------
+    dict of seasonal mean time series with a 'year' dimension, keyed by season
+    """
+    # 3-month blocks starting in December (DJF, MAM, JJA, SON)
+    ann_seasonal = ds.resample(time='QS-DEC').mean(dim='time')
+    # number of distinct months in each block, from the time coordinate only (works for daily or monthly data)
+    has_month = (ds['time'].resample(time='MS').count() > 0)
+    n_mons = has_month.resample(time='QS-DEC').sum().reindex(time=ann_seasonal['time'], fill_value=0).values
+    # label each block with its season and its (January-based) year
+    block_season = ann_seasonal['time.season'].values
+    block_year = ann_seasonal['time.year'].values + (ann_seasonal['time.month'].values == 12)
+
+    ann_seasonal_mean = {}
+    for season in seasons:
+        idx = (block_season == season)
+        if complete:
+            idx = idx & (n_mons == 3)
+        seas = ann_seasonal.isel(time=np.flatnonzero(idx))
+        seas = seas.assign_coords(year=('time', block_year[idx])).swap_dims({'time': 'year'}).drop_vars('time')
+        ann_seasonal_mean[season] = seas
+    return ann_seasonal_mean
+
+#############################
+# Streaming monthly means & monthly climatologies
+#   - one pass over daily (or monthly) data in one or many files, read one time slab at a time
+#   - replaces `cdo monmean` followed by twelve `ncra -F -d time,m,-1,12` calls
+#   - memory holds one slab, the month in progress, and 12 monthly sums & counts (plus the monthly means if kept)
+#############################
+
+def iter_time_chunks(sources, var=None, time_chunk=366, after=None):
+    """
+    Read one or more files (or open datasets) as a sequence of in-memory time slabs
+
+    Parameters
+    ----------
+    sources : file path, xr.Dataset/xr.DataArray, or a list of them in time order
+    var : variable to read from files/Datasets
+    time_chunk : number of time steps read at once
+    after : optional time; only later time steps are read (from the time coordinate, so earlier data isn't loaded)
+    """
+    if isinstance(sources, (str, os.PathLike, xr.Dataset, xr.DataArray)):
+        sources = [sources]
+    for src in sources:
+        ds = xr.open_dataset(src) if isinstance(src, (str, os.PathLike)) else src
+        try:
+            da = ds[var] if isinstance(ds, xr.Dataset) else ds
+            da = da.transpose('time', ...)
+            if after is not None:
+                da = da.isel(time=np.flatnonzero(da['time'].values > after))
+            for i in range(0, da.sizes['time'], time_chunk):
+                yield da.isel(time=slice(i, i+time_chunk)).load()
+        finally:
+            if isinstance(src, (str, os.PathLike)):
+                ds.close()
+
+def _month_start(t, year, month):
+    """
+    First day of a month, in the same datetime type & calendar as the time value t
+    """
+    if isinstance(t, np.datetime64):
+        return(np.datetime64(f'{year:04d}-{month:02d}-01', 'ns'))
+    return(type(t)(year, month, 1, calendar=t.calendar))
+
+def build_monthly_climatology(sources, var=None, time_chunk=366, calendar=None, keep_monthly=False,
+                              monthly_store=None, ofile=None, monthly_file=None):
+    """
+    Monthly means, the 12-month climatology and the mean annual cycle in a single pass over daily or monthly data
+        - each time slab is reduced to sums & valid counts per (year, month) with one numpy reduceat;
+          a month split across slabs or files is carried over to the next slab
+        - the climatology is the mean of the monthly means of each calendar month (like ncra over every 12th
+          record); missing values are skipped cell by cell
+        - the annual cycle is the climatology minus its annual mean (see seasonal_climatology)
+        - output has a 'month' dimension (1-12), the layout quick_map/custom_map/seasonal_climatology expect
+
+    Parameters
+    ----------
+    sources : file path, xr.Dataset/xr.DataArray, or a list of them in time order (e.g. sorted yearly files)
+    var : variable name (for files & Datasets)
+    time_chunk : number of time steps read at once (bounds the memory used)
+    calendar : calendar for the annual mean of the annual cycle (None for equal month weights)
+    keep_monthly : if True, also keep & return the monthly means in memory (1/30 of the size of daily input);
+                   off by default so memory stays bounded (see monthly_store / monthly_file to keep them)
+    monthly_store : optional Zarr store the monthly means are appended to, one year at a time, instead of kept
+    ofile : optional netCDF file for the climatology
+    monthly_file : optional netCDF file for the monthly means (implies keep_monthly)
+
+    Returns
+    -------
+    climatology Dataset (var, var_annual_cycle & n_years with a 'month' dimension),
+    monthly mean DataArray with a 'time' dimension of month starts (None unless keep_monthly, monthly_file
+    or monthly_store is set)
+    """
+    keep_monthly = keep_monthly or (monthly_file is not None)
+    clim_sum = clim_cnt = None
+    pending = None # [key, sum, count] of the month in progress
+    monthly, labels, batch = [], [], []
+    template, t0, first, last = None, None, None, None
+    name, dtype, stored = var or 'var', 'float64', False
+
+    def _finish(key, sums, cnts):
+        # mean of one month, added to the climatology & the monthly output
+        nonlocal clim_sum, clim_cnt
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(cnts > 0, sums/np.maximum(cnts, 1), np.nan)
+        m = key % 12
+        if clim_sum is None:
+            clim_sum = np.zeros((12,)+mean.shape)
+            clim_cnt = np.zeros((12,)+mean.shape, dtype='int32')
+        ok = cnts > 0
+        clim_sum[m] += np.where(ok, mean, 0.)
+        clim_cnt[m] += ok
+        label = _month_start(t0, key//12, m+1)
+        if monthly_store is not None:
+            batch.append((label, mean))
+            if len(batch) == 12:
+                _append(batch)
+        elif keep_monthly:
+            monthly.append(mean.astype(dtype))
+            labels.append(label)
+
+    def _append(months):
+        # write finished months to the Zarr store (the first write creates it)
+        nonlocal stored
+        da = _monthly_array([mean for _, mean in months], [label for label, _ in months])
+        da.to_dataset().to_zarr(monthly_store, **({'append_dim': 'time'} if stored else {'mode': 'w'}))
+        stored = True
+        months.clear()
+
+    def _monthly_array(means, times):
+        space = template.isel(time=0, drop=True)
+        da = xr.DataArray(np.stack(means).astype(dtype), dims=list(template.dims),
+                          coords={**space.coords, 'time': times}, attrs=space.attrs, name=name)
+        da.attrs['cell_methods'] = 'time: mean'
+        return(da)
+
+    for chunk in iter_time_chunks(sources, var, time_chunk):
+        if chunk.sizes['time'] == 0:
+            continue
+        if template is None:
+            template = chunk.isel(time=slice(0, 1))
+            t0 = first = chunk['time'].values[0]
+            name = chunk.name if chunk.name is not None else name
+            dtype = chunk.dtype if chunk.dtype.kind == 'f' else 'float64'
+        keys = chunk['time.year'].values.astype('int64')*12 + chunk['time.month'].values - 1
+        if np.any(np.diff(keys) < 0) or (pending is not None and keys[0] < pending[0]):
+            raise ValueError('time must increase within and across the sources (pass files in time order)')
+        vals = np.asarray(chunk.values, dtype='float64')
+        valid = np.isfinite(vals)
+        uniq, start = np.unique(keys, return_index=True)
+        sums = np.add.reduceat(np.where(valid, vals, 0.), start, axis=0)
+        cnts = np.add.reduceat(valid.astype('int32'), start, axis=0)
+        for key, s, n in zip(uniq, sums, cnts):
+            if pending is not None and key == pending[0]:
+                pending[1] += s
+                pending[2] += n
+                continue
+            if pending is not None:
+                _finish(*pending)
+            pending = [key, s, n]
+        last = chunk['time'].values[-1]
+    if pending is None:
+        raise ValueError('no time steps found in the sources')
+    _finish(*pending)
+    if monthly_store is not None and len(batch) > 0:
+        _append(batch)
+
+    ### +++ CLIMATOLOGY +++ ###
+    space = template.isel(time=0, drop=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        clim = np.where(clim_cnt > 0, clim_sum/np.maximum(clim_cnt, 1), np.nan)
+    month = xr.DataArray(np.arange(1, 13), dims=['month'], name='month', attrs={'long_name': 'month of the year', 'units': '1'})
+    clim = xr.DataArray(clim.astype(dtype),
+                        dims=['month']+list(space.dims), coords={**space.coords, 'month': month}, attrs=space.attrs)
+    clim.attrs['cell_methods'] = 'time: mean within years time: mean over years'
+    cycle = (clim - seasonal_climatology(clim, 'ANN', calendar=calendar)).astype(dtype).assign_attrs(space.attrs)
+    cycle.attrs['long_name'] = f"annual cycle of {space.attrs.get('long_name', name)}"
+    cycle.attrs['cell_methods'] = 'time: mean within years time: mean over years (anomaly from the annual mean)'
+    n_years = xr.DataArray(clim_cnt, dims=clim.dims, coords=clim.coords,
+                           attrs={'long_name': 'number of years in the climatology', 'units': '1'})
+    period = f'{str(first)[:7]} to {str(last)[:7]}'
+    ds = xr.Dataset({name: clim, f'{name}_annual_cycle': cycle, 'n_years': n_years},
+                    attrs={'Conventions': 'CF-1.8', 'climatology_period': period,
+                           'history': f'{datetime.now():%Y-%m-%d %H:%M} build_monthly_climatology'})
+
+    mon = None
+    if monthly_store is not None:
+        mon = xr.open_zarr(monthly_store)[name]
+    elif keep_monthly:
+        mon = _monthly_array(monthly, labels)
+        if monthly_file is not None:
+            mon.to_dataset().to_netcdf(monthly_file, unlimited_dims=['time'])
+    if ofile is not None:
+        ds.to_netcdf(ofile)
+    return(ds, mon)
+
+def daily_to_monthly(sources, var=None, time_chunk=366, store=None):
+    """
+    Monthly means of daily data, one time slab at a time (Python version of `cdo monmean`)
+        - see build_monthly_climatology, which also returns the climatology from the same pass
+    """
+    return(build_monthly_climatology(sources, var, time_chunk=time_chunk, keep_monthly=True, monthly_store=store)[1])
+
+#############################
+# Incremental monthly climatologies for records that keep growing (e.g. MERRA-2, IMERG)
+#   - the state holds, per calendar month and grid cell, the count, sum & sum of squares of the monthly values
+#     (taken about a per-cell shift, the first value seen, so the variance stays accurate) and the last time added
+#   - new months are added in time proportional to the new data only; months already in the state are never read
+#   - the state is a small [12 x grid] netCDF file that can be kept next to the data
+#############################
+
+def update_climatology_state(state, sources, var=None, time_chunk=120):
+    """
+    Add new monthly values to a climatology state (returns the updated state)
+        - only time steps after the state's last_time are read, so the full (appended) file can be passed
+
+    Parameters
+    ----------
+    state : state Dataset from a previous update or load_climatology_state, or None to start a new one
+    sources : monthly data (file path, xr.Dataset/xr.DataArray, or a list of them in time order)
+    var : variable name (for files & Datasets)
+    time_chunk : number of months read at once
+    """
+    after = state['last_time'].values[()] if state is not None else None
+    for chunk in iter_time_chunks(sources, var, time_chunk, after=after):
+        if chunk.sizes['time'] == 0:
+            continue
+        space = chunk.isel(time=0, drop=True)
+        if state is None:
+            shape = (12,)+space.shape
+            coords = {**space.coords, 'month': np.arange(1, 13)}
+            dims = ['month']+list(space.dims)
+            state = xr.Dataset({'count': (dims, np.zeros(shape, dtype='int32')),
+                                'sum': (dims, np.zeros(shape)),
+                                'sum_sq': (dims, np.zeros(shape)),
+                                'shift': (dims, np.full(shape, np.nan))}, coords=coords,
+                               attrs={'variable': chunk.name if chunk.name is not None else (var or 'var'),
+                                      'grid': grid_fingerprint(*[space[d] for d in space.dims if d in space.coords]),
+                                      'Conventions': 'CF-1.8'})
+            state['sum'].attrs = space.attrs
+        elif grid_fingerprint(*[space[d] for d in space.dims if d in space.coords]) != state.attrs['grid']:
+            raise ValueError('new data is not on the grid of the climatology state')
+        vals = np.asarray(chunk.values, dtype='float64')
+        valid = np.isfinite(vals)
+        month = chunk['time.month'].values - 1
+        count, sums, sum_sq, shift = (state[k].values for k in ['count', 'sum', 'sum_sq', 'shift'])
+        for m in np.unique(month):
+            v, ok = vals[month == m], valid[month == m]
+            # first value seen in each cell is the shift of that cell
+            first = np.isnan(shift[m]) & ok.any(axis=0)
+            if first.any():
+                shift[m] = np.where(first, np.take_along_axis(v, ok.argmax(axis=0)[None], axis=0)[0], shift[m])
+            d = np.where(ok, v - shift[m], 0.)
+            count[m] += ok.sum(axis=0, dtype='int32')
+            sums[m] += d.sum(axis=0)
+            sum_sq[m] += (d*d).sum(axis=0)
+        for k, arr in zip(['count', 'sum', 'sum_sq', 'shift'], [count, sums, sum_sq, shift]):
+            state[k].values = arr
+        state['last_time'] = xr.DataArray(chunk['time'].values[-1])
+    return(state)
+
+def climatology_from_state(state, ddof=1):
+    """
+    Monthly climatology & interannual standard deviation from a climatology state
+        - mean = shift + sum/n, variance = (sum_sq - sum^2/n)/(n - ddof); cells with too few years are NaN
+
+    Returns
+    -------
+    Dataset with the climatology (named after the variable), its standard deviation ('<var>_std') and n_years,
+    on a 'month' dimension
+    """
+    name = state.attrs['variable']
+    n = state['count'].values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, state['shift'].values + state['sum'].values/np.maximum(n, 1), np.nan)
+        var = (state['sum_sq'].values - state['sum'].values**2/np.maximum(n, 1))/(n - ddof)
+    std = np.where(n > ddof, np.sqrt(np.maximum(var, 0.)), np.nan)
+    attrs = dict(state['sum'].attrs)
+    dims, coords = state['count'].dims, state['count'].coords
+    clim = xr.DataArray(mean, dims=dims, coords=coords, attrs={**attrs, 'cell_methods': 'time: mean within years time: mean over years'})
+    clim['month'].attrs = {'long_name': 'month of the year', 'units': '1'}
+    sd = xr.DataArray(std, dims=dims, coords=coords,
+                      attrs={**attrs, 'long_name': f"interannual standard deviation of {attrs.get('long_name', name)}",
+                             'cell_methods': 'time: mean within years time: standard_deviation over years'})
+    n_years = xr.DataArray(n, dims=dims, coords=coords, attrs={'long_name': 'number of years in the climatology', 'units': '1'})
+    ds = xr.Dataset({name: clim, f'{name}_std': sd, 'n_years': n_years},
+                    attrs={'Conventions': 'CF-1.8', 'last_time': str(state['last_time'].values[()])})
+    return(ds)
+
+def monthly_anomalies(var, clim, std=None):
+    """
+    Anomalies of monthly data from a monthly climatology (standardized if std is given)
+
+    Parameters
+    ----------
+    var : monthly DataArray with a 'time' dimension
+    clim, std : climatology & standard deviation DataArrays with a 'month' dimension (e.g. from climatology_from_state)
+    """
+    month = var['time.month']
+    anom = var - clim.sel(month=month).drop_vars('month')
+    if std is not None:
+        anom = anom/std.sel(month=month).drop_vars('month')
+    anom.attrs = dict(var.attrs)
+    anom.attrs['long_name'] = f"{'standardized ' if std is not None else ''}anomaly of {var.attrs.get('long_name', var.name)}"
+    if std is not None:
+        anom.attrs['units'] = '1'
+    anom.name = var.name
+    return(anom)
+
+def save_climatology_state(state, path):
+    """
+    Write a climatology state to netCDF (through a temporary file, so a failed write keeps the old state)
+    """
+    tmp = f'{path}.tmp'
+    state.to_netcdf(tmp)
+    os.replace(tmp, path)
+
+def load_climatology_state(path):
+    """
+    Read a climatology state from netCDF into memory (None if the file doesn't exist yet)
+    """
+    if not os.path.exists(path):
+        return(None)
+    with xr.open_dataset(path) as ds:
+        state = ds.load()
+    return(state)
+
+def update_climatology(state_file, sources, var=None, ddof=1, standardize=False):
+    """
+    Add the months appended to a record since the last update and return the updated climatology
+        - loads the state, reads only the new months, saves the state, and computes the anomalies of the new months
+        - the first call (no state file yet) reads the whole record
+
+    Parameters
+    ----------
+    state_file : netCDF file with the climatology state (created if missing)
+    sources : monthly data (e.g. 'merra2.sfcWinds.1980-2022.monthly.nc'), file paths or open data in time order
+    var : variable name (for files & Datasets)
+    ddof : delta degrees of freedom of the standard deviation
+    standardize : if True, the anomalies are divided by the standard deviation
+
+    Returns
+    -------
+    climatology Dataset (see climatology_from_state), anomalies of the new months (None if there were none)
+    """
+    state = load_climatology_state(state_file)
+    after = state['last_time'].values[()] if state is not None else None
+    new = [chunk for chunk in iter_time_chunks(sources, var, time_chunk=120, after=after) if chunk.sizes['time'] > 0]
+    if len(new) == 0:
+        if state is None:
+            raise ValueError('no time steps found in the sources')
+        return(climatology_from_state(state, ddof=ddof), None)
+    new = xr.concat(new, dim='time')
+    state = update_climatology_state(state, new)
+    save_climatology_state(state, state_file)
+    clim = climatology_from_state(state, ddof=ddof)
+    name = state.attrs['variable']
+    anom = monthly_anomalies(new, clim[name], clim[f'{name}_std'] if standardize else None)
+    return(clim, anom)
@@ -0,0 +1,285 @@
+import sys
+sys.dont_write_bytecode = True
+
+import xarray as xr
+import numpy as np
+
+from regrid_funcs import cell_bounds, grid_fingerprint
+from data_funcs import get_xy_coords, EARTH_RADIUS
+
+#############################
+# Derived wind & moisture diagnostics on a sphere with vectorized finite differences
+#   - centered differences in longitude (periodic for global grids) and latitude, as one numpy call over all
+#     time steps / levels at once; no metpy units or per-field loops
+#   - chunk-aware: dask arrays stream through chunk by chunk along time & level (lat & lon are kept in one chunk)
+#   - output DataArrays are named like the get_settings fields, so they plot directly:
+#       wind_speed -> 'sfc_wind_speed' (or 'wind' on levels), divergence -> 'div', convergence -> 'cvg',
+#       vorticity -> 'vort', moisture_flux_convergence -> 'vimfc'
+#############################
+
+# gravitational acceleration [m/s^2]
+GRAVITY = 9.80665
+
+# names of vertical pressure coordinates
+LEVEL_ALIASES = ['plev', 'lev', 'level', 'levels', 'pressure', 'pressure_level', 'isobaric', 'pfull', 'p']
+
+# grid metrics, keyed by grid fingerprint
+_METRICS = {}
+
+###
+
+def _grid_metrics(lat, lon):
+    """
+    Cached finite-difference metrics of a lat/lon grid
+        - latitude & (unwrapped) longitude in radians, whether the grid wraps around the globe,
+          1/(a cos(lat)) (NaN at the poles), and which ends of the latitude axis can be continued across a pole
+    """
+    key = grid_fingerprint(lat, lon, tag='sphere')
+    if key not in _METRICS:
+        phi = np.deg2rad(np.asarray(lat, dtype='float64'))
+        lam = np.unwrap(np.deg2rad(np.asarray(lon, dtype='float64')))
+        edges = cell_bounds(lon)
+        periodic = bool(np.isclose(abs(edges[-1]-edges[0]), 360., atol=1e-3))
+        coslat = np.cos(phi)
+        with np.errstate(divide='ignore'):
+            inv_acos = np.where(coslat > 1e-10, 1./(EARTH_RADIUS*coslat), np.nan)
+        # global grids continue across the poles: the point past a pole is the edge row 180° away
+        # (the next row in when the edge row sits on the pole); None where the grid stops short of a pole
+        poles = [None, None]
+        if periodic and (np.size(lon) % 2 == 0) and np.size(lat) > 2:
+            lat_edges = cell_bounds(lat, lat=True)
+            for end, (edge, row, inner) in enumerate([(lat_edges[0], 0, 1), (lat_edges[-1], -1, -2)]):
+                if np.isclose(abs(edge), 90.):
+                    poles[end] = inner if np.isclose(abs(float(lat[row])), 90.) else row
+        _METRICS[key] = (phi, lam, periodic, coslat, inv_acos, poles)
+    return(_METRICS[key])
+
+def _d_dlon(f, lam, periodic):
+    """
+    d/d(lon) [per radian] along the last axis; one wrap-around column on each side for global grids
+    """
+    if not periodic:
+        return(np.gradient(f, lam, axis=-1))
+    step = 2*np.pi*np.sign(lam[-1]-lam[0])
+    f = np.concatenate([f[...,-1:], f, f[...,:1]], axis=-1)
+    lam = np.concatenate([[lam[-1]-step], lam, [lam[0]+step]])
+    return(np.gradient(f, lam, axis=-1)[...,1:-1])
+
+def _d_dlat(f, phi, poles=(None, None)):
+    """
+    d/d(lat) [per radian] along the second-to-last axis
+        - f is a vector component times cos(lat): across a pole both change sign, so the row past the pole
+          is a row next to the pole shifted by 180° of longitude and the edge rows get centered differences too
+    """
+    first, last = poles
+    if first is None and last is None:
+        return(np.gradient(f, phi, axis=-2))
+    half = f.shape[-1]//2
+    rows, phis = [f], [phi]
+    if first is not None:
+        rows.insert(0, np.roll(f[...,first:first+1,:], half, axis=-1))
+        phis.insert(0, [np.sign(phi[0])*np.pi - phi[first]])
+    if last is not None:
+        rows.append(np.roll(f[...,f.shape[-2]+last:f.shape[-2]+last+1,:], half, axis=-1))
+        phis.append([np.sign(phi[-1])*np.pi - phi[last]])
+    grad = np.gradient(np.concatenate(rows, axis=-2), np.concatenate(phis), axis=-2)
+    return(grad[...,int(first is not None):grad.shape[-2]-int(last is not None),:])
+
+def _spherical_op(a, b, phi=None, lam=None, periodic=True, coslat=None, inv_acos=None, poles=None, kind='div'):
+    """
+    Horizontal divergence (kind='div') or relative vorticity (kind='vort') of the vector (a, b) = (u, v)
+    on arrays shaped [..., lat, lon]:
+        div  = 1/(a cos(lat)) * [du/dlon + d(v cos(lat))/dlat]
+        vort = 1/(a cos(lat)) * [dv/dlon - d(u cos(lat))/dlat]
+    """
+    a = np.asarray(a, dtype='float64')
+    b = np.asarray(b, dtype='float64')
+    c = coslat[:,None]
+    if kind == 'div':
+        out = _d_dlon(a, lam, periodic) + _d_dlat(b*c, phi, poles)
+    else:
+        out = _d_dlon(b, lam, periodic) - _d_dlat(a*c, phi, poles)
+    return(out*inv_acos[:,None])
+
+def _horizontal_op(u, v, kind):
+    """
+    Apply _spherical_op to DataArrays, lazily & chunk by chunk on dask-backed data
+    """
+    lons, lats = get_xy_coords(u)
+    if lons.ndim != 1:
+        raise ValueError('spherical derivatives need a regular lat/lon grid (1D lat & lon coordinates)')
+    phi, lam, periodic, coslat, inv_acos, poles = _grid_metrics(lats, lons)
+    core = [lats.name, lons.name]
+    if u.chunks is not None or v.chunks is not None:
+        # derivatives need whole lat/lon slices; time & level chunks are kept as they are
+        u = u.chunk({lats.name: -1, lons.name: -1})
+        v = v.chunk({lats.name: -1, lons.name: -1})
+    out = xr.apply_ufunc(_spherical_op, u, v,
+                         kwargs={'phi': phi, 'lam': lam, 'periodic': periodic, 'coslat': coslat,
+                                 'inv_acos': inv_acos, 'poles': poles, 'kind': kind},
+                         input_core_dims=[core, core],
+                         output_core_dims=[core],
+                         dask='parallelized',
+                         output_dtypes=[np.float64])
+    return(out.transpose(*u.dims))
+
+###
+
+def find_level(var):
+    """
+    Name of the vertical (pressure) dimension of var, or None
+        - CF axis='Z' or positive attribute, then pressure units, then common names
+    """
+    for d in var.dims:
+        c = var[d] if d in var.coords else None
+        if c is not None and (str(c.attrs.get('axis', '')).upper() == 'Z' or 'positive' in c.attrs):
+            return(d)
+    for d in var.dims:
+        if d in var.coords and str(var[d].attrs.get('units', '')).lower() in ['pa', 'hpa', 'mb', 'mbar', 'millibar']:
+            return(d)
+    for d in var.dims:
+        if str(d).lower() in LEVEL_ALIASES:
+            return(d)
+    return(None)
+
+def pressure_in_pa(p):
+    """
+    Pressure values in Pa (from the units attribute, or hPa if the largest value is below 2000)
+    """
+    units = str(getattr(p, 'attrs', {}).get('units', '')).lower()
+    if isinstance(p, xr.DataArray):
+        p = p.astype('float64')
+        # one value is enough to tell hPa from Pa (and doesn't load a dask-backed surface pressure)
+        sample = np.nanmax(p.values) if p.chunks is None else float(p.isel({d: 0 for d in p.dims}))
+    else:
+        p = np.asarray(p, dtype='float64')
+        sample = np.nanmax(p)
+    if units in ['hpa', 'mb', 'mbar', 'millibar'] or (units != 'pa' and sample < 2000.):
+        return(p*100.)
+    return(p)
+
+def pressure_thickness(plev, ps=None, ptop=None):
+    """
+    Pressure thickness [Pa] of the layer around each pressure level, for vertical integrals
+        - layer edges are the midpoints between levels; the top layer starts at ptop and the bottom layer
+          ends at the surface pressure
+        - with ps, layers below ground get zero thickness and the layer cut by the surface is shortened,
+          so the result varies with lat/lon (and time)
+
+    Parameters
+    ----------
+    plev : 1D pressure level coordinate (DataArray; Pa or hPa)
+    ps : surface pressure [Pa or hPa] (DataArray without the level dimension), default: the bottom level
+    ptop : top of the column [Pa], default: the top level
+
+    Returns
+    -------
+    DataArray of layer thickness [Pa] along plev (broadcast against ps if given)
+    """
+    p = np.asarray(pressure_in_pa(plev), dtype='float64')
+    order = np.argsort(p)
+    p_sorted = p[order]
+    mid = 0.5*(p_sorted[1:]+p_sorted[:-1])
+    upper = np.empty_like(p)
+    lower = np.empty_like(p)
+    upper[order] = np.concatenate([[p_sorted[0] if ptop is None else ptop], mid])
+    lower[order] = np.concatenate([mid, [p_sorted[-1] if ps is None else np.inf]])
+    dim = plev.dims[0]
+    upper = xr.DataArray(upper, dims=[dim], coords={dim: plev.values})
+    lower = xr.DataArray(lower, dims=[dim], coords={dim: plev.values})
+    if ps is not None:
+        lower = np.minimum(lower, pressure_in_pa(ps))
+    dp = (lower - upper).clip(min=0.)
+    dp.name = 'dp'
+    dp.attrs['units'] = 'Pa'
+    return(dp)
+
+def column_integral(var, level=None, ps=None, ptop=None):
+    """
+    Mass-weighted vertical integral (1/g) * sum(var * dp) over pressure levels
+        - a weighted sum along the level dimension, so dask data is reduced chunk by chunk along level
+        - missing values (e.g. below ground) count as zero
+
+    Parameters
+    ----------
+    var : DataArray on pressure levels
+    level : name of the level dimension (default: found with find_level)
+    ps, ptop : surface & top pressure (see pressure_thickness)
+    """
+    level = level or find_level(var)
+    if level is None:
+        raise ValueError(f'could not find the pressure level dimension of {var.name}')
+    dp = pressure_thickness(var[level], ps=ps, ptop=ptop)
+    integral = xr.dot(var.fillna(0.), dp, dim=level)/GRAVITY
+    return(integral)
+
+###
+
+def wind_speed(u, v, name=None):
+    """
+    Wind speed sqrt(u^2 + v^2)
+        - named 'sfc_wind_speed' for single-level winds and 'wind' for winds on levels (get_settings fields)
+    """
+    speed = np.hypot(u, v)
+    speed.name = name or ('wind' if find_level(u) is not None else 'sfc_wind_speed')
+    speed.attrs = {'long_name': 'wind speed', 'units': u.attrs.get('units', 'm/s')}
+    return(speed)
+
+def divergence(u, v, name='div'):
+    """
+    Horizontal divergence of the wind on a sphere [1/s]
+        - 1/(a cos(lat)) * [du/dlon + d(v cos(lat))/dlat], centered differences (one-sided at the edges)
+        - works on any extra dimensions (time, level, ...) at once; lazy on dask-backed data
+
+    Parameters
+    ----------
+    u, v : DataArrays of the eastward & northward wind [m/s] on a regular lat/lon grid
+    """
+    div = _horizontal_op(u, v, 'div')
+    div.name = name
+    div.attrs = {'long_name': 'horizontal divergence', 'units': 's-1'}
+    return(div)
+
+def convergence(u, v, name='cvg'):
+    """
+    Horizontal convergence (minus the divergence) of the wind on a sphere [1/s]
+    """
+    cvg = -_horizontal_op(u, v, 'div')
+    cvg.name = name
+    cvg.attrs = {'long_name': 'horizontal convergence', 'units': 's-1'}
+    return(cvg)
+
+def vorticity(u, v, name='vort'):
+    """
+    Relative vorticity of the wind on a sphere [1/s]
+        - 1/(a cos(lat)) * [dv/dlon - d(u cos(lat))/dlat]
+    """
+    vort = _horizontal_op(u, v, 'vort')
+    vort.name = name
+    vort.attrs = {'long_name': 'relative vorticity', 'units': 's-1'}
+    return(vort)
+
+def moisture_flux_convergence(q, u, v, level=None, ps=None, ptop=None, name='vimfc'):
+    """
+    Vertically integrated moisture flux convergence [kg m-2 s-1]: -div( (1/g) * integral(q V dp) )
+        - the moisture fluxes q*u & q*v are integrated over the column first (streaming through the level
+          chunks), so the spherical divergence is taken once on 2D fields instead of on every level
+        - multiply by 86400 for mm/day
+
+    Parameters
+    ----------
+    q : specific humidity [kg/kg or g/kg] on pressure levels
+    u, v : eastward & northward wind [m/s] on the same levels
+    level : name of the level dimension (default: found with find_level)
+    ps : surface pressure [Pa or hPa] to cut the column at the ground (default: integrate down to the bottom level)
+    ptop : top of the column [Pa] (default: the top level)
+    """
+    if str(q.attrs.get('units', '')).lower().replace(' ', '') in ['g/kg', 'gkg-1', 'gkg**-1', 'gkg^-1']:
+        q = q*1e-3
+    level = level or find_level(q)
+    qu = column_integral(q*u, level=level, ps=ps, ptop=ptop)
+    qv = column_integral(q*v, level=level, ps=ps, ptop=ptop)
+    mfc = -_horizontal_op(qu, qv, 'div')
+    mfc.name = name
+    mfc.attrs = {'long_name': 'vertically integrated moisture flux convergence', 'units': 'kg m-2 s-1'}
+    return(mfc)
@@ -0,0 +1,168 @@
+import sys
+sys.dont_write_bytecode = True
+
+import os
+import warnings
+
+from lazy_imports import lazy_import
+
+# cartopy is imported on first use
+cartopy = lazy_import('cartopy')
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+shapereader = lazy_import('cartopy.io.shapereader')
+
+#############################
+# Offline Natural Earth features (coastlines, land/ocean masks, ...) for the map tools
+#   - shapefiles are only ever read from local directories, in cartopy's layout:
+#       <NATURAL_EARTH_DIR>/shapefiles/natural_earth/<category>/ne_<scale>_<name>.shp
+#     (cartopy.feature.LAND / ax.coastlines() would try to download missing files, which hangs or fails on compute nodes)
+#   - geometries are simplified once for display and kept in memory, so every map in a process reuses them
+#     (and cartopy keeps the projected paths of geometries that stay alive)
+#   - run fetch_natural_earth() once on a machine with internet access to fill the local directory
+#############################
+
+# local data directory (searched before cartopy's own data directories)
+NATURAL_EARTH_DIR = os.environ.get('NATURAL_EARTH_DIR')
+
+# Natural Earth (category, name) of each feature
+FEATURES = {'coastline': ('physical', 'coastline'),
+            'land': ('physical', 'land'),
+            'ocean': ('physical', 'ocean'),
+            'lakes': ('physical', 'lakes'),
+            'rivers': ('physical', 'rivers_lake_centerlines'),
+            'borders': ('cultural', 'admin_0_boundary_lines_land'),
+            'states': ('cultural', 'admin_1_states_provinces_lakes')}
+
+# simplification tolerance [degrees] for each scale (well below a pixel on the maps each scale is used for)
+TOLERANCE = {'110m': 0., '50m': 0.02, '10m': 0.005}
+
+# smallest map width [degrees of longitude] each scale is used for with scale='auto' (as cartopy's auto scaler)
+AUTO_SCALES = [('110m', 50.), ('50m', 15.), ('10m', 0.)]
+
+# simplified geometries & features, keyed by (feature name, scale)
+_GEOMETRIES = {}
+_FEATURES = {}
+_MISSING = set()
+
+###
+
+def data_dirs():
+    """
+    Local directories searched for Natural Earth shapefiles, in order
+    """
+    dirs = [NATURAL_EARTH_DIR, cartopy.config.get('pre_existing_data_dir'), cartopy.config.get('data_dir')]
+    return([str(d) for d in dirs if d])
+
+def natural_earth_path(name, scale='110m'):
+    """
+    Path of a local Natural Earth shapefile, or None if it isn't in any of the data_dirs()
+    """
+    category, ne_name = FEATURES[name]
+    for data_dir in data_dirs():
+        path = os.path.join(data_dir, 'shapefiles', 'natural_earth', category, f'ne_{scale}_{ne_name}.shp')
+        if os.path.exists(path):
+            return(path)
+    return(None)
+
+def resolve_scale(name, scale='110m', ax=None):
+    """
+    Natural Earth scale to use for a feature
+        - 'auto' picks the scale from the map width of ax
+        - falls back to another local scale if the requested one isn't available
+    """
+    if scale == 'auto':
+        scale = '110m'
+        if ax is not None:
+            lon_min, lon_max, _, _ = ax.get_extent(ccrs.PlateCarree())
+            scale = next(s for s, width in AUTO_SCALES if abs(lon_max - lon_min) >= width)
+    if natural_earth_path(name, scale) is None:
+        for other in ['110m', '50m', '10m']:
+            if natural_earth_path(name, other) is not None:
+                return(other)
+    return(scale)
+
+def load_geometries(name, scale='110m', tolerance=None):
+    """
+    Simplified geometries of a Natural Earth feature, read from disk once and cached
+        - a missing shapefile gives no geometries (and a warning), never a download
+
+    Parameters
+    ----------
+    name : feature name (see FEATURES)
+    scale : '110m', '50m', or '10m'
+    tolerance : simplification tolerance [degrees] (default TOLERANCE[scale])
+    """
+    tolerance = TOLERANCE.get(scale, 0.) if tolerance is None else tolerance
+    key = (name, scale, tolerance)
+    if key not in _GEOMETRIES:
+        path = natural_earth_path(name, scale)
+        if path is None:
+            if (name, scale) not in _MISSING:
+                _MISSING.add((name, scale))
+                warnings.warn(f"no local Natural Earth file for '{name}' ({scale}) in {data_dirs()}; "
+                              'set NATURAL_EARTH_DIR or run fetch_natural_earth() on a machine with internet access')
+            return(())
+        geoms = []
+        for geom in shapereader.Reader(path).geometries():
+            if tolerance > 0:
+                geom = geom.simplify(tolerance, preserve_topology=True)
+            if not geom.is_empty:
+                geoms.append(geom)
+        _GEOMETRIES[key] = tuple(geoms)
+    return(_GEOMETRIES[key])
+
+def get_feature(name, scale='110m'):
+    """
+    Cartopy feature of cached Natural Earth geometries (style it in ax.add_feature)
+    """
+    key = (name, scale)
+    if key not in _FEATURES:
+        geoms = load_geometries(name, scale)
+        feature = cfeature.ShapelyFeature(geoms, ccrs.PlateCarree())
+        if len(geoms) == 0:
+            return(feature)
+        _FEATURES[key] = feature
+    return(_FEATURES[key])
+
+###
+
+def add_coastlines(ax, scale='auto', color='black', **kwargs):
+    """
+    Offline replacement for ax.coastlines()
+    """
+    scale = resolve_scale('coastline', scale, ax)
+    return(ax.add_feature(get_feature('coastline', scale), edgecolor=color, facecolor='none', **kwargs))
+
+def add_mask(ax, mask, mask_color='w', scale='auto'):
+    """
+    Cover the land ('land') or the ocean ('ocean') with mask_color (offline replacement for cfeature.LAND/OCEAN)
+    """
+    if mask in ['land', 'Land']:
+        name = 'land'
+    elif mask in ['ocean', 'Ocean']:
+        name = 'ocean'
+    else:
+        return(None)
+    scale = resolve_scale(name, scale, ax)
+    return(ax.add_feature(get_feature(name, scale), fc=mask_color, ec='none', zorder=2))
+
+def fetch_natural_earth(names=('coastline', 'land', 'ocean'), scales=('110m', '50m'), data_dir=None):
+    """
+    Download Natural Earth shapefiles into a local directory (run once, on a machine with internet access)
+
+    Parameters
+    ----------
+    names : feature names (see FEATURES)
+    scales : Natural Earth scales to download
+    data_dir : target directory (default NATURAL_EARTH_DIR, else cartopy's data_dir)
+    """
+    data_dir = data_dir or NATURAL_EARTH_DIR
+    if data_dir:
+        cartopy.config['data_dir'] = data_dir
+    paths = []
+    for name in names:
+        category, ne_name = FEATURES[name]
+        for scale in scales:
+            paths.append(shapereader.natural_earth(resolution=scale, category=category, name=ne_name))
+    return(paths)
@@ -0,0 +1,48 @@
+import sys
+sys.dont_write_bytecode = True
+
+import importlib
+
+#############################
+# Deferred imports for heavy dependencies (cartopy, matplotlib, cmocean, scipy.stats, ...)
+#   - lazy_import returns a stand-in module that imports the real one the first time one of its
+#     attributes is used, so importing our modules on a batch node doesn't pay for libraries a task never uses
+#############################
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name):
+    """
+    Return the module if it's already imported, otherwise a LazyModule that imports it on first use
+
+    Parameters
+    ----------
+    name : full module name (e.g. 'cartopy.crs')
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -1,22 +1,11 @@
 import xarray as xr
 import numpy as np
-import metpy.calc as mp
 
-import cartopy
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from shapely.geometry.polygon import LinearRing
+from lazy_imports import lazy_import
+from data_funcs import get_xy_coords, get_coord, seasonal_climatology, area_weighted_mean
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import matplotlib.ticker as mticker
-from matplotlib import cm
-from matplotlib.colors import ListedColormap,LinearSegmentedColormap
-import cmocean
-import cmocean.cm as cmo
-import colorcet as cc
+# matplotlib is imported on first use
+plt = lazy_import('matplotlib.pyplot')
 
 
 #############################
@@ -46,51 +35,28 @@ def get_season(season='ann'):
 
 ####
 
-def get_xy_coords(var):
-    """
-    This extracts the lat and lon coordinates without having to know the specific coordinate names
-    """
-    if isinstance(var, xr.DataArray):
-        x = var.metpy.x
-        y = var.metpy.y
-        return(x,y)
-    if isinstance(var, xr.Dataset):
-        print('This is a dataset. Please use an xarray DataArray')
-
-###
-
 def weighted_global_mean_1d(var):
     """
-    This weights var data to account for unequal grid cell areas that are a function of latitude,
+    This weights var data by the exact area of each latitude band (cached per grid),
     then calculates a global mean timeseries of zonal mean [time x lat] data
     """
     # find latitude variable
-    lats=var.metpy.y
-    # determine weight based on latitude value
-    weights = np.cos(np.deg2rad(lats))
-    weights.name = 'weights'
-    # calculate area-weighted values
-    weighted_var = var.weighted(weights)
+    lats=get_coord(var, 'Y')
     # calculate global mean of weighted data
-    weighted_global_mean = weighted_var.mean(dim=[lats.name], keep_attrs=True)
+    weighted_global_mean = area_weighted_mean(var, lats)
     return(weighted_global_mean)
 
 ###
 
 def weighted_global_mean_md(var):
     """
-    This weights var data to account for unequal grid cell areas that are a function of latitude,
+    This weights var data by the exact area of each grid cell (cached per grid),
     then calculates a global mean timeseries for [time x lat x lon x n] data
     """
     # find latitude & longitude variable
     lons,lats=get_xy_coords(var)
-    # determine weight based on latitude value
-    weights = np.cos(np.deg2rad(lats))
-    weights.name = 'weights'
-    # calculate area-weighted values
-    weighted_var = var.weighted(weights)
     # calculate global mean of weighted data
-    weighted_global_mean = weighted_var.mean(dim=[lats.name,lons.name], keep_attrs=True)
+    weighted_global_mean = area_weighted_mean(var, lats, lons)
     return(weighted_global_mean)
 
 ###
@@ -133,17 +99,11 @@ def plot_zonal_mean(var, season='ann', col='k', xlim=None, ylim=None, mask=None,
 
     ## get var info
     _, lats = get_xy_coords(var) # get lat coord without having to know the specific coordinate name
-    mons = get_season(season=season) # index months to average over based on season var
-    var_avg = var[mons].mean(dim='month', keep_attrs=True) # calculate seasonal or annual average
-    """
-    if mask!=None:
-        # if a mask is provided, mask the data
-        var_masked = var_avg.where(mask==1,np.nan) 
-        # then calculate zonal mean
-        var_zonal_mean = var_masked.mean(dim='lon', keep_attrs=True)
-    else:
-        # if not, just calculate zonal mean
-    """
+    var_avg = seasonal_climatology(var, season) # calculate seasonal or annual average
+    if mask is not None:
+        # if a mask is provided (1/0 or fractional, e.g. land fraction), mask the data
+        var_avg = var_avg.where(mask > 0, np.nan)
+    # calculate zonal mean
     var_zonal_mean = var_avg.mean(dim='lon', keep_attrs=True)
     
     ## draw plot
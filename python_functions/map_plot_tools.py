@@ -4,41 +4,277 @@ sys.dont_write_bytecode = True
 import xarray as xr
 xr.set_options(keep_attrs=True)
 import numpy as np
-import metpy.calc as mp
-
-import cartopy
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from shapely.geometry.polygon import LinearRing
-
-import matplotlib as mpl
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import matplotlib.ticker as mticker
-from matplotlib import cm
-import matplotlib.colors as mcolors
-from matplotlib.colors import ListedColormap,LinearSegmentedColormap
-import cmocean
-
-from colorbar_funcs import *
-from data_funcs import *
 
+from lazy_imports import lazy_import
+from colorbar_funcs import get_settings, get_norm
+from data_funcs import get_xy_coords, seasonal_climatology, seasonal_wind
+from regrid_funcs import cell_bounds, grid_fingerprint
+from feature_funcs import add_coastlines, add_mask
+
+# cartopy & matplotlib are imported on first use
+ccrs = lazy_import('cartopy.crs')
+gridliner = lazy_import('cartopy.mpl.gridliner')
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+
+#############################
+# Rendering at display resolution
+#   - a 0.1° global field (3600 x 1800 cells) on a 9 x 6 inch map covers only ~700 x 350 pixels, but
+#     pcolormesh draws one polygon per grid cell (slow to render, huge vector pdfs)
+#   - regular lat/lon grids are block-averaged to about one value per pixel before drawing
+#   - on PlateCarree maps (any central longitude) the field is drawn as one image (imshow); other
+#     projections and irregular grids use a rasterized mesh whose corners are projected once per
+#     (grid, projection, extent) and cached, so drawing never re-transforms them
 #############################
 
-def quick_map(var, season='ann', field=None, diff=False, cbar=True, mask=None, mask_color='w', boundaries=None, label=None, ax=None, save=False, ofile=''):
+# projected mesh corners, keyed by grid fingerprint + projection
+_MESHES = {}
+
+def is_regular_grid(lons, lats, rtol=0.01):
+    """
+    True for 1D, evenly spaced latitude & longitude coordinates
+    """
+    lons = np.asarray(lons, dtype='float64')
+    lats = np.asarray(lats, dtype='float64')
+    if (lons.ndim != 1) or (lats.ndim != 1) or (lons.size < 2) or (lats.size < 2):
+        return(False)
+    dlon, dlat = np.diff(lons), np.diff(lats)
+    return(bool(np.allclose(dlon, dlon[0], rtol=rtol) and np.allclose(dlat, dlat[0], rtol=rtol)))
+
+def _block_factor(n, f, exact=False):
+    """
+    Block size for n cells (at least 1); exact=True makes it divide n (for wrapping global longitudes)
+    """
+    f = int(min(max(f, 1), n))
+    while exact and (n % f):
+        f -= 1
+    return(f)
+
+def _block_mean(data, fy, fx):
+    """
+    Mean over [fy x fx] blocks of a 2D array, skipping NaNs (edges are padded with NaN)
+    """
+    if (fy == 1) and (fx == 1):
+        return(data)
+    ny, nx = data.shape
+    my, mx = -(-ny//fy), -(-nx//fx)
+    padded = np.full((my*fy, mx*fx), np.nan)
+    padded[:ny,:nx] = data
+    blocks = padded.reshape(my, fy, mx, fx)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        count = np.isfinite(blocks).sum(axis=(1,3))
+        total = np.nansum(blocks, axis=(1,3))
+        return(np.where(count > 0, total/np.maximum(count, 1), np.nan))
+
+def raster_plan(ax, lons, lats, dpi=None, boundaries=None):
+    """
+    Decide how to draw a grid on a map at display resolution (computed once per grid & map)
+
+    Parameters
+    ----------
+    ax : GeoAxes the field will be drawn on
+    lons, lats : longitude & latitude coordinates of the field
+    dpi : output resolution (default: the figure dpi)
+    boundaries : [lon_min, lon_max, lat_min, lat_max] map extent (default: the current axes extent)
+
+    Returns
+    -------
+    dict with the drawing mode ('image', 'projected', or 'mesh'), the block sizes (fy, fx), and the
+    column order, row flip, wrapping, and image extent for 'image', the cached projected corners for
+    'projected', or the block-mean coordinates for 'mesh' (curvilinear grids, drawn by cartopy)
+    """
+    lon = np.asarray(lons, dtype='float64')
+    lat = np.asarray(lats, dtype='float64')
+    plan = {'mode': 'mesh', 'fy': 1, 'fx': 1, 'order': None, 'flip': False, 'wrap': False, 'lons': lon, 'lats': lat}
+    if (lon.ndim != 1) or (lat.ndim != 1):
+        return(plan)
+
+    # size of one pixel in degrees
+    fig = ax.figure
+    dpi = dpi or fig.dpi
+    pos = ax.get_position()
+    width, height = fig.get_size_inches()
+    ext = boundaries if boundaries is not None else ax.get_extent(ccrs.PlateCarree())
+    px_lon = abs(ext[1]-ext[0])/max(pos.width*width*dpi, 1.)
+    px_lat = abs(ext[3]-ext[2])/max(pos.height*height*dpi, 1.)
+
+    dlon = abs(np.median(np.diff(lon)))
+    dlat = abs(np.median(np.diff(lat)))
+    regular = is_regular_grid(lon, lat)
+    global_lon = regular and (abs(lon.size*dlon - 360.) < dlon/2)
+    fx = plan['fx'] = _block_factor(lon.size, px_lon//dlon, exact=global_lon)
+    fy = plan['fy'] = _block_factor(lat.size, px_lat//dlat)
+
+    if regular and isinstance(ax.projection, ccrs.PlateCarree):
+        # longitudes in the map's own x coordinates, in increasing order
+        lon0 = central_longitude(ax.projection)
+        x = (lon - lon0 + 180.) % 360. - 180.
+        order = np.argsort(x, kind='stable')
+        x = x[order]
+        if np.allclose(np.diff(x), dlon, rtol=0.01):
+            x0 = x[0] - dlon/2
+            x1 = x0 + -(-lon.size//fx)*fx*dlon
+            y0 = lat.min() - dlat/2
+            y1 = y0 + -(-lat.size//fy)*fy*dlat
+            if global_lon:
+                # one extra block on each side so the cells split by the map edge are drawn on both sides
+                x0, x1 = x0 - fx*dlon, x1 + fx*dlon
+            plan.update({'mode': 'image', 'order': order, 'flip': bool(lat[0] > lat[-1]), 'wrap': global_lon,
+                         'extent': [x0, x1, y0, y1]})
+            return(plan)
+
+    # rasterized mesh on the block-mean coordinates, projected once
+    plan['lons'] = _block_mean(lon[None,:], 1, fx)[0]
+    plan['lats'] = _block_mean(lat[:,None], fy, 1)[:,0]
+    mesh = projected_mesh(ax.projection, plan['lons'], plan['lats'])
+    if mesh is not None:
+        plan.update({'mode': 'projected', 'x': mesh[0], 'y': mesh[1], 'columns': mesh[2]})
+    return(plan)
+
+def central_longitude(proj):
+    """
+    Central longitude of a cartopy projection
+        - most projections store it as proj4 'lon_0'; PlateCarree(central_longitude=...) stores it as 'pm'
+    """
+    params = proj.proj4_params
+    return(float(params.get('lon_0', params.get('pm', 0.))))
+
+def _seam_columns(lon_edges, lon0):
+    """
+    Reorder 1D longitude cells to run from the left to the right edge of a map centered on lon0
+        - a cell that straddles the map edge (lon0 ± 180) is split in two, one part at each side
+        - gaps (e.g. a regional grid split by the map edge) become cells with no data
+
+    Returns
+    -------
+    edges : new longitude edges (increasing, within [lon0-180, lon0+180])
+    columns : data column of each new cell (-1 for gaps)
+    """
+    base = lon0 - 180.
+    lo = np.minimum(lon_edges[:-1], lon_edges[1:])
+    hi = np.maximum(lon_edges[:-1], lon_edges[1:])
+    shift = 360.*np.floor((lo - base)/360.)
+    lo, hi = lo - shift, hi - shift
+    cells = []
+    for col in range(lo.size):
+        if hi[col] > base + 360.:
+            cells += [(lo[col], base + 360., col), (base, hi[col] - 360., col)]
+        else:
+            cells.append((lo[col], hi[col], col))
+    cells.sort()
+    edges, columns = [cells[0][0]], []
+    for c_lo, c_hi, col in cells:
+        if c_hi <= edges[-1]:
+            continue # overlapping cells (e.g. a repeated cyclic column)
+        if c_lo > edges[-1] + 1e-6:
+            edges.append(c_lo)
+            columns.append(-1)
+        edges.append(c_hi)
+        columns.append(col)
+    return(np.array(edges), np.array(columns))
+
+def projected_mesh(proj, lons, lats):
+    """
+    Cell corners of a 1D lat/lon grid in a map projection's coordinates, computed once and cached
+        - cells are split at the map edge so none of them wraps around the map (see _seam_columns)
+        - None if some corners fall outside the projection's domain (cartopy's pcolormesh handles those)
+
+    Returns
+    -------
+    x, y : 2D arrays of projected cell corners
+    columns : data column of each mesh column (-1 = no data)
+    """
+    key = grid_fingerprint(lons, lats, tag=proj.proj4_init)
+    if key not in _MESHES:
+        lon0 = central_longitude(proj)
+        edges, columns = _seam_columns(cell_bounds(lons), lon0)
+        # keep the outermost corners just inside the map edge so they aren't wrapped to the other side
+        edges = np.clip(edges, lon0 - 180. + 1e-7, lon0 + 180. - 1e-7)
+        lon2d, lat2d = np.meshgrid(edges, cell_bounds(lats, lat=True))
+        xyz = proj.transform_points(ccrs.PlateCarree(), lon2d, lat2d)
+        mesh = None
+        if np.isfinite(xyz[...,:2]).all():
+            mesh = (xyz[...,0], xyz[...,1], columns)
+        _MESHES[key] = mesh
+    return(_MESHES[key])
+
+def apply_plan(plan, data):
+    """
+    Reduce a 2D [lat x lon] field to the display grid of a raster_plan
+    """
+    data = np.ma.filled(np.ma.asarray(data, dtype='float64'), np.nan)
+    if plan['order'] is not None:
+        data = data[:, plan['order']]
+    if plan['flip']:
+        data = data[::-1]
+    data = _block_mean(data, plan['fy'], plan['fx'])
+    if plan.get('columns') is not None:
+        columns = plan['columns']
+        data = np.where(columns >= 0, data[:, np.maximum(columns, 0)], np.nan)
+    if plan['wrap']:
+        data = np.concatenate([data[:,-1:], data, data[:,:1]], axis=1)
+    return(np.ma.masked_invalid(data))
+
+def _plan_artist(ax, plan, data, cmap=None, norm=None, vmin=None, vmax=None, trans=None):
+    """
+    Draw display-resolution data from apply_plan as an image or a rasterized mesh
+    """
+    if plan['mode'] == 'image':
+        # the data are already in the map's coordinates, so cartopy doesn't need to warp the image
+        with ax.hold_limits():
+            return(ax.imshow(data, origin='lower', extent=plan['extent'], transform=ax.transData,
+                             cmap=cmap, norm=norm, vmin=vmin, vmax=vmax, interpolation='nearest'))
+    if plan['mode'] == 'projected':
+        # corners are already in map coordinates: plain matplotlib pcolormesh with the axes' own (affine)
+        # transform, so cartopy doesn't re-project every corner on each draw
+        with ax.hold_limits():
+            return(mpl.axes.Axes.pcolormesh(ax, plan['x'], plan['y'], data, cmap=cmap, norm=norm, vmin=vmin, vmax=vmax,
+                                            transform=ax.transData, rasterized=True))
+    return(ax.pcolormesh(plan['lons'], plan['lats'], data, cmap=cmap, norm=norm, vmin=vmin, vmax=vmax,
+                         transform=trans if trans is not None else ccrs.PlateCarree(), rasterized=True))
+
+def draw_field(ax, var, cmap=None, norm=None, vmin=None, vmax=None, fast=True, dpi=None, boundaries=None, trans=None):
+    """
+    Draw a 2D lat/lon field on a map
+        - fast=True: block-averaged to display resolution and drawn as an image where possible (see raster_plan),
+          so render time and file size scale with the figure size instead of the grid size
+        - fast=False: plain pcolormesh of every grid cell
+
+    Parameters
+    ----------
+    ax : GeoAxes to draw on
+    var : 2D DataArray with lat & lon coordinates
+    cmap, norm, vmin, vmax : colormap & color scaling (as for pcolormesh)
+    dpi : output resolution used to pick the block size (default: the figure dpi)
+    boundaries : map extent [lon_min, lon_max, lat_min, lat_max], if not set on the axes yet
+    trans : projection of the data coordinates (default PlateCarree)
+
+    Returns
+    -------
+    the AxesImage or QuadMesh (e.g. for plt.colorbar)
+    """
+    trans = trans if trans is not None else ccrs.PlateCarree()
+    lons, lats = get_xy_coords(var)
+    if not fast:
+        return(ax.pcolormesh(lons, lats, var, cmap=cmap, norm=norm, vmin=vmin, vmax=vmax, transform=trans))
+    data = var.transpose(lats.dims[0], lons.dims[-1]).values
+    plan = raster_plan(ax, lons, lats, dpi=dpi, boundaries=boundaries)
+    return(_plan_artist(ax, plan, apply_plan(plan, data), cmap, norm, vmin, vmax, trans))
+
+###
+
+def quick_map(var, season='ann', field=None, diff=False, cbar=True, mask=None, mask_color='w', boundaries=None, label=None, ax=None, save=False, ofile='', fast=True):
     """
     Quickly plot up climate field data based preset values for various vars
     - only works for monthly climatology data where the time dimension is labeled 'month'
+    - fast=True draws high-resolution grids at display resolution (see draw_field); fast=False draws every grid cell
     """
     ### +++ GET VAR INFO +++ ###
     lons,lats = get_xy_coords(var) # get lat & lon coords without having to know coordinate names
 
     ## need to figure out how to write an if statement to only do this if there is a time/month variable
     if season!=None:
-        mons = get_season(season=season) # index months to average over based on season var
-        var_avg = var[mons].mean(dim='month', keep_attrs=True) # find seasonal or annual var mean
+        var_avg = seasonal_climatology(var, season) # find seasonal or annual var mean
     else:
         var_avg=var
 
@@ -51,25 +287,20 @@ def quick_map(var, season='ann', field=None, diff=False, cbar=True, mask=None, m
         ax = plt.subplot(111, projection=proj)
 
     ### +++ MAP & BOUNDARY INFO +++ ###
-    # add optional masks
-    if mask != None:
-        if mask in ['land', 'Land']:
-            ax.add_feature(cfeature.LAND, fc=mask_color, zorder=2) # masks continents
-        if mask in ['ocean', 'Ocean']:
-            ax.add_feature(cfeature.OCEAN, fc=mask_color, zorder=2) # masks oceans
     # map boundaries
     if boundaries != None:
         ax.set_extent(boundaries, crs=trans) # clips map extent according to designated boundaries
     else:
         ax.set_global() # make a global map
-    # add coastlines
-    ax.coastlines()
+    # add optional masks & coastlines (from local Natural Earth files, see feature_funcs)
+    add_mask(ax, mask, mask_color) # masks continents or oceans
+    add_coastlines(ax)
     # grid line specs
     gl = ax.gridlines(crs=trans, lw=.5, colors='black', alpha=1.0, linestyle='--', zorder=10, draw_labels=True)
     gl.top_labels=False
     gl.right_labels=False
-    gl.xformatter = LONGITUDE_FORMATTER
-    gl.yformatter = LATITUDE_FORMATTER
+    gl.xformatter = gridliner.LONGITUDE_FORMATTER
+    gl.yformatter = gridliner.LATITUDE_FORMATTER
     gl.xlabel_style = {'color': 'black', 'weight': 'bold'}
     gl.ylabel_style = {'color': 'black', 'weight': 'bold'}
 
@@ -77,7 +308,7 @@ def quick_map(var, season='ann', field=None, diff=False, cbar=True, mask=None, m
     cmap, vmin, vmax, cf = get_settings(field=field, diff=diff)
 
     ### +++ PLOT CONTOURS +++ ###
-    ax.pcolormesh(lons, lats, var_avg, cmap=cmap, vmin=vmin, vmax=vmax, transform=trans)
+    draw_field(ax, var_avg, cmap=cmap, vmin=vmin, vmax=vmax, fast=fast, trans=trans)
 
     ### +++ ADD FIG LABEL +++ ###
     if label==None:
@@ -113,20 +344,19 @@ def quick_map(var, season='ann', field=None, diff=False, cbar=True, mask=None, m
     if save is True:
             plt.savefig('{}.pdf'.format(ofile),
                         dpi=None, facecolor='w', edgecolor='w',
-                        orientation='portrait', papertype=None,
+                        orientation='portrait',
                         format=None, transparent=False,
                         bbox_inches='tight', pad_inches=0.1)
 
 
 ###
 
-def custom_map(var, season='ann', vmin=None, vmax=None, scale=None, cmap=None, cbar=True, mask=None, mask_color='w', boundaries=None, label=None, ax=None, save=False, ofile=''):
+def custom_map(var, season='ann', vmin=None, vmax=None, scale=None, cmap=None, cbar=True, mask=None, mask_color='w', boundaries=None, label=None, ax=None, save=False, ofile='', fast=True):
     
     ### +++ GET VAR INFO +++ ###
     lons,lats = get_xy_coords(var) # get lat & lon coords without having to know coordinate names
     if season!=None:
-        mons = get_season(season=season) # index months to average over based on season var
-        var_avg = var[mons].mean(dim='month', keep_attrs=True) # find seasonal or annual var mean
+        var_avg = seasonal_climatology(var, season) # find seasonal or annual var mean
     else:
         var_avg=var
 
@@ -139,25 +369,20 @@ def custom_map(var, season='ann', vmin=None, vmax=None, scale=None, cmap=None, c
         ax = plt.subplot(111, projection=proj)
 
     ### +++ MAP & BOUNDARY INFO +++ ###
-    # add optional masks
-    if mask != None:
-        if mask in ['land', 'Land']:
-            ax.add_feature(cfeature.LAND, fc=mask_color, zorder=2) # masks continents
-        if mask in ['ocean', 'Ocean']:
-            ax.add_feature(cfeature.OCEAN, fc=mask_color, zorder=2) # masks oceans
     # map boundaries
     if boundaries != None:
         ax.set_extent(boundaries, crs=trans) # clips map extent according to designated boundaries
     else:
         ax.set_global() # make a global map
-    # add coastlines
-    ax.coastlines()
+    # add optional masks & coastlines (from local Natural Earth files, see feature_funcs)
+    add_mask(ax, mask, mask_color) # masks continents or oceans
+    add_coastlines(ax)
     # grid line specs
     gl = ax.gridlines(crs=trans, lw=.5, colors='black', alpha=1.0, linestyle='--', zorder=10, draw_labels=True)
     gl.top_labels=False
     gl.right_labels=False
-    gl.xformatter = LONGITUDE_FORMATTER
-    gl.yformatter = LATITUDE_FORMATTER
+    gl.xformatter = gridliner.LONGITUDE_FORMATTER
+    gl.yformatter = gridliner.LATITUDE_FORMATTER
     gl.xlabel_style = {'color': 'black', 'weight': 'bold'}
     gl.ylabel_style = {'color': 'black', 'weight': 'bold'}
 
@@ -178,13 +403,13 @@ def custom_map(var, season='ann', vmin=None, vmax=None, scale=None, cmap=None, c
             n_lvls=(n_lvls*2)+1
         levels = np.linspace(vmin, vmax, int(n_lvls))
         norm = mpl.colors.BoundaryNorm(levels, cmap.N)
-        cf = ax.pcolormesh(lons, lats, var_avg, cmap=cmap, norm=norm, transform=trans)
+        cf = draw_field(ax, var_avg, cmap=cmap, norm=norm, fast=fast, trans=trans)
     else:
         if vmin==None:
             vmin=var_avg.min()
         if vmax==None:
             vmax=var_avg.max()
-        cf = ax.pcolormesh(lons, lats, var_avg, cmap=cmap, norm=norm, transform=trans)
+        cf = draw_field(ax, var_avg, cmap=cmap, vmin=vmin, vmax=vmax, fast=fast, trans=trans)
     
     ### +++ ADD FIG LABEL +++ ###
     if label==None:
@@ -220,29 +445,61 @@ def custom_map(var, season='ann', vmin=None, vmax=None, scale=None, cmap=None, c
     if save is True:
             plt.savefig('{}.pdf'.format(ofile),
                         dpi=None, facecolor='w', edgecolor='w',
-                        orientation='portrait', papertype=None,
+                        orientation='portrait',
                         format=None, transparent=False,
                         bbox_inches='tight', pad_inches=0.1)
 
 
 ###
 
-def wind_vectors(u, v, season='ann', color='k', scalef=15, w=0.005, skip_n=2, key_length=5,
-                 mask=None, mask_color=None, boundaries=None, label=None, grid=False, ax=None):
+def arrow_blocks(ax, lons, lats, spacing=0.35, boundaries=None):
+    """
+    Block sizes (fy, fx) that put one wind vector about every `spacing` inches on a map
+        - the arrow density depends on the figure, not on the grid resolution
+        - on global grids fx divides the number of longitudes, so there is no partial block at the dateline
+
+    Parameters
+    ----------
+    ax : GeoAxes the vectors are drawn on
+    lons, lats : 1D longitude & latitude coordinates
+    spacing : distance between arrows [inches]
+    boundaries : map extent [lon_min, lon_max, lat_min, lat_max] (default: the current axes extent)
+    """
+    fig = ax.figure
+    pos = ax.get_position()
+    width, height = fig.get_size_inches()
+    ext = boundaries if boundaries is not None else ax.get_extent(ccrs.PlateCarree())
+    deg_x = abs(ext[1]-ext[0])*spacing/max(pos.width*width, 1e-6)
+    deg_y = abs(ext[3]-ext[2])*spacing/max(pos.height*height, 1e-6)
+    dlon = abs(np.median(np.diff(np.asarray(lons, dtype='float64'))))
+    dlat = abs(np.median(np.diff(np.asarray(lats, dtype='float64'))))
+    fx = _block_factor(np.size(lons), round(deg_x/dlon))
+    if abs(np.size(lons)*dlon - 360.) < dlon/2:
+        # whole blocks around a cyclic longitude axis (the divisor of the number of longitudes closest
+        # to the target), so the spacing stays even across the dateline
+        n = np.size(lons)
+        fx = min((d for d in range(1, n+1) if n % d == 0), key=lambda d: abs(d - deg_x/dlon))
+    return(_block_factor(np.size(lats), round(deg_y/dlat)), fx)
+
+def wind_vectors(u, v, season='ann', color='k', scalef=15, w=0.005, skip_n=None, key_length=5,
+                 mask=None, mask_color=None, boundaries=None, label=None, grid=False, ax=None,
+                 spacing=0.35, shade=None):
     """
     Make a map of wind vectors from U and V components
-    !!!! Cannot use this function with a projection that has a central_longitude=180 !!!!
+        - u & v are averaged onto an arrow grid with one arrow about every `spacing` inches (block means of the
+          components), so maps look the same for coarse models and high-resolution reanalysis
+        - skip_n: plot every skip_n-th grid point instead (the old fixed-stride thinning)
+        - works with any projection (including central_longitude=180)
+        - shade: get_settings field name (e.g. 'sfc_wind_speed') to shade the seasonal mean wind speed under the arrows
+
+    Returns
+    -------
+    the Quiver artist
     """
     ### +++ GET VAR INFO +++ ###
     lons,lats = get_xy_coords(u) # get lat & lon coords without having to know coordinate names
-    #z_name = u.metpy.vertical.name # get vertical coordinate
-    if season!=None:
-        mons=get_season(season=season) # index months to average over based on season var
-        u_avg=u[mons].mean(dim=['month'], keep_attrs=True)
-        v_avg=v[mons].mean(dim=['month'], keep_attrs=True)
-    else:
-        u_avg=u
-        v_avg=v
+    # seasonal or annual means of u, v & wind speed in one pass
+    wind = seasonal_wind(u, v, season)
 
     ### +++ INITIALIZE FIGURE +++ ###
     trans = ccrs.PlateCarree()
@@ -253,35 +510,54 @@ def wind_vectors(u, v, season='ann', color='k', scalef=15, w=0.005, skip_n=2, ke
         ax = plt.subplot(111, projection=proj)
 
     ### +++ MAP & BOUNDARY INFO +++ ###
-    # add optional masks
-    if mask != None:
-        if mask in ['land', 'Land']:
-            ax.add_feature(cfeature.LAND, fc=mask_color, zorder=2) # masks continents
-        if mask in ['ocean', 'Ocean']:
-            ax.add_feature(cfeature.OCEAN, fc=mask_color, zorder=2) # masks oceans
     # map boundaries
     if boundaries != None:
         ax.set_extent(boundaries, crs=trans) # clips map extent according to designated boundaries
     else:
         ax.set_global() # make a global map
-    # add coastlines
-    ax.coastlines()
+    # add optional masks & coastlines (from local Natural Earth files, see feature_funcs)
+    add_mask(ax, mask, mask_color) # masks continents or oceans
+    add_coastlines(ax)
     if grid==True:
         # grid line specs
         gl = ax.gridlines(crs=trans, lw=.5, colors='black', alpha=1.0, linestyle='--', zorder=10, draw_labels=True)
         gl.top_labels=False
         gl.right_labels=False
-        gl.xformatter = LONGITUDE_FORMATTER
-        gl.yformatter = LATITUDE_FORMATTER
+        gl.xformatter = gridliner.LONGITUDE_FORMATTER
+        gl.yformatter = gridliner.LATITUDE_FORMATTER
         gl.xlabel_style = {'color': 'black', 'weight': 'bold'}
         gl.ylabel_style = {'color': 'black', 'weight': 'bold'}
     else:
         ax.gridlines(crs=trans, alpha=0, colors=None, draw_labels=False)
 
+    ### +++ OPTIONAL WIND SPEED SHADING +++ ###
+    if shade is not None:
+        cmap, vmin, vmax, cf = get_settings(field=shade)
+        draw_field(ax, wind['speed'], cmap=cmap, norm=cf.norm, boundaries=boundaries, trans=trans)
+
+    ### +++ ARROW GRID +++ ###
+    dims = [lats.dims[0], lons.dims[-1]]
+    u2d = np.asarray(wind['u'].transpose(*dims).values, dtype='float64')
+    v2d = np.asarray(wind['v'].transpose(*dims).values, dtype='float64')
+    lon2d, lat2d = (np.meshgrid(lons.values, lats.values) if lons.ndim == 1
+                    else (np.asarray(lons.values, dtype='float64'), np.asarray(lats.values, dtype='float64')))
+    if skip_n is not None:
+        sl = (slice(None, None, skip_n), slice(None, None, skip_n))
+        u2d, v2d, lon2d, lat2d = u2d[sl], v2d[sl], lon2d[sl], lat2d[sl]
+    elif lons.ndim == 1:
+        # block means of the components (one vectorized reduction each)
+        fy, fx = arrow_blocks(ax, lons, lats, spacing=spacing, boundaries=boundaries)
+        u2d, v2d = _block_mean(u2d, fy, fx), _block_mean(v2d, fy, fx)
+        lon2d, lat2d = np.meshgrid(_block_mean(lon2d[:1], 1, fx)[0], _block_mean(lat2d[:,:1], fy, 1)[:,0])
+    ok = np.isfinite(u2d) & np.isfinite(v2d)
+    # plain arrays of valid points (cartopy reprojects the vectors for any map projection)
+    x = (lon2d[ok] + 180.) % 360. - 180.
+
     # Draw vectors
-    q1=ax.quiver(lons[::skip_n], lats[::skip_n], u_avg[::skip_n,::skip_n], v_avg[::skip_n,::skip_n],
+    q1=ax.quiver(x, lat2d[ok], u2d[ok], v2d[ok],
                  color=color, width=w, scale=scalef, scale_units='inches', units='height', transform=trans)
     ax.quiverkey(q1, .925, 1.02, key_length, rf'{key_length} m/s', labelcolor=color, labelpos='W')
+    return(q1)
 
 ###
 
@@ -290,7 +566,7 @@ def plot_field_diff(var1, var2, season=None,
                     vmin_diff=None, vmax_diff=None, cmap_diff=None,
                     mask=None, boundaries=None, cl=None,
                     var1_name='', var2_name='',
-                    save=False, ofile=None):
+                    save=False, ofile=None, fast=True):
     
     ## initialize figure
     trans = ccrs.PlateCarree()
@@ -305,10 +581,9 @@ def plot_field_diff(var1, var2, season=None,
     lons, lats = get_xy_coords(var1) # get lat & lon coords without having to know coordinate names
 
     if season != None:
-        mons = get_season(season=season) # index months to average over based on season var
         # find seasonal or annual var mean
-        var_avg1 = var1[mons].mean(dim='month', keep_attrs=True) 
-        var_avg2 = var2[mons].mean(dim='month', keep_attrs=True) 
+        var_avg1 = seasonal_climatology(var1, season)
+        var_avg2 = seasonal_climatology(var2, season)
         plt.suptitle((var1.attrs['long_name']+' ('+season+')'), fontsize=16, fontweight='bold', ha='center', va='center')
     else:
         var_avg1 = var1
@@ -330,10 +605,10 @@ def plot_field_diff(var1, var2, season=None,
         n_lvls_fld = 2*(vx_fld-vn_fld)+1
         levels_fld = np.linspace(vn_fld, vx_fld, n_lvls_fld)
         norm_fld = mpl.colors.BoundaryNorm(levels_fld, cmap_fld.N)
-        cf_fld = ax[0].pcolormesh(lons, lats, var_avg1, cmap=cmap_fld, norm=norm_fld, transform=trans)
+        cf_fld = draw_field(ax[0], var_avg1, cmap=cmap_fld, norm=norm_fld, fast=fast, boundaries=boundaries, trans=trans)
         t=ax[0].annotate(var1_name, xy=(0.015, 0.025), xycoords='axes fraction', annotation_clip=False, fontsize=10, fontweight='bold', ha='left', va='bottom')
         t.set_bbox(dict(facecolor='white', alpha=1, edgecolor='k'))
-        ax[1].pcolormesh(lons, lats, var_avg2, cmap=cmap_fld, norm=norm_fld, transform=trans)
+        draw_field(ax[1], var_avg2, cmap=cmap_fld, norm=norm_fld, fast=fast, boundaries=boundaries, trans=trans)
         t=ax[1].annotate(var2_name, xy=(0.015, 0.025), xycoords='axes fraction', annotation_clip=False, fontsize=10, fontweight='bold', ha='left', va='bottom')
         t.set_bbox(dict(facecolor='white', alpha=1, edgecolor='k'))
     else:
@@ -341,10 +616,10 @@ def plot_field_diff(var1, var2, season=None,
             vn_fld=var_avg1.min()
         if vmax_fld==None:
             vx_fld=var_avg1.max()
-        cf = ax[0].pcolormesh(lons, lats, var_avg1, cmap=cmap_fld, vmin=vn_fld, vmax=vx_fld, transform=trans)
+        cf = draw_field(ax[0], var_avg1, cmap=cmap_fld, vmin=vn_fld, vmax=vx_fld, fast=fast, boundaries=boundaries, trans=trans)
         t=ax[0].annotate(var1_name, xy=(0.015, 0.025), xycoords='axes fraction', annotation_clip=False, fontsize=10, fontweight='bold', ha='left', va='bottom')
         t.set_bbox(dict(facecolor='white', alpha=1, edgecolor='k'))
-        ax[1].pcolormesh(lons, lats, var_avg2, cmap=cmap_fld, vmin=vn_fld, vmax=vx_fld, transform=trans)
+        draw_field(ax[1], var_avg2, cmap=cmap_fld, vmin=vn_fld, vmax=vx_fld, fast=fast, boundaries=boundaries, trans=trans)
         t=ax[1].annotate(var2_name, xy=(0.015, 0.025), xycoords='axes fraction', annotation_clip=False, fontsize=10, fontweight='bold', ha='left', va='bottom')
         t.set_bbox(dict(facecolor='white', alpha=1, edgecolor='k'))
         
@@ -356,7 +631,7 @@ def plot_field_diff(var1, var2, season=None,
         n_lvls_diff = 2*(vx_diff-vn_diff)+1
         levels_diff = np.linspace(vn_diff, vx_diff, n_lvls_diff)
         norm_diff = mpl.colors.BoundaryNorm(levels_diff, cmap_diff.N)
-        cf_diff = ax[2].pcolormesh(lons, lats, var_diff, cmap=cmap_diff, norm=norm_diff, transform=trans)
+        cf_diff = draw_field(ax[2], var_diff, cmap=cmap_diff, norm=norm_diff, fast=fast, boundaries=boundaries, trans=trans)
         t=ax[2].annotate(f'{var2_name}$-${var1_name}', xy=(0.015, 0.025), xycoords='axes fraction', annotation_clip=False, fontsize=10, fontweight='bold', ha='left', va='bottom')
         t.set_bbox(dict(facecolor='white', alpha=1, edgecolor='k'))
     else:
@@ -364,25 +639,20 @@ def plot_field_diff(var1, var2, season=None,
             vn_diff=var_diff.min()
         if vmax_diff==None:
             vx_diff=var_diff.max()
-        cf = ax[2].pcolormesh(lons, lats, var_diff, cmap=cmap_diff, vmin=vn_diff, vmax=vx_diff, transform=trans)
+        cf = draw_field(ax[2], var_diff, cmap=cmap_diff, vmin=vn_diff, vmax=vx_diff, fast=fast, boundaries=boundaries, trans=trans)
         t=ax[2].annotate(f'{var2_name}$-${var1_name}', xy=(0.015, 0.025), xycoords='axes fraction', annotation_clip=False, fontsize=10, fontweight='bold', ha='left', va='bottom')
         t.set_bbox(dict(facecolor='white', alpha=1, edgecolor='k'))
     
     for i in [0,1,2]:
         ## map & boundary info
-        # add optional masks
-        if mask != None:
-            if mask in ['land', 'Land']:
-                ax[i].add_feature(cfeature.LAND, fc=(1, 1, 1), zorder=2) # masks continents
-            if mask in ['ocean', 'Ocean']:
-                ax[i].add_feature(cfeature.OCEAN, fc=(1, 1, 1), zorder=2) # masks oceans
         # map boundaries
         if boundaries != None:
             ax[i].set_extent(boundaries, crs=trans) # clips map extent according to designated boundaries
         else:
             ax[i].set_global() # make a global map
-        # add coastlines
-        ax[i].coastlines()
+        # add optional masks & coastlines (from local Natural Earth files, see feature_funcs)
+        add_mask(ax[i], mask, (1, 1, 1)) # masks continents or oceans
+        add_coastlines(ax[i])
         # grid line specs
         gl = ax[i].gridlines(crs=trans,
                              lw=.5,
@@ -393,8 +663,8 @@ def plot_field_diff(var1, var2, season=None,
                              draw_labels=True)
         gl.top_labels=False
         gl.right_labels=False
-        gl.xformatter = LONGITUDE_FORMATTER
-        gl.yformatter = LATITUDE_FORMATTER
+        gl.xformatter = gridliner.LONGITUDE_FORMATTER
+        gl.yformatter = gridliner.LATITUDE_FORMATTER
         gl.xlabel_style = {'color': 'black', 'weight': 'bold'}
         gl.ylabel_style = {'color': 'black', 'weight': 'bold'}
     
@@ -429,6 +699,160 @@ def plot_field_diff(var1, var2, season=None,
     if save is True:
             plt.savefig('{}.pdf'.format(ofile),
                         dpi=None, facecolor='w', edgecolor='w',
-                        orientation='portrait', papertype=None,
+                        orientation='portrait',
                         format=None, transparent=False,
                         bbox_inches='tight', pad_inches=0.1)
+
+###
+
+class MapTemplate:
+    """
+    Reusable map for rendering many fields on the same grid (e.g. an atlas of fields x seasons x models)
+        - the projection, masks, coastlines, gridlines, label box and colorbar are set up once
+        - render() swaps the data, colormap and norm of the existing image/QuadMesh and updates the colorbar,
+          so each frame only costs the draw itself
+        - fast=True draws at display resolution (see raster_plan); the plan is worked out once for the grid
+        - save() writes the current frame to png and/or pdf
+
+    Example
+    -------
+    tmpl = MapTemplate(lons, lats)
+    for season in ['DJF', 'JJA']:
+        tmpl.render(prec, season=season, field='prec', label=f'prec {season}')
+        tmpl.save(f'prec_{season}', formats=('png', 'pdf'))
+    """
+    def __init__(self, lons, lats, proj=None, boundaries=None, mask=None, mask_color='w',
+                 cbar=True, figsize=(9, 6), dpi=150, fast=True):
+        """
+        Parameters
+        ----------
+        lons, lats : 1D (or 2D) coordinates of the grid every rendered field is on (see get_xy_coords)
+        proj : cartopy projection for the map (default PlateCarree)
+        boundaries : [lon_min, lon_max, lat_min, lat_max] map extent (default global)
+        mask : 'land' or 'ocean' to cover with mask_color
+        cbar : add a vertical colorbar on the right
+        figsize, dpi : figure size [inches] and resolution for png output
+        fast : block-average high-resolution grids to display resolution and draw them as an image
+        """
+        self.trans = ccrs.PlateCarree()
+        self.shape = (np.shape(lats)[0], np.shape(lons)[-1]) if np.ndim(lons) == 1 else np.shape(lons)
+        self.dpi = dpi
+        self.fig = plt.figure(figsize=figsize)
+        self.ax = plt.subplot(111, projection=proj if proj is not None else ccrs.PlateCarree())
+        ax = self.ax
+
+        ### +++ MAP & BOUNDARY INFO +++ ###
+        if boundaries is not None:
+            ax.set_extent(boundaries, crs=self.trans) # clips map extent according to designated boundaries
+        else:
+            ax.set_global() # make a global map
+        add_mask(ax, mask, mask_color) # masks continents or oceans
+        add_coastlines(ax)
+        gl = ax.gridlines(crs=self.trans, lw=.5, colors='black', alpha=1.0, linestyle='--', zorder=10, draw_labels=True)
+        gl.top_labels=False
+        gl.right_labels=False
+        gl.xformatter = gridliner.LONGITUDE_FORMATTER
+        gl.yformatter = gridliner.LATITUDE_FORMATTER
+        gl.xlabel_style = {'color': 'black', 'weight': 'bold'}
+        gl.ylabel_style = {'color': 'black', 'weight': 'bold'}
+        # the extent never changes, so the gridlines & labels only need to be laid out on the first draw
+        # (cartopy otherwise recomputes them on every save)
+        if hasattr(gl, '_auto_update'):
+            gl._auto_update = False
+        self.gridliner = gl
+
+        ### +++ EMPTY MESH, LABEL & COLORBAR +++ ###
+        # the mesh geometry is fixed here; render() only changes its values & colors
+        if fast:
+            self.plan = raster_plan(ax, lons, lats, dpi=dpi, boundaries=boundaries)
+            self.mesh = _plan_artist(ax, self.plan, apply_plan(self.plan, np.full(self.shape, np.nan)),
+                                     cmap='viridis', vmin=0, vmax=1, trans=self.trans)
+        else:
+            self.plan = None
+            self.mesh = ax.pcolormesh(np.asarray(lons), np.asarray(lats), np.ma.masked_all(self.shape),
+                                      cmap='viridis', vmin=0, vmax=1, transform=self.trans)
+        self.label = ax.annotate('', xy=(0.015, 0.025), xycoords='axes fraction', annotation_clip=False,
+                                 fontsize=12, fontweight='bold', ha='left', va='bottom', zorder=100)
+        self.label.set_bbox(dict(facecolor='white', alpha=1, edgecolor='k'))
+        self.cbar = None
+        if cbar==True:
+            self.cbar = plt.colorbar(self.mesh, extend='both', orientation='vertical', shrink=0.5,
+                                     location='right', pad=0.01, ax=ax)
+
+    def _set_style(self, cmap, norm):
+        """
+        Apply a colormap & norm to the mesh, including the cells cartopy splits off at the map edge
+        """
+        for artist in [self.mesh, getattr(self.mesh, '_wrapped_collection_fix', None)]:
+            if artist is not None:
+                artist.set_cmap(cmap)
+                artist.set_norm(norm)
+
+    def render(self, var, season='ann', field=None, diff=False, cmap=None, vmin=None, vmax=None, lvls=21,
+               label=None, units=None):
+        """
+        Draw a new field into the template
+
+        Parameters
+        ----------
+        var : DataArray on the template grid (monthly climatology if season is given)
+        season : season/annual mean to plot (see seasonal_climatology); None to plot var as is
+        field, diff : preset colormap & bounds from get_settings (as in quick_map)
+        cmap, vmin, vmax, lvls : explicit colormap & levels, used when field is None
+                                 (vmin/vmax default to the data range)
+        label : text in the label box (default var.name)
+        units : colorbar label (default var.attrs['units'])
+        """
+        var_avg = seasonal_climatology(var, season) if season is not None else var
+        lons, lats = get_xy_coords(var_avg)
+        data = np.ma.masked_invalid(np.asarray(var_avg.transpose(lats.dims[0], lons.dims[-1]).values))
+        if data.shape != self.shape:
+            raise ValueError(f'field shape {data.shape} does not match the template grid {self.shape}')
+
+        ### +++ COLORMAP INFO +++ ###
+        if field is not None:
+            cmap, vmin, vmax, cf = get_settings(field=field, diff=diff)
+            norm = cf.norm
+        else:
+            if cmap is None:
+                cmap = plt.colormaps['RdBu'] if data.min() < 0 else plt.colormaps['viridis_r']
+            elif isinstance(cmap, str):
+                cmap = plt.colormaps[cmap]
+            vmin = float(data.min()) if vmin is None else vmin
+            vmax = float(data.max()) if vmax is None else vmax
+            norm = get_norm(vmin, vmax, lvls, cmap.N)
+
+        ### +++ SWAP DATA, COLORS & LABELS +++ ###
+        if self.plan is None:
+            self.mesh.set_array(data)
+        elif self.plan['mode'] == 'image':
+            self.mesh.set_data(apply_plan(self.plan, data))
+        else:
+            self.mesh.set_array(apply_plan(self.plan, data))
+        self._set_style(cmap, norm)
+        self.label.set_text(var_avg.name if label is None else label)
+        if self.cbar is not None:
+            self.cbar.update_normal(self.mesh)
+            if units is None:
+                units = var.attrs.get('units')
+            self.cbar.set_label('['+units+']' if units else '', labelpad=15, rotation=270, fontweight='bold', ha='center')
+            self.cbar.ax.tick_params(labelsize=10)
+            for tick in self.cbar.ax.yaxis.get_major_ticks():
+                tick.label2.set_fontweight('bold')
+            self.cbar.ax.minorticks_off()
+        return(self)
+
+    def save(self, ofile, formats=('pdf',), tight=True):
+        """
+        Save the current frame as ofile.<format> for each format (e.g. ('png', 'pdf'))
+            - tight=False skips the extra layout pass of bbox_inches='tight' (faster, fixed page size)
+        """
+        for fmt in formats:
+            self.fig.savefig('{}.{}'.format(ofile, fmt), dpi=self.dpi, facecolor='w', edgecolor='w',
+                             bbox_inches='tight' if tight else None, pad_inches=0.1)
+
+    def close(self):
+        """
+        Close the figure when the template is no longer needed
+        """
+        plt.close(self.fig)
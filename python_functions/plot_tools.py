@@ -3,24 +3,17 @@ sys.dont_write_bytecode = True
 
 import xarray as xr
 import numpy as np
-import metpy.calc as mp
 from misc_functions import *
+from data_funcs import seasonal_climatology
+from feature_funcs import add_coastlines, add_mask
 
-import cartopy
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from shapely.geometry.polygon import LinearRing
+from lazy_imports import lazy_import
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import matplotlib.ticker as mticker
-from matplotlib import cm
-from matplotlib.colors import ListedColormap,LinearSegmentedColormap
-import cmocean
-import cmocean.cm as cmo
-import colorcet as cc
+# cartopy & matplotlib are imported on first use
+ccrs = lazy_import('cartopy.crs')
+gridliner = lazy_import('cartopy.mpl.gridliner')
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
 
 #############################
 
@@ -29,8 +22,7 @@ def plot_field(var, cmap=None, vmin=None, vmax=None, season='ann', mask=None, bo
     get_xy_coords(var) # get lat & lon coords without having to know coordinate names
     lons = x
     lats = y
-    mons = get_season(season=season) # index months to average over based on season var
-    var_avg = var[mons].mean(dim='month', keep_attrs=True) # find seasonal or annual var mean
+    var_avg = seasonal_climatology(var, season) # find seasonal or annual var mean
     
     ## initialize figure
     trans = ccrs.PlateCarree()
@@ -39,25 +31,20 @@ def plot_field(var, cmap=None, vmin=None, vmax=None, season='ann', mask=None, bo
     ax = plt.subplot(111, projection=proj)
     
     ## map & boundary info
-    # add optional masks
-    if mask != None:
-        if mask in ['land', 'Land']:
-            ax.add_feature(cfeature.LAND, fc=(1, 1, 1), zorder=2) # masks continents
-        if mask in ['ocean', 'Ocean']:
-            ax.add_feature(cfeature.OCEAN, fc=(1, 1, 1), zorder=2) # masks oceans
     # map boundaries
     if boundaries != None:
         ax.set_extent(boundaries, crs=trans) # clips map extent according to designated boundaries
     else:
         ax.set_global() # make a global map
-    # add coastlines
-    ax.coastlines()
+    # add optional masks & coastlines (from local Natural Earth files, see feature_funcs)
+    add_mask(ax, mask, (1, 1, 1)) # masks continents or oceans
+    add_coastlines(ax)
     # grid line specs
     gl = ax.gridlines(crs=trans, lw=.5, colors='black', alpha=1.0, linestyle='--', zorder=10, draw_labels=True)
     gl.top_labels=False
     gl.right_labels=False
-    gl.xformatter = LONGITUDE_FORMATTER
-    gl.yformatter = LATITUDE_FORMATTER
+    gl.xformatter = gridliner.LONGITUDE_FORMATTER
+    gl.yformatter = gridliner.LATITUDE_FORMATTER
     gl.xlabel_style = {'color': 'black', 'weight': 'bold'}
     gl.ylabel_style = {'color': 'black', 'weight': 'bold'}
         
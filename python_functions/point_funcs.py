@@ -0,0 +1,125 @@
+import sys
+sys.dont_write_bytecode = True
+
+import xarray as xr
+import numpy as np
+
+from lazy_imports import lazy_import
+from regrid_funcs import grid_fingerprint
+from data_funcs import get_xy_coords
+
+# scipy.spatial is imported on first use
+spatial = lazy_import('scipy.spatial')
+
+#############################
+# Bulk extraction of model values at point (station) locations
+#   - grid points are mapped to 3D unit vectors so distances are chordal distances on the sphere
+#     (no problems at the poles or the dateline, and any grid works: regular or curvilinear)
+#   - one KD-tree per grid, cached, answers the nearest-neighbor queries for all stations at once
+#   - values are gathered for all stations and time steps in one vectorized indexing step
+#############################
+
+# KD-trees, keyed by grid fingerprint
+_TREES = {}
+
+# mean radius of the Earth [km]
+EARTH_RADIUS_KM = 6371.
+
+###
+
+def _unit_vectors(lat, lon):
+    """
+    Convert lat/lon [degrees] into 3D unit vectors [n x 3]
+    """
+    lat = np.deg2rad(np.asarray(lat, dtype='float64')).ravel()
+    lon = np.deg2rad(np.asarray(lon, dtype='float64')).ravel()
+    return(np.column_stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)]))
+
+def grid_latlon(var):
+    """
+    Latitude & longitude of every grid point and the dimensions they span
+        - curvilinear grids (e.g. ocean model 'nav_lat'/'nav_lon') use their 2D coordinates
+        - regular grids use get_xy_coords and are expanded to 2D
+
+    Returns
+    -------
+    lat2d, lon2d : 2D arrays of grid point coordinates
+    dims : the two dimension names spanned by the grid
+    """
+    for lat_name, lon_name in [('nav_lat', 'nav_lon'), ('lat', 'lon'), ('latitude', 'longitude')]:
+        if (lat_name in var.coords) and (lon_name in var.coords) and (var[lat_name].ndim == 2):
+            lat2d, lon2d = xr.broadcast(var[lat_name], var[lon_name])
+            return(lat2d.values, lon2d.values, list(lat2d.dims))
+    lons, lats = get_xy_coords(var)
+    lon2d, lat2d = np.meshgrid(lons.values, lats.values)
+    return(lat2d, lon2d, [lats.dims[0], lons.dims[0]])
+
+def get_tree(lat2d, lon2d):
+    """
+    KD-tree over the unit vectors of a grid, built once per grid and cached
+    """
+    key = grid_fingerprint(lat2d, lon2d, tag='kdtree')
+    if key not in _TREES:
+        xyz = _unit_vectors(lat2d, lon2d)
+        # grid points with missing coordinates are moved far away from the unit sphere
+        xyz[~np.isfinite(xyz).all(axis=1)] = 10.
+        _TREES[key] = spatial.cKDTree(xyz)
+    return(_TREES[key])
+
+def extract_points(var, lats, lons, method='nearest', k=4, power=2, station_dim='station'):
+    """
+    Extract values at many point locations (e.g. stations) from gridded data in one step
+        - replaces calling grid.sel(x=x_t, y=y_t, method='nearest') once per station
+        - all other dimensions (time, month, level, ...) are kept
+
+    Parameters
+    ----------
+    var : DataArray on a regular or curvilinear lat/lon grid
+    lats, lons : 1D arrays of point latitudes & longitudes (either longitude convention)
+    method : 'nearest' for the nearest grid point, or 'idw' for an inverse-distance-weighted
+             average of the k nearest grid points
+    k : number of neighbors for 'idw'
+    power : distance exponent for 'idw'
+    station_dim : name of the new point dimension
+
+    Returns
+    -------
+    DataArray with station_dim in place of the grid dimensions, with the point lat/lon, the matched
+    grid point lat/lon ('nearest'), and the distance to the nearest grid point [km] as coordinates
+    """
+    lat2d, lon2d, dims = grid_latlon(var)
+    tree = get_tree(lat2d, lon2d)
+    lats = np.atleast_1d(np.asarray(lats, dtype='float64'))
+    lons = np.atleast_1d(np.asarray(lons, dtype='float64'))
+    n_nbr = 1 if method == 'nearest' else k
+    dist, flat = tree.query(_unit_vectors(lats, lons), k=n_nbr)
+    # chordal distance -> great circle distance [km]
+    dist = 2*np.arcsin(np.clip(dist/2., 0., 1.))*EARTH_RADIUS_KM
+
+    if method == 'nearest':
+        iy, ix = np.unravel_index(flat, lat2d.shape)
+        points = var.isel({dims[0]: xr.DataArray(iy, dims=[station_dim]),
+                           dims[1]: xr.DataArray(ix, dims=[station_dim])})
+        points = points.drop_vars([c for c in points.coords if station_dim in points[c].dims], errors='ignore')
+        points = points.assign_coords({'grid_lat': (station_dim, lat2d.ravel()[flat]),
+                                       'grid_lon': (station_dim, lon2d.ravel()[flat]),
+                                       'distance': (station_dim, dist)})
+    elif method == 'idw':
+        iy, ix = np.unravel_index(flat, lat2d.shape)
+        nbrs = var.isel({dims[0]: xr.DataArray(iy, dims=[station_dim, 'neighbor']),
+                         dims[1]: xr.DataArray(ix, dims=[station_dim, 'neighbor'])})
+        nbrs = nbrs.drop_vars([c for c in nbrs.coords if station_dim in nbrs[c].dims], errors='ignore')
+        with np.errstate(divide='ignore'):
+            wgts = 1./np.maximum(dist, 1e-6)**power
+        wgts = xr.DataArray(wgts, dims=[station_dim, 'neighbor'])
+        # skip missing neighbors (e.g. land points of an ocean field) and renormalize the weights
+        valid = nbrs.notnull()
+        points = (nbrs.fillna(0)*wgts).sum('neighbor')/(valid*wgts).sum('neighbor')
+        points.attrs = var.attrs
+        points.name = var.name
+        points = points.assign_coords({'distance': (station_dim, dist[:,0])})
+    else:
+        raise ValueError(f"unknown point extraction method '{method}'")
+
+    points = points.assign_coords({'lat': (station_dim, lats), 'lon': (station_dim, lons)})
+    return(points)
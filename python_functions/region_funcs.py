@@ -0,0 +1,137 @@
+import sys
+sys.dont_write_bytecode = True
+
+import xarray as xr
+import numpy as np
+import scipy.sparse as sps
+
+from lazy_imports import lazy_import
+from regrid_funcs import cell_bounds, grid_fingerprint, sparse_dot
+from data_funcs import get_xy_coords, grid_cell_area
+
+# only needed for polygon regions
+mpath = lazy_import('matplotlib.path')
+
+#############################
+# Regional means from a sparse [region x grid cell] matrix
+#   - each row holds the area of every grid cell that falls in the region (times the fraction covered)
+#   - the matrix is built once per (grid, set of regions) and reused for every variable/model
+#   - means for all regions and all time steps are one sparse-dense multiply
+#############################
+
+# region matrices, keyed by grid + region fingerprint
+_REGIONS = {}
+
+###
+
+def _box_fraction(edges, lo, hi, periodic=False):
+    """
+    Fraction of each 1D cell [edges[i], edges[i+1]] covered by the interval [lo, hi]
+        - periodic axes (longitude) allow intervals that cross 0° or 180° (lo > hi after wrapping)
+    """
+    e_lo = np.minimum(edges[:-1], edges[1:])
+    e_hi = np.maximum(edges[:-1], edges[1:])
+    width = e_hi - e_lo
+    if periodic:
+        # move the interval to start in [0, 360); a full 360° span stays a full span
+        span = (hi - lo) % 360.
+        if span == 0 and hi != lo:
+            span = 360.
+        lo = lo % 360.
+        hi = lo + span
+        cover = sum(np.clip(np.minimum(e_hi, hi+shift) - np.maximum(e_lo, lo+shift), 0., None)
+                    for shift in (-720., -360., 0., 360.))
+    else:
+        cover = np.clip(np.minimum(e_hi, hi) - np.maximum(e_lo, lo), 0., None)
+    return(np.clip(cover/width, 0., 1.))
+
+def _mask_scale(spec):
+    """
+    Factor that converts a fractional mask to 0-1: 0.01 when its units attribute is percent (e.g. CMIP sftlf)
+    """
+    if isinstance(spec, xr.DataArray) and str(spec.attrs.get('units', '')).strip().lower() in ['%', 'percent']:
+        return(0.01)
+    return(1.)
+
+def _region_weights(spec, lat, lon):
+    """
+    [lat x lon] fraction of each grid cell inside one region
+        - box [lon_min, lon_max, lat_min, lat_max]: exact fractional coverage of each cell
+        - polygon [(lon, lat), ...]: cells whose centers fall inside the polygon
+        - DataArray on the grid: fractional mask (e.g. land fraction); masks with units of '%' or 'percent'
+          are scaled to 0-1
+    """
+    if isinstance(spec, xr.DataArray):
+        frac = np.asarray(spec.transpose(lat.name, lon.name).values, dtype='float64')
+        frac = np.nan_to_num(frac)*_mask_scale(spec)
+        if frac.max() > 1. + 1e-6:
+            raise ValueError("fractional mask has values above 1; set its units attribute to '%' if it is in percent")
+        return(frac)
+    spec = np.asarray(spec, dtype='float64')
+    if spec.ndim == 1 and spec.size == 4:
+        lon_min, lon_max, lat_min, lat_max = spec
+        lat_frac = _box_fraction(cell_bounds(lat, lat=True), lat_min, lat_max)
+        lon_frac = _box_fraction(cell_bounds(lon), lon_min, lon_max, periodic=True)
+        return(np.outer(lat_frac, lon_frac))
+    if spec.ndim == 2 and spec.shape[1] == 2:
+        path = mpath.Path(spec)
+        lon2d, lat2d = np.meshgrid(np.asarray(lon, dtype='float64'), np.asarray(lat, dtype='float64'))
+        inside = np.zeros(lon2d.size, dtype=bool)
+        # test the cell centers in both longitude conventions
+        for shift in (-360., 0., 360.):
+            inside |= path.contains_points(np.column_stack([lon2d.ravel()+shift, lat2d.ravel()]))
+        return(inside.reshape(lon2d.shape).astype('float64'))
+    raise ValueError('regions must be boxes [lon_min, lon_max, lat_min, lat_max], '
+                     'polygons [(lon, lat), ...], or fractional masks on the grid')
+
+def region_matrix(regions, lat, lon):
+    """
+    Sparse [region x grid cell] matrix of area weights, built once per grid and set of regions
+        - grid cells are flattened in (lat, lon) order
+        - rows are not normalized; region_mean divides by the area of the valid cells in each region
+
+    Parameters
+    ----------
+    regions : dict of region name -> box, polygon, or fractional mask (see _region_weights)
+    lat, lon : latitude & longitude coordinates of the grid (DataArrays)
+    """
+    specs = [regions[name] for name in regions]
+    key = grid_fingerprint(lat, lon, *[np.asarray(s, dtype='float64').ravel() for s in specs],
+                           tag='regions'+repr(list(regions))+repr([_mask_scale(s) for s in specs]))
+    if key not in _REGIONS:
+        area = np.asarray(grid_cell_area(lat, lon).values)
+        rows = [sps.csr_matrix((area*_region_weights(spec, lat, lon)).ravel()) for spec in specs]
+        matrix = sps.vstack(rows, format='csr')
+        matrix.eliminate_zeros()
+        _REGIONS[key] = matrix
+    return(_REGIONS[key])
+
+def region_mean(var, regions):
+    """
+    Area-weighted means of a field over many regions at once
+        - one sparse matrix multiply covers all regions and all time steps / months / levels
+        - missing values (e.g. land/ocean masked data) are skipped and the area weights renormalized
+        - works lazily on dask-backed arrays (one chunk along lat & lon)
+
+    Parameters
+    ----------
+    var : DataArray with lat & lon dimensions
+    regions : dict of region name -> box [lon_min, lon_max, lat_min, lat_max] (same order as the map
+              'boundaries' argument), polygon [(lon, lat), ...], or fractional mask DataArray on the grid
+
+    Returns
+    -------
+    DataArray with a 'region' dimension in place of lat & lon
+    """
+    lons, lats = get_xy_coords(var)
+    matrix = region_matrix(regions, lats, lons)
+    means = xr.apply_ufunc(sparse_dot, var,
+                           kwargs={'weights': matrix, 'shape_out': (len(regions),)},
+                           input_core_dims=[[lats.name, lons.name]],
+                           output_core_dims=[['region']],
+                           dask='parallelized',
+                           dask_gufunc_kwargs={'output_sizes': {'region': len(regions)}},
+                           output_dtypes=[np.result_type(var.dtype, np.float64)],
+                           keep_attrs=True)
+    means = means.assign_coords(region=list(regions))
+    return(means)
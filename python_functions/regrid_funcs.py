@@ -0,0 +1,353 @@
+import os
+import sys
+sys.dont_write_bytecode = True
+import glob
+import shutil
+import hashlib
+import time
+
+import xarray as xr
+import numpy as np
+import scipy.sparse as sps
+
+#############################
+# Regridding engine for regular (rectilinear) lat/lon grids
+#   - weights are built once per (source grid, target grid, method) and stored as a sparse matrix
+#   - the lat and lon weights are separable, so the 2D matrix is the kronecker product of two 1D matrices
+#   - applying the weights to any number of fields/time steps is one sparse-dense multiply
+#   - weights are also saved to disk, keyed by a fingerprint of the grid coordinates, so later
+#     sessions and batch jobs load them (memory-mapped) instead of recomputing them
+#############################
+
+# in-memory store of weight matrices, keyed by grid fingerprint
+_WEIGHTS = {}
+
+# on-disk weight cache (override with the REGRID_CACHE_DIR / REGRID_CACHE_MAX_MB environment variables)
+CACHE_DIR = os.environ.get('REGRID_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'regrid_weights'))
+CACHE_MAX_BYTES = int(float(os.environ.get('REGRID_CACHE_MAX_MB', 2048))*1024**2)
+# temporary entries younger than this are never evicted (another job may still be writing them)
+TMP_GRACE_SECONDS = 600.
+
+###
+
+def cell_bounds(centers, lat=False):
+    """
+    Infer grid cell edges from cell centers (midpoints between neighboring centers)
+
+    Parameters
+    ----------
+    centers : 1D array of cell center coordinates (monotonic)
+    lat : if True, clip the outer edges to the poles
+    """
+    c = np.asarray(centers, dtype='float64')
+    if c.size == 1:
+        edges = np.array([c[0]-0.5, c[0]+0.5])
+    else:
+        mid = 0.5*(c[1:]+c[:-1])
+        edges = np.concatenate([[2*c[0]-mid[0]], mid, [2*c[-1]-mid[-1]]])
+    if lat:
+        edges = np.clip(edges, -90., 90.)
+    return(edges)
+
+###
+
+def _overlap(lo_out, hi_out, lo_in, hi_in):
+    """
+    Length of the overlap between every pair of target and source intervals [n_out x n_in]
+    """
+    lo = np.maximum(lo_out[:,None], lo_in[None,:])
+    hi = np.minimum(hi_out[:,None], hi_in[None,:])
+    return(np.clip(hi-lo, 0., None))
+
+def _conservative_1d(src, dst, lat=False):
+    """
+    1D first-order conservative weights [n_out x n_in]
+        - latitude overlaps are measured in sin(lat) so that they are proportional to cell area
+        - longitude overlaps are periodic (source cells are also tested shifted by +/-360°)
+    """
+    e_in = cell_bounds(src, lat=lat)
+    e_out = cell_bounds(dst, lat=lat)
+    lo_in, hi_in = np.minimum(e_in[:-1], e_in[1:]), np.maximum(e_in[:-1], e_in[1:])
+    lo_out, hi_out = np.minimum(e_out[:-1], e_out[1:]), np.maximum(e_out[:-1], e_out[1:])
+    if lat:
+        w = _overlap(*[np.sin(np.deg2rad(e)) for e in (lo_out, hi_out, lo_in, hi_in)])
+    else:
+        w = sum(_overlap(lo_out, hi_out, lo_in+shift, hi_in+shift) for shift in (-360., 0., 360.))
+    return(w)
+
+def _bilinear_1d(src, dst, periodic=False):
+    """
+    1D linear interpolation weights [n_out x n_in]
+        - target points outside of the source range get no weight (NaN after normalization)
+        - periodic axes (longitude) wrap around 360°
+    """
+    src = np.asarray(src, dtype='float64')
+    dst = np.asarray(dst, dtype='float64')
+    order = np.argsort(src)
+    s = src[order]
+    if periodic:
+        # pad the sorted source coordinate with its wrapped neighbors
+        s = np.concatenate([[s[-1]-360.], s, [s[0]+360.]])
+        order = np.concatenate([[order[-1]], order, [order[0]]])
+        dst = (dst-s[0]) % 360. + s[0]
+    w = np.zeros((dst.size, src.size))
+    i = np.clip(np.searchsorted(s, dst)-1, 0, s.size-2)
+    frac = (dst-s[i])/(s[i+1]-s[i])
+    inside = (frac >= 0) & (frac <= 1)
+    rows = np.arange(dst.size)[inside]
+    np.add.at(w, (rows, order[i[inside]]), 1-frac[inside])
+    np.add.at(w, (rows, order[i[inside]+1]), frac[inside])
+    return(w)
+
+def _nearest_1d(src, dst, periodic=False):
+    """
+    1D nearest neighbor weights [n_out x n_in]
+    """
+    src = np.asarray(src, dtype='float64')
+    dst = np.asarray(dst, dtype='float64')
+    dist = np.abs(dst[:,None]-src[None,:])
+    if periodic:
+        dist = np.minimum(dist % 360., 360.-(dist % 360.))
+    w = np.zeros((dst.size, src.size))
+    w[np.arange(dst.size), np.argmin(dist, axis=1)] = 1.
+    return(w)
+
+###
+
+def build_weights(lat_in, lon_in, lat_out, lon_out, method='conservative'):
+    """
+    Build a sparse [n_out x n_in] regridding matrix between two rectilinear lat/lon grids
+        - grid points are flattened in (lat, lon) order
+        - rows are not normalized here; apply_weights divides by the weight of valid source cells
+
+    Parameters
+    ----------
+    lat_in, lon_in : 1D coordinates of the source grid
+    lat_out, lon_out : 1D coordinates of the target grid
+    method : 'conservative', 'bilinear', or 'nearest'
+    """
+    if method in ['conservative', 'conserve']:
+        w_lat = _conservative_1d(lat_in, lat_out, lat=True)
+        w_lon = _conservative_1d(lon_in, lon_out)
+    elif method in ['bilinear', 'linear']:
+        w_lat = _bilinear_1d(lat_in, lat_out)
+        w_lon = _bilinear_1d(lon_in, lon_out, periodic=True)
+    elif method in ['nearest', 'nearest_s2d']:
+        w_lat = _nearest_1d(lat_in, lat_out)
+        w_lon = _nearest_1d(lon_in, lon_out, periodic=True)
+    else:
+        raise ValueError(f"unknown regridding method '{method}'")
+    weights = sps.kron(sps.csr_matrix(w_lat), sps.csr_matrix(w_lon), format='csr')
+    weights.eliminate_zeros()
+    return(weights)
+
+def grid_fingerprint(*coords, tag=''):
+    """
+    Hash a set of coordinate arrays into a short fingerprint that identifies a grid (or grid pair)
+        - coordinates are compared as float64 values, so the same grid gives the same fingerprint
+          regardless of the coordinate names or dtype on file
+
+    Parameters
+    ----------
+    coords : coordinate arrays (numpy arrays or DataArrays)
+    tag : extra string mixed into the hash (e.g. the regridding method)
+    """
+    h = hashlib.sha1(tag.encode())
+    for c in coords:
+        c = np.ascontiguousarray(c, dtype='float64')
+        h.update(str(c.shape).encode())
+        h.update(c.tobytes())
+    return(h.hexdigest()[:20])
+
+###
+
+def _cache_size(cache_dir):
+    """
+    Total size in bytes of all weight files in the cache directory
+    """
+    return(sum(os.path.getsize(f) for f in glob.glob(os.path.join(cache_dir, '*', '*.npy'))))
+
+def _being_written(entry, grace=TMP_GRACE_SECONDS):
+    """
+    True for a temporary entry ('<key>.tmp<pid>') that another save_weights may still be writing:
+    younger than the grace period (the writer may be on another node) or owned by a live process
+    """
+    head, sep, pid = os.path.basename(entry).rpartition('.tmp')
+    if not sep or not pid.isdigit():
+        return(False)
+    try:
+        if time.time() - os.path.getmtime(entry) < grace:
+            return(True)
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return(False)
+    except OSError:
+        # the directory vanished (renamed into place) or the process belongs to another user
+        return(os.path.isdir(entry))
+    return(True)
+
+def _evict(cache_dir, max_bytes):
+    """
+    Delete the least recently used weight entries until the cache is under its size cap
+        - each entry's directory mtime is bumped whenever it is read, so mtime order is LRU order
+        - temporary directories still being written by another task are left alone
+    """
+    entries = [e for e in glob.glob(os.path.join(cache_dir, '*')) if not _being_written(e)]
+    entries = sorted(entries, key=os.path.getmtime)
+    size = _cache_size(cache_dir)
+    while entries and size > max_bytes:
+        entry = entries.pop(0)
+        size -= sum(os.path.getsize(f) for f in glob.glob(os.path.join(entry, '*.npy')))
+        shutil.rmtree(entry, ignore_errors=True)
+
+def save_weights(weights, key, cache_dir=None, max_bytes=None):
+    """
+    Write a sparse weight matrix to the on-disk cache as plain .npy arrays (CSR data/indices/indptr)
+        - indices & indptr share one integer dtype (int32 unless the matrix is too large), so scipy can use
+          the memory-mapped arrays as they are when loading
+        - files are written to a temporary directory first so a crashed job never leaves a partial entry
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+    tmp = f'{entry}.tmp{os.getpid()}'
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, 'data.npy'), weights.data)
+    idx_dtype = 'int32' if max(weights.nnz, *weights.shape) < np.iinfo('int32').max else 'int64'
+    np.save(os.path.join(tmp, 'indices.npy'), weights.indices.astype(idx_dtype, copy=False))
+    np.save(os.path.join(tmp, 'indptr.npy'), weights.indptr.astype(idx_dtype, copy=False))
+    np.save(os.path.join(tmp, 'shape.npy'), np.asarray(weights.shape, dtype='int64'))
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # another task wrote the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+    _evict(cache_dir, max_bytes)
+
+def load_weights(key, cache_dir=None):
+    """
+    Load a weight matrix from the on-disk cache, memory-mapped, or return None if it is not cached
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    entry = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry):
+        return(None)
+    try:
+        arrs = {name: np.load(os.path.join(entry, f'{name}.npy'), mmap_mode='r')
+                for name in ['data', 'indices', 'indptr', 'shape']}
+    except (OSError, ValueError):
+        return(None)
+    # mark the entry as recently used
+    os.utime(entry)
+    weights = sps.csr_matrix((arrs['data'], arrs['indices'], arrs['indptr']),
+                             shape=tuple(arrs['shape']), copy=False)
+    return(weights)
+
+###
+
+def get_weights(lat_in, lon_in, lat_out, lon_out, method='conservative', disk=True):
+    """
+    Return the weight matrix for a grid pair, building it only the first time the pair is seen
+        - looks in memory first, then in the on-disk cache, and only then computes the weights
+
+    Parameters
+    ----------
+    lat_in, lon_in : 1D coordinates of the source grid
+    lat_out, lon_out : 1D coordinates of the target grid
+    method : 'conservative', 'bilinear', or 'nearest'
+    disk : if True, read/write the weights from/to CACHE_DIR
+    """
+    key = grid_fingerprint(lat_in, lon_in, lat_out, lon_out, tag=method)
+    if key in _WEIGHTS:
+        return(_WEIGHTS[key])
+    weights = load_weights(key) if disk else None
+    if weights is None:
+        weights = build_weights(lat_in, lon_in, lat_out, lon_out, method=method)
+        if disk:
+            try:
+                save_weights(weights, key)
+            except OSError:
+                # a read-only or full cache directory should not stop the regridding
+                pass
+    _WEIGHTS[key] = weights
+    return(weights)
+
+def clear_weights(disk=False):
+    """
+    Empty the in-memory weight store (and optionally the on-disk cache)
+    """
+    _WEIGHTS.clear()
+    if disk:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+###
+
+def sparse_dot(data, weights, shape_out):
+    """
+    Multiply the trailing (lat, lon) axes of a numpy array by a weight matrix
+        - all leading axes (time, month, level, ...) are batched into a single sparse-dense product
+        - missing values are skipped and the weights renormalized over the valid source cells
+    """
+    lead = data.shape[:-2]
+    flat = data.reshape(-1, data.shape[-2]*data.shape[-1]).T
+    valid = np.isfinite(flat)
+    num = weights @ np.where(valid, flat, 0.)
+    if valid.all():
+        den = np.asarray(weights.sum(axis=1))
+    else:
+        den = weights @ valid.astype(flat.dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.where(den > 0, num/den, np.nan)
+    return(out.T.reshape(lead+shape_out))
+
+def apply_weights(var, weights, lat_name, lon_name, lat_out, lon_out):
+    """
+    Regrid an xarray DataArray with a precomputed weight matrix
+        - works lazily on dask-backed arrays (one chunk along lat & lon)
+
+    Parameters
+    ----------
+    var : data array to regrid
+    weights : sparse matrix from get_weights
+    lat_name, lon_name : names of the horizontal dimensions of var
+    lat_out, lon_out : target grid coordinates (DataArrays or 1D arrays)
+    """
+    lat_out = xr.DataArray(lat_out, dims=[lat_name]) if not isinstance(lat_out, xr.DataArray) else lat_out
+    lon_out = xr.DataArray(lon_out, dims=[lon_name]) if not isinstance(lon_out, xr.DataArray) else lon_out
+    shape_out = (lat_out.size, lon_out.size)
+    # temporary core dimension names for the output grid
+    out_dims = ['__lat_out', '__lon_out']
+    regridded = xr.apply_ufunc(sparse_dot, var,
+                               kwargs={'weights': weights, 'shape_out': shape_out},
+                               input_core_dims=[[lat_name, lon_name]],
+                               output_core_dims=[out_dims],
+                               exclude_dims={lat_name, lon_name},
+                               dask='parallelized',
+                               dask_gufunc_kwargs={'output_sizes': dict(zip(out_dims, shape_out))},
+                               output_dtypes=[np.result_type(var.dtype, np.float64)],
+                               keep_attrs=True)
+    regridded = regridded.rename({out_dims[0]: lat_out.name or lat_name,
+                                  out_dims[1]: lon_out.name or lon_name})
+    regridded = regridded.assign_coords({lat_out.name or lat_name: lat_out.values,
+                                         lon_out.name or lon_name: lon_out.values})
+    # restore the original dimension order
+    dims = [{lat_name: lat_out.name or lat_name, lon_name: lon_out.name or lon_name}.get(d, d) for d in var.dims]
+    return(regridded.transpose(*dims))
+
+def regrid(var, lat_in, lon_in, lat_out, lon_out, method='conservative', disk=True):
+    """
+    Regrid a data array from its own grid to a target grid
+        - weights are cached, so regridding many variables/seasons onto the same grid only builds them once
+
+    Parameters
+    ----------
+    var : data array to regrid
+    lat_in, lon_in : latitude & longitude coordinates of var (DataArrays)
+    lat_out, lon_out : latitude & longitude coordinates of the target grid (DataArrays)
+    method : 'conservative', 'bilinear', or 'nearest'
+    disk : if True, reuse weights saved by earlier sessions/jobs from the on-disk cache
+    """
+    weights = get_weights(lat_in, lon_in, lat_out, lon_out, method=method, disk=disk)
+    return(apply_weights(var, weights, lat_in.name, lon_in.name, lat_out, lon_out))
@@ -1,29 +1,342 @@
 import os
 import sys
+import warnings
 import xarray as xr
-import netCDF4 as nc
 import numpy as np
-import metpy.calc as mp
-from scipy.stats import ttest_ind, ttest_rel
 from datetime import datetime
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from lazy_imports import lazy_import
+from data_funcs import season_weights
+
+# scipy.stats/special are imported on first use
+stats = lazy_import('scipy.stats')
+special = lazy_import('scipy.special')
 
 #############################
 
-def sigtest(yearmean1,yearmean2,timemean1,timemean2):
+def _moments(x, dim, shift):
+	"""
+	Sample size, mean, and variance along dim from running sums in float64
+		- sums are taken of (x - shift) to avoid cancellation when the mean is large relative to the spread
+		- missing values are skipped; on dask arrays each sum is reduced chunk by chunk
+	"""
+	x = x.astype('float64') - shift
+	n = x.notnull().sum(dim=dim)
+	s1 = x.sum(dim=dim, skipna=True)
+	s2 = (x**2).sum(dim=dim, skipna=True)
+	mean = s1/n
+	var = (s2 - s1*mean)/(n-1)
+	return n, mean + shift, var.clip(min=0)
+
+def _t_pvalue(t, df):
+	"""
+	Two-sided p-value of a t statistic, applied element-wise (lazily on dask arrays)
+	"""
+	return xr.apply_ufunc(lambda t, df: 2*special.stdtr(df, -np.abs(t)), t, df, dask='parallelized', output_dtypes=[np.float64])
+
+def ttest_paired(x1, x2, dim='year'):
+	"""
+	Paired t-test of two xarray samples along dim (equivalent to scipy.stats.ttest_rel, but NaN-aware)
+
+	Returns
+	-------
+	t statistic and two-sided p-value as DataArrays
+	"""
+	d = x1 - x2
+	n, mean, var = _moments(d, dim, d.isel({dim: 0}).fillna(0).astype('float64'))
+	t = mean/np.sqrt(var/n)
+	return t, _t_pvalue(t, n-1).where(n > 1)
+
+def ttest_welch(x1, x2, dim='year'):
+	"""
+	Welch's (unequal variance) t-test of two xarray samples along dim
+	(equivalent to scipy.stats.ttest_ind with equal_var=False, but NaN-aware)
+
+	Returns
+	-------
+	t statistic and two-sided p-value as DataArrays
+	"""
+	shift = x1.isel({dim: 0}).fillna(0).astype('float64')
+	n1, mean1, var1 = _moments(x1, dim, shift)
+	n2, mean2, var2 = _moments(x2, dim, shift)
+	se1 = var1/n1
+	se2 = var2/n2
+	t = (mean1 - mean2)/np.sqrt(se1 + se2)
+	# Welch-Satterthwaite degrees of freedom
+	df = (se1 + se2)**2/(se1**2/(n1-1) + se2**2/(n2-1))
+	return t, _t_pvalue(t, df).where((n1 > 1) & (n2 > 1))
+
+def significance_mask(pvals, alpha=0.1, method='pointwise', dims=None):
+	"""
+	Boolean mask of significant grid points from a field of p-values
+		- 'pointwise': p <= alpha at each point (the old behavior, overstates significance on large grids)
+		- 'fdr': Benjamini-Hochberg false discovery rate control at level alpha
+		- 'wilks': FDR with alpha_FDR = 2*alpha, which Wilks (2016) shows controls the global (field)
+		  significance level at alpha for strongly spatially autocorrelated fields
+		- every stack (season, source_id, ...) is corrected separately, all in one vectorized sort
+
+	Parameters
+	----------
+	pvals : DataArray of p-values
+	alpha : significance level (global level for 'fdr' and 'wilks')
+	method : 'pointwise', 'fdr', or 'wilks'
+	dims : spatial dimensions making up one field (default: the last two dimensions, e.g. lat & lon)
+
+	Returns
+	-------
+	mask : boolean DataArray, True where significant; the p-value cutoff of each field is stored in
+	       mask.attrs['p_threshold'] (NaN if nothing passes) and whether each field is significant anywhere in mask.attrs['field_significant']
+	"""
+	if method in [None, 'pointwise']:
+		mask = pvals <= alpha
+		mask.attrs = {'p_threshold': alpha, 'method': 'pointwise'}
+		return mask
+	if method == 'fdr':
+		alpha_fdr = alpha
+	elif method == 'wilks':
+		alpha_fdr = 2*alpha
+	else:
+		raise ValueError(f"unknown significance method '{method}'")
+
+	dims = list(pvals.dims[-2:]) if dims is None else list(dims)
+	stack_dims = [d for d in pvals.dims if d not in dims]
+	p = pvals.transpose(*stack_dims, *dims)
+	stack_shape = p.shape[:len(stack_dims)]
+	flat = np.asarray(p.values, dtype='float64').reshape(int(np.prod(stack_shape)), -1)
+	# one sort per field (NaNs sort to the end and are not counted as tests)
+	p_sorted = np.sort(flat, axis=1)
+	n_tests = np.isfinite(flat).sum(axis=1, keepdims=True)
+	rank = np.arange(1, flat.shape[1]+1)[None,:]
+	passed = p_sorted <= alpha_fdr*rank/np.maximum(n_tests, 1)
+	# cutoff is the largest sorted p-value that passes its rank-dependent threshold (NaN if none passes;
+	# p-values of exactly 0 are still rejected)
+	rejected = passed.any(axis=1)
+	p_threshold = np.where(rejected, np.where(passed, p_sorted, -np.inf).max(axis=1), np.nan)
+	with np.errstate(invalid='ignore'):
+		mask = (flat <= p_threshold[:,None]) & rejected[:,None]
+
+	mask = p.copy(data=mask.reshape(p.shape)).transpose(*pvals.dims)
+	mask.name = 'significant'
+	mask.attrs = {'method': method, 'alpha': alpha,
+				  'p_threshold': p_threshold.reshape(stack_shape),
+				  'field_significant': rejected.reshape(stack_shape)}
+	return mask
+
+def sigtest(yearmean1,yearmean2,timemean1,timemean2,dim=None,alpha=0.1,correction=None):
 	"""
 	Determine statistical significance of two fields with identical sample sizes
+		- xarray inputs: NaN-aware paired t-test that stays lazy on dask arrays;
+		  returns DataArrays, with diff_mask set to NaN where the difference is not significant
+		- numpy inputs: scipy ttest_rel along axis 0; diff_mask is a masked array
+		- correction selects the multiple-testing control: None (p <= alpha), 'fdr' or 'wilks'
+		  (see significance_mask)
 	"""
-	ptvals = ttest_rel(yearmean1,yearmean2, axis=0)
+	if isinstance(yearmean1, xr.DataArray):
+		dim = yearmean1.dims[0] if dim is None else dim
+		ptvals = ttest_paired(yearmean1, yearmean2, dim=dim)
+		diff = timemean1-timemean2
+		diff_mask = diff.where(significance_mask(ptvals[1], alpha=alpha, method=correction))
+		return diff, diff_mask, ptvals
+	ptvals = stats.ttest_rel(yearmean1,yearmean2, axis=0)
 	diff = timemean1-timemean2
-	diff_mask = np.ma.masked_where(ptvals[1] > 0.1,diff)
+	if correction is None:
+		diff_mask = np.ma.masked_where(ptvals[1] > alpha,diff)
+	else:
+		pvals = xr.DataArray(np.asarray(ptvals[1]))
+		diff_mask = np.ma.masked_where(~significance_mask(pvals, alpha=alpha, method=correction).values,diff)
 	return diff, diff_mask, ptvals
 
-def sigtest2n(yearmean1,yearmean2,timemean1,timemean2):
+def sigtest2n(yearmean1,yearmean2,timemean1,timemean2,dim=None,alpha=0.1,correction=None):
 	"""
 	Determine statistical significance of two fields with unequal sample sizes
+		- xarray inputs: NaN-aware Welch t-test that stays lazy on dask arrays;
+		  returns DataArrays, with diff_mask set to NaN where the difference is not significant
+		- numpy inputs: scipy ttest_ind along axis 0; diff_mask is a masked array
+		- correction selects the multiple-testing control: None (p <= alpha), 'fdr' or 'wilks'
+		  (see significance_mask)
 	"""
-	ptvals = ttest_ind(yearmean1,yearmean2, axis=0, equal_var = False)
+	if isinstance(yearmean1, xr.DataArray):
+		dim = yearmean1.dims[0] if dim is None else dim
+		ptvals = ttest_welch(yearmean1, yearmean2, dim=dim)
+		diff = timemean1-timemean2
+		diff_mask = diff.where(significance_mask(ptvals[1], alpha=alpha, method=correction))
+		return diff, diff_mask, ptvals
+	ptvals = stats.ttest_ind(yearmean1,yearmean2, axis=0, equal_var = False)
 	diff = timemean1-timemean2
-	diff_mask = np.ma.masked_where(ptvals[1] > 0.1,diff)
+	if correction is None:
+		diff_mask = np.ma.masked_where(ptvals[1] > alpha,diff)
+	else:
+		pvals = xr.DataArray(np.asarray(ptvals[1]))
+		diff_mask = np.ma.masked_where(~significance_mask(pvals, alpha=alpha, method=correction).values,diff)
 	return diff, diff_mask, ptvals
 
+
+# data shared with resampling worker processes (set once per worker by _init_resample_worker)
+_RESAMPLE_DATA = {}
+
+def _init_resample_worker(data, n1):
+	_RESAMPLE_DATA['data'] = data
+	_RESAMPLE_DATA['n1'] = n1
+
+def _resample_batch(idx, kind, observed):
+	"""
+	Count, for every grid point, how many resampled statistics in a batch are at least as extreme as the observed one
+		- idx holds the resample indices of the whole batch [n_batch x n_samples]: one gather + one reduction
+		- kind is 'signflip' (idx = +/-1 per year), 'onesample' (indices into one sample) or 'twosample'
+	"""
+	data = _RESAMPLE_DATA['data']
+	n1 = _RESAMPLE_DATA['n1']
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', category=RuntimeWarning)
+		if kind == 'signflip':
+			stat = np.nanmean(idx[:,:,None]*data[None,:,:], axis=1)
+		elif kind == 'onesample':
+			stat = np.nanmean(data[idx], axis=1)
+		else:
+			sample = data[idx]
+			stat = np.nanmean(sample[:,:n1], axis=1) - np.nanmean(sample[:,n1:], axis=1)
+	with np.errstate(invalid='ignore'):
+		return (np.abs(stat) >= np.abs(observed)).sum(axis=0)
+
+def _block_bootstrap_idx(rng, n_resamples, n, block_size, offset=0):
+	"""
+	Moving (circular) block bootstrap indices [n_resamples x n]
+	"""
+	n_blocks = -(-n//block_size)
+	starts = rng.integers(0, n, size=(n_resamples, n_blocks))
+	idx = (starts[:,:,None] + np.arange(block_size)[None,None,:]) % n
+	return idx.reshape(n_resamples, -1)[:,:n] + offset
+
+def resample_test(x1, x2, dim='year', method='permutation', paired=False, n_resamples=1000,
+				  block_size=1, seed=0, workers=None, batch_size=None):
+	"""
+	Resampling significance test of the difference in means of two fields, at every grid point
+		- 'permutation': shuffles years between the two samples (sign flips for paired data)
+		- 'bootstrap': moving-block bootstrap of each sample around its own mean (keeps autocorrelation
+		  within blocks of block_size years)
+		- all resample indices are drawn up front from one seeded generator, so results do not depend on
+		  the number of workers; batches of replicates are applied as one gather + reduce and spread
+		  over a process pool
+		- missing values are skipped
+
+	Parameters
+	----------
+	x1, x2 : DataArrays of the two samples along dim (e.g. [year x lat x lon])
+	dim : sample dimension
+	method : 'permutation' or 'bootstrap'
+	paired : if True, test the mean of x1 - x2 (samples must be the same length)
+	n_resamples : number of replicates
+	block_size : block length for the bootstrap
+	seed : seed of the random generator
+	workers : number of worker processes (None = all cores, 1 = run in this process)
+	batch_size : replicates per batch (default keeps each batch gather under ~256 MB)
+
+	Returns
+	-------
+	diff : observed difference in means (x1 - x2)
+	pvals : two-sided p-values
+	"""
+	x1 = x1.transpose(dim, ...)
+	x2 = x2.transpose(dim, ...)
+	template = x1.isel({dim: 0}, drop=True)
+	n1, n2 = x1.sizes[dim], x2.sizes[dim]
+	d1 = np.asarray(x1.values, dtype='float64').reshape(n1, -1)
+	d2 = np.asarray(x2.values, dtype='float64').reshape(n2, -1)
+	rng = np.random.default_rng(seed)
+
+	if method not in ['permutation', 'bootstrap']:
+		raise ValueError(f"unknown resampling method '{method}'")
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', category=RuntimeWarning)
+		if paired:
+			data = d1 - d2
+			observed = np.nanmean(data, axis=0)
+			if method == 'permutation':
+				kind = 'signflip'
+				idx = rng.choice(np.array([-1., 1.]), size=(n_resamples, n1))
+			else:
+				# center the differences to impose the null hypothesis of zero mean
+				kind = 'onesample'
+				data = data - observed
+				idx = _block_bootstrap_idx(rng, n_resamples, n1, block_size)
+		else:
+			kind = 'twosample'
+			observed = np.nanmean(d1, axis=0) - np.nanmean(d2, axis=0)
+			if method == 'permutation':
+				data = np.concatenate([d1, d2], axis=0)
+				idx = rng.permuted(np.tile(np.arange(n1+n2), (n_resamples, 1)), axis=1)
+			else:
+				# center each sample to impose the null hypothesis of equal means
+				data = np.concatenate([d1 - np.nanmean(d1, axis=0), d2 - np.nanmean(d2, axis=0)], axis=0)
+				idx = np.concatenate([_block_bootstrap_idx(rng, n_resamples, n1, block_size),
+									  _block_bootstrap_idx(rng, n_resamples, n2, block_size, offset=n1)], axis=1)
+
+	if batch_size is None:
+		batch_size = int(max(1, min(n_resamples, 256*1024**2//(8*data.size))))
+	batches = [idx[i:i+batch_size] for i in range(0, n_resamples, batch_size)]
+	if workers == 1:
+		_init_resample_worker(data, n1)
+		counts = sum(_resample_batch(b, kind, observed) for b in batches)
+	else:
+		with ProcessPoolExecutor(max_workers=workers, initializer=_init_resample_worker, initargs=(data, n1)) as pool:
+			counts = sum(pool.map(_resample_batch, batches, repeat(kind), repeat(observed)))
+
+	pvals = (counts + 1.)/(n_resamples + 1.)
+	pvals = np.where(np.isfinite(observed), pvals, np.nan)
+	diff = template.copy(data=observed.reshape(template.shape))
+	pvals = template.copy(data=pvals.reshape(template.shape))
+	pvals.name = 'pval'
+	pvals.attrs = {'long_name': f'{method} test p-value', 'n_resamples': n_resamples}
+	return diff, pvals
+
+
+def ensemble_bias(models, obs, seasons=['djf','mam','jja','son'], threshold=0.75, model_dim='source_id'):
+	"""
+	Multi-model ensemble bias relative to observations and index of where models agree on the sign of the bias
+		- all models and seasons are handled in one broadcast pass (no loop over models)
+		- seasonal means come from one [season x month] weight matrix applied to the monthly climatologies
+
+	Parameters
+	----------
+	models : monthly climatology DataArray with a model dimension [source_id x month x lat x lon]
+	obs : observed monthly climatology [month x lat x lon], on the same grid as models
+	seasons : list of season names understood by get_season, or None if the data have no month dimension
+	threshold : fraction of models that must agree on the sign of the bias
+	model_dim : name of the model dimension
+
+	Returns
+	-------
+	xr.Dataset with
+		model_bias : bias of each model [season x source_id x lat x lon]
+		mean_bias : multi-model mean bias [season x lat x lon]
+		n_positive, n_negative : number of models with a positive/negative bias
+		agreement_idx : 0 where at least threshold*n_models agree on the sign of the bias, 1 where they do not
+	"""
+	if seasons is not None:
+		# weights to average the months of each season: one row per season
+		month = models['month'].values if 'month' in models.coords else None
+		wgts = season_weights(seasons, month=month)
+		# weights are renormalized over the months with data, so missing months are skipped
+		def _season_mean(da):
+			return (xr.dot(da.fillna(0), wgts, dim='month')/xr.dot(da.notnull(), wgts, dim='month')).transpose('season', ...)
+		models = _season_mean(models)
+		obs = _season_mean(obs)
+
+	# bias of every model, broadcast against the observations
+	model_bias = models - obs
+	# count the models with positive & negative biases
+	n_positive = (model_bias > 0).sum(dim=model_dim)
+	n_negative = (model_bias < 0).sum(dim=model_dim)
+	n_agree = threshold*models.sizes[model_dim]
+	agreement_idx = xr.where((n_positive >= n_agree) | (n_negative >= n_agree), 0, 1)
+
+	out = xr.Dataset({'model_bias': model_bias,
+					  'mean_bias': model_bias.mean(dim=model_dim, keep_attrs=True),
+					  'n_positive': n_positive,
+					  'n_negative': n_negative,
+					  'agreement_idx': agreement_idx})
+	out.attrs['n_models'] = models.sizes[model_dim]
+	out.attrs['threshold'] = threshold
+	return out
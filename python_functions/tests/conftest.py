@@ -0,0 +1,6 @@
+import os
+import sys
+sys.dont_write_bytecode = True
+
+# the modules in python_functions import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
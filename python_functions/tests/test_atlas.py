@@ -0,0 +1,36 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+from atlas import _align_reference
+
+###
+
+def _field():
+    lat = np.arange(-88.75, 90., 2.5)
+    lon = np.arange(1.25, 360., 2.5)
+    data = np.random.default_rng(0).random((12, lat.size, lon.size))*10
+    return(xr.DataArray(data, dims=['month', 'lat', 'lon'],
+                        coords={'month': np.arange(1, 13), 'lat': lat, 'lon': lon}, name='pr'))
+
+@pytest.mark.parametrize('layout', ['same', 'lon_convention', 'lat_flipped', 'both_renamed'])
+def test_reference_on_same_size_grid_is_aligned(layout):
+    # identical fields give a zero bias whatever the grid layout of the reference
+    var = _field()
+    ref = var.copy()
+    if layout in ['lon_convention', 'both_renamed']:
+        ref = ref.assign_coords(lon=(ref['lon'] + 180.) % 360. - 180.).sortby('lon')
+    if layout in ['lat_flipped', 'both_renamed']:
+        ref = ref.isel(lat=slice(None, None, -1))
+    if layout == 'both_renamed':
+        ref = ref.rename(lat='latitude', lon='longitude')
+    bias = var - _align_reference(var, ref)
+    assert bias.shape == var.shape
+    np.testing.assert_allclose(bias.values, 0., atol=1e-12)
+
+def test_reference_on_other_grid_is_regridded():
+    var = _field()
+    coarse = var.coarsen(lat=2, lon=2).mean()
+    ref = _align_reference(var, coarse)
+    assert ref.shape == var.shape
+    np.testing.assert_array_equal(ref['lon'].values, var['lon'].values)
@@ -0,0 +1,161 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+from data_funcs import lon_flip_index, lonFlip, match_lat_lon_names
+
+###
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+def test_lon_flip_global_01deg(dtype):
+    # global 0.1° grid (IMERG layout): float noise must not be taken for a split at the seam
+    lon = np.arange(-179.95, 180., 0.1).astype(dtype)
+    new_lon, index, target = lon_flip_index(lon, '0:360')
+    assert target == '0:360'
+    assert new_lon.min() >= 0. and new_lon.max() < 360.
+    assert np.all(np.diff(new_lon) > 0)
+    var = xr.DataArray(np.arange(lon.size, dtype='float64'), dims=['lon'], coords={'lon': lon})
+    flipped = lonFlip(var, '0:360')
+    assert float(flipped['lon'].min()) >= 0. and float(flipped['lon'].max()) < 360.
+    back = lonFlip(flipped, '-180:180')
+    np.testing.assert_allclose(back['lon'].values, lon, atol=1e-4)
+    np.testing.assert_array_equal(back.values, var.values)
+
+def test_lon_flip_regional_straddles_seam():
+    lon = np.arange(170., 191., 1.)
+    new_lon, index, target = lon_flip_index(lon, '-180:180')
+    np.testing.assert_allclose(new_lon, lon)
+
+def test_area_weights_follow_coordinate_names():
+    # the same grid under two naming conventions in one session (the area cache is shared)
+    from data_funcs import latitude_weighted_mean, grid_cell_area
+    from line_plot_tools import weighted_global_mean_1d, weighted_global_mean_md
+    lat = np.linspace(-89., 89., 90)
+    lon = np.arange(0., 360., 4.)
+    data = np.random.default_rng(0).random((3, 90, 90))
+    for y, x in [('lat', 'lon'), ('latitude', 'longitude')]:
+        var = xr.DataArray(data, dims=['time', y, x], coords={'time': np.arange(3), y: lat, x: lon})
+        mean = latitude_weighted_mean(var)
+        assert mean.dims == ('time',)
+        assert weighted_global_mean_md(var).dims == ('time',)
+        assert weighted_global_mean_1d(var.mean(x)).dims == ('time',)
+        assert grid_cell_area(var[y], var[x]).dims == (y, x)
+        np.testing.assert_allclose(float(grid_cell_area(var[y], var[x]).sum()), 4*np.pi*6371000.**2, rtol=1e-6)
+
+@pytest.mark.parametrize('freq', ['MS', 'D'])
+def test_annual_season_mean_daily_and_monthly(freq):
+    from data_funcs import annual_season_mean
+    time = xr.date_range('2000-01-01', '2002-12-31', freq=freq)
+    var = xr.DataArray(np.arange(time.size, dtype='float64'), dims=['time'], coords={'time': time})
+    seas = annual_season_mean(var)
+    # the first DJF (Jan-Feb 2000 only) is incomplete; the Dec 2002 block is too
+    assert list(seas['DJF']['year'].values) == [2001, 2002]
+    for season in ['MAM', 'JJA', 'SON']:
+        assert list(seas[season]['year'].values) == [2000, 2001, 2002]
+    ref = var.sel(time=slice('2001-06-01', '2001-08-31')).mean()
+    np.testing.assert_allclose(float(seas['JJA'].sel(year=2001)), float(ref))
+    assert len(annual_season_mean(var, complete=False)['DJF']['year']) == 4
+
+def test_seasonal_climatology_skips_missing_months():
+    from data_funcs import seasonal_climatology
+    data = np.arange(1., 13.)[:,None]*np.ones((12, 2))
+    data[0, 0] = np.nan        # January missing at the first point
+    data[[0, 1, 11], 1] = np.nan  # all of DJF missing at the second point
+    var = xr.DataArray(data, dims=['month', 'x'], coords={'month': np.arange(1, 13)})
+    clim = seasonal_climatology(var, ['DJF', 'JJA', 'ANN'])
+    old = var[[0, 1, 11]].mean('month')
+    np.testing.assert_allclose(clim.sel(season='DJF').values[0], old.values[0])   # (2 + 12)/2
+    assert np.isnan(clim.sel(season='DJF').values[1])
+    np.testing.assert_allclose(clim.sel(season='JJA').values, [7., 7.])
+    np.testing.assert_allclose(clim.sel(season='ANN').values[0], np.nanmean(data[:, 0]))
+
+def test_build_monthly_climatology_streams_daily_files(tmp_path):
+    from data_funcs import build_monthly_climatology, daily_to_monthly
+    time = xr.date_range('2001-01-01', '2003-12-31', freq='D', calendar='noleap', use_cftime=True)
+    data = np.random.default_rng(1).normal(size=(time.size, 4, 5))
+    data[5:40, 1, 1] = np.nan
+    var = xr.DataArray(data, dims=['time', 'lat', 'lon'], name='pr',
+                       coords={'time': time, 'lat': np.arange(4.), 'lon': np.arange(5.)})
+    files = []
+    for year in ['2001', '2002', '2003']:
+        files.append(str(tmp_path / f'pr_{year}.nc'))
+        var.sel(time=year).to_dataset().to_netcdf(files[-1])
+    # small slabs, so months are split across slabs and files
+    clim, mon = build_monthly_climatology(files, 'pr', time_chunk=50)
+    assert mon is None # monthly means are only kept on request
+    ref = var.resample(time='MS').mean()
+    np.testing.assert_allclose(clim['pr'].values, ref.groupby('time.month').mean().values, rtol=1e-10)
+    assert clim['pr'].dims == ('month', 'lat', 'lon')
+    np.testing.assert_allclose(clim['pr_annual_cycle'].mean('month').values, 0., atol=1e-12)
+    mon = daily_to_monthly(files, 'pr', time_chunk=50)
+    np.testing.assert_allclose(mon.values, ref.values, rtol=1e-10)
+    _, mon = build_monthly_climatology(files, 'pr', monthly_file=str(tmp_path / 'mon.nc'))
+    assert mon.sizes['time'] == 36 and (tmp_path / 'mon.nc').exists()
+
+###
+
+def _model(lat, lon, seed, names=('lat', 'lon')):
+    data = np.random.default_rng(seed).random((12, lat.size, lon.size))
+    return(xr.DataArray(data, dims=['month', names[0], names[1]], name='tas',
+                        coords={'month': np.arange(1, 13), names[0]: lat, names[1]: lon}))
+
+@pytest.mark.parametrize('use_store', [False, True])
+def test_ensemble_on_grid_matches_per_model_regrid(tmp_path, monkeypatch, use_store):
+    import regrid_funcs
+    from data_funcs import ensemble_on_grid
+    monkeypatch.setattr(regrid_funcs, 'CACHE_DIR', str(tmp_path/'weights'))
+    models = {'a': _model(np.arange(-89., 90., 2.), np.arange(1., 360., 2.), 0),
+              'b': _model(np.arange(-88.5, 90., 3.), np.arange(-178.5, 180., 3.), 1, names=('latitude', 'longitude')),
+              'c': _model(np.arange(-89., 90., 2.), np.arange(1., 360., 2.), 2).to_dataset()}
+    lat_out = xr.DataArray(np.arange(-87.5, 90., 5.), dims=['lat'], name='lat')
+    lon_out = xr.DataArray(np.arange(2.5, 360., 5.), dims=['lon'], name='lon')
+    store = str(tmp_path/'ens.zarr') if use_store else None
+    ens = ensemble_on_grid(models, lat_out, lon_out, var='tas', workers=2, store=store)
+    ens = ens['tas'] if isinstance(ens, xr.Dataset) else ens
+    assert ens.dims == ('source_id', 'month', 'lat', 'lon')
+    assert list(ens['source_id'].values) == ['a', 'b', 'c']
+    for key, da in models.items():
+        da = match_lat_lon_names(da['tas'] if isinstance(da, xr.Dataset) else da)
+        expected = regrid_funcs.regrid(da, da['lat'], da['lon'], lat_out, lon_out, method='bilinear')
+        np.testing.assert_allclose(ens.sel(source_id=key).values, expected.values, rtol=1e-6)
+
+###
+
+def _monthly_record(years=10):
+    time = xr.date_range('2001-01-01', periods=12*years, freq='MS')
+    # large offset relative to the spread checks the shifted sums
+    data = 1e5 + np.random.default_rng(2).normal(size=(time.size, 3, 4))
+    data[:7, 0, 0] = np.nan
+    data[:, 2, 3] = np.nan
+    return(xr.DataArray(data, dims=['time', 'lat', 'lon'], name='ps', attrs={'units': 'Pa'},
+                        coords={'time': time, 'lat': np.arange(3.), 'lon': np.arange(4.)}))
+
+def test_incremental_climatology_matches_full_record():
+    from data_funcs import update_climatology_state, climatology_from_state
+    var = _monthly_record()
+    state = update_climatology_state(None, var.isel(time=slice(0, 53)), time_chunk=10)
+    # the whole (appended) record is passed; only the months after the last update are added
+    state = update_climatology_state(state, var, time_chunk=7)
+    clim = climatology_from_state(state)
+    ref = var.groupby('time.month')
+    np.testing.assert_allclose(clim['ps'].values, ref.mean().values, rtol=1e-12)
+    np.testing.assert_allclose(clim['ps_std'].values, ref.std(ddof=1).values, rtol=1e-6)
+    np.testing.assert_array_equal(clim['n_years'].values, ref.count().values)
+    assert np.isnan(clim['ps'].values[:, 2, 3]).all()
+    # a rerun on the same record adds nothing
+    again = climatology_from_state(update_climatology_state(state, var))
+    np.testing.assert_array_equal(again['n_years'].values, clim['n_years'].values)
+
+def test_update_climatology_reads_only_new_months(tmp_path):
+    from data_funcs import update_climatology
+    var = _monthly_record()
+    state_file, data_file = str(tmp_path/'state.nc'), str(tmp_path/'ps.nc')
+    var.isel(time=slice(0, 96)).to_dataset().to_netcdf(data_file)
+    clim, anom = update_climatology(state_file, data_file, 'ps')
+    assert anom.sizes['time'] == 96
+    _, anom = update_climatology(state_file, data_file, 'ps')
+    assert anom is None
+    var.to_dataset().to_netcdf(data_file)
+    clim, anom = update_climatology(state_file, data_file, 'ps', standardize=True)
+    assert anom.sizes['time'] == 24 and anom.attrs['units'] == '1'
+    np.testing.assert_allclose(clim['ps'].values, var.groupby('time.month').mean().values, rtol=1e-12)
@@ -0,0 +1,57 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+from data_funcs import EARTH_RADIUS
+from diagnostic_funcs import divergence, vorticity, moisture_flux_convergence, pressure_thickness, GRAVITY
+
+###
+
+def _winds(u, v, lat, lon):
+    coords = {'lat': lat, 'lon': lon}
+    return(xr.DataArray(u, dims=['lat', 'lon'], coords=coords), xr.DataArray(v, dims=['lat', 'lon'], coords=coords))
+
+def _grid():
+    lat, lon = np.arange(-89.5, 90., 1.), np.arange(0.5, 360., 1.)
+    phi, lam = np.meshgrid(np.deg2rad(lat), np.deg2rad(lon), indexing='ij')
+    return(lat, lon, phi, lam)
+
+def test_vorticity_of_solid_body_rotation():
+    lat, lon, phi, lam = _grid()
+    U = 20.
+    u, v = _winds(U*np.cos(phi), np.zeros_like(phi), lat, lon)
+    vort = vorticity(u, v)
+    exact = 2*U*np.sin(phi)/EARTH_RADIUS
+    inside = np.abs(lat) < 85.
+    np.testing.assert_allclose(vort.values[inside], exact[inside], atol=1e-3*np.abs(exact).max())
+    assert vort.name == 'vort' and vort.dims == ('lat', 'lon')
+
+def test_divergence_matches_analytic_field():
+    lat, lon, phi, lam = _grid()
+    u, v = _winds(np.sin(lam)*np.cos(phi)**2, np.sin(phi)*np.cos(phi), lat, lon)
+    div = divergence(u, v)
+    exact = (np.cos(lam)*np.cos(phi)**2 + np.cos(phi)*(np.cos(phi)**2 - 2*np.sin(phi)**2))/(EARTH_RADIUS*np.cos(phi))
+    inside = np.abs(lat) < 85.
+    np.testing.assert_allclose(div.values[inside], exact[inside], atol=1e-3*np.abs(exact).max())
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_moisture_flux_convergence_matches_level_sum(chunked):
+    lat, lon, phi, lam = _grid()
+    plev = xr.DataArray([1000., 850., 700., 500., 300.], dims=['plev'], attrs={'units': 'hPa'})
+    rng = np.random.default_rng(0)
+    shape = (2, plev.size, lat.size, lon.size)
+    coords = {'time': [0, 1], 'plev': plev, 'lat': lat, 'lon': lon}
+    q = xr.DataArray(1e-2*rng.random(shape), dims=['time', 'plev', 'lat', 'lon'], coords=coords)
+    u = xr.DataArray(10*rng.standard_normal(shape), dims=q.dims, coords=coords)
+    v = xr.DataArray(10*rng.standard_normal(shape), dims=q.dims, coords=coords)
+    ps = xr.DataArray(np.full((2, lat.size, lon.size), 950.), dims=['time', 'lat', 'lon'],
+                      coords={'time': [0, 1], 'lat': lat, 'lon': lon}, attrs={'units': 'hPa'})
+    args = [a.chunk({'time': 1, 'plev': 2}) for a in (q, u, v)] if chunked else [q, u, v]
+    vimfc = moisture_flux_convergence(*args, ps=ps)
+    # the column integral of the convergence on each level equals the convergence of the column integral
+    dp = pressure_thickness(plev, ps=ps)
+    expected = -(divergence(q*u, q*v)*dp).sum('plev')/GRAVITY
+    np.testing.assert_allclose(vimfc.values, expected.values, rtol=1e-8, atol=1e-12)
+    assert vimfc.dims == ('time', 'lat', 'lon') and vimfc.name == 'vimfc'
+    # the layers end at the surface and add up to the column
+    np.testing.assert_allclose(dp.sum('plev').values, (95000. - 30000.))
@@ -0,0 +1,48 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import cartopy.crs as ccrs
+
+from map_plot_tools import draw_field, central_longitude
+
+###
+
+def _render(var, proj, fast):
+    # field only (no coastlines), as an RGB array
+    fig = plt.figure(figsize=(4, 2), dpi=100)
+    ax = plt.subplot(111, projection=proj)
+    ax.set_global()
+    ax.axis('off')
+    draw_field(ax, var, cmap='viridis', vmin=0, vmax=1, fast=fast)
+    fig.canvas.draw()
+    rgb = np.asarray(fig.canvas.buffer_rgba())[...,:3].copy()
+    bbox = ax.get_window_extent()
+    plt.close(fig)
+    return(rgb, bbox)
+
+def _feature_field(lon):
+    # 1 between 0° and 90°E, 0 elsewhere
+    lat = np.arange(-88.75, 90., 2.5)
+    wrapped = lon % 360.
+    data = np.where((wrapped > 0.) & (wrapped < 90.), 1., 0.)[None,:]*np.ones((lat.size, 1))
+    return(xr.DataArray(data, dims=['lat', 'lon'], coords={'lat': lat, 'lon': lon}))
+
+@pytest.mark.parametrize('lon', [np.arange(1.25, 360., 2.5), np.arange(-178.75, 180., 2.5)])
+@pytest.mark.parametrize('lon0', [0., 180.])
+def test_fast_matches_pcolormesh(lon, lon0):
+    var = _feature_field(lon)
+    proj = ccrs.PlateCarree(central_longitude=lon0)
+    assert central_longitude(proj) == lon0
+    fast, bbox = _render(var, proj, True)
+    slow, _ = _render(var, proj, False)
+    differ = np.any(np.abs(fast.astype(int) - slow.astype(int)) > 10, axis=-1)
+    assert differ.mean() < 0.01
+    # the 0-90°E feature sits where it belongs on the map: x fraction of 0.5-0.75 (lon0=0) or 0-0.25 (lon0=180)
+    row = fast[fast.shape[0] - int(bbox.y0 + bbox.height/2), int(bbox.x0):int(bbox.x1)]
+    lit = np.flatnonzero(row.astype(int).sum(axis=-1) > 400)/row.shape[0]
+    expected = 0.5 if lon0 == 0. else 0.
+    assert abs(lit.min() - expected) < 0.03 and abs(lit.max() - (expected+0.25)) < 0.03
@@ -0,0 +1,34 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+from point_funcs import extract_points
+
+###
+
+def _grid(lon):
+    lat = np.arange(-88.75, 90., 2.5)
+    data = np.random.default_rng(0).random((2, lat.size, lon.size))
+    return(xr.DataArray(data, dims=['time', 'lat', 'lon'], coords={'time': np.arange(2), 'lat': lat, 'lon': lon}))
+
+@pytest.mark.parametrize('lon', [np.arange(1.25, 360., 2.5), np.arange(-178.75, 180., 2.5)])
+def test_nearest_point_across_dateline(lon):
+    var = _grid(lon)
+    # points just either side of the dateline and of the prime meridian, in both conventions
+    lats = np.array([10.1, 10.1, -45.1, -45.1])
+    lons = np.array([179.9, -179.9, 359.9, -0.1])
+    points = extract_points(var, lats, lons)
+    expected_lon = [178.75, -178.75, -1.25, -1.25]
+    for i in range(lats.size):
+        ix = int(np.argmin(np.abs(((lon - expected_lon[i]) + 180.) % 360. - 180.)))
+        iy = int(np.argmin(np.abs(var['lat'].values - lats[i])))
+        np.testing.assert_array_equal(points.isel(station=i).values, var.values[:, iy, ix])
+    assert points.dims == ('time', 'station')
+    # never further than half the diagonal of a 2.5° cell
+    assert (points['distance'] < 200.).all()
+
+def test_idw_of_a_constant_field():
+    var = xr.ones_like(_grid(np.arange(1.25, 360., 2.5)))
+    var[:, :, 0] = np.nan # missing neighbors are skipped
+    points = extract_points(var, [0., 60.], [0.5, 180.], method='idw', k=4)
+    np.testing.assert_allclose(points.values, 1.)
@@ -0,0 +1,37 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+from data_funcs import subset_box, area_weighted_mean
+from region_funcs import region_mean
+
+###
+
+def _field(seed=0):
+    lat, lon = np.arange(-89., 90., 2.), np.arange(1., 360., 2.)
+    data = np.random.default_rng(seed).random((4, lat.size, lon.size))
+    data[:, 50:55, 100:110] = np.nan
+    return(xr.DataArray(data, dims=['time', 'lat', 'lon'], coords={'time': np.arange(4), 'lat': lat, 'lon': lon}))
+
+def test_region_mean_matches_box_average():
+    var = _field()
+    # boxes on cell edges, one of them across the 0/360 seam and one with missing cells
+    regions = {'tropics': [10., 50., -20., 30.], 'seam': [340., 20., 40., 60.], 'gap': [190., 230., 0., 30.]}
+    means = region_mean(var, regions)
+    assert means.dims == ('time', 'region') and list(means['region'].values) == list(regions)
+    for name, box in regions.items():
+        sub = subset_box(var, box)
+        expected = area_weighted_mean(sub, sub['lat'], sub['lon'])
+        np.testing.assert_allclose(means.sel(region=name).values, expected.values, rtol=1e-10)
+
+def test_region_mean_percent_masks():
+    var = _field()
+    frac = xr.DataArray(np.random.default_rng(1).random((var['lat'].size, var['lon'].size)),
+                        dims=['lat', 'lon'], coords={'lat': var['lat'], 'lon': var['lon']})
+    percent = (frac*100.).assign_attrs(units='%')
+    a = region_mean(var, {'land': frac})
+    b = region_mean(var, {'land': percent})
+    np.testing.assert_allclose(a.values, b.values, rtol=1e-12)
+    # the same values without percent units are not guessed to be in percent
+    with pytest.raises(ValueError):
+        region_mean(var, {'land': percent.assign_attrs(units='1')})
@@ -0,0 +1,96 @@
+import os
+import time
+import numpy as np
+import xarray as xr
+import pytest
+
+import regrid_funcs
+from regrid_funcs import build_weights, save_weights, load_weights, grid_fingerprint
+
+###
+
+def _grids():
+    lat_in, lon_in = np.arange(-89., 90., 2.), np.arange(1., 360., 2.)
+    lat_out, lon_out = np.arange(-87.5, 90., 5.), np.arange(2.5, 360., 5.)
+    return(lat_in, lon_in, lat_out, lon_out)
+
+def test_weight_cache_round_trip(tmp_path):
+    weights = build_weights(*_grids(), method='conservative')
+    key = grid_fingerprint(*_grids(), tag='conservative')
+    save_weights(weights, key, cache_dir=str(tmp_path))
+    loaded = load_weights(key, cache_dir=str(tmp_path))
+    assert loaded.shape == weights.shape
+    assert (loaded != weights).nnz == 0
+    np.testing.assert_array_equal(loaded.data, weights.data)
+    # one index dtype on disk and in memory: scipy uses the memory-mapped arrays without a copy
+    assert loaded.indices.dtype == loaded.indptr.dtype
+    assert isinstance(loaded.indptr.base, np.memmap) or isinstance(loaded.indptr, np.memmap)
+    assert load_weights('missing', cache_dir=str(tmp_path)) is None
+
+def test_evict_keeps_entries_being_written(tmp_path):
+    weights = build_weights(*_grids(), method='bilinear')
+    save_weights(weights, 'old', cache_dir=str(tmp_path))
+    entry_size = regrid_funcs._cache_size(str(tmp_path))
+    # a temporary entry of another live process (this one) & a stale one of a finished process
+    live = tmp_path / f'new.tmp{os.getpid()}'
+    stale = tmp_path / 'dead.tmp999999999'
+    young = tmp_path / 'other_node.tmp999999998' # just created (e.g. by a job on another node)
+    for d in [live, stale, young]:
+        d.mkdir()
+        np.save(d / 'data.npy', np.zeros(10))
+    past = time.time() - 2*regrid_funcs.TMP_GRACE_SECONDS
+    os.utime(stale, (past, past))
+    os.utime(live, (past, past))
+    os.utime(tmp_path / 'old', (past - 10, past - 10))
+    regrid_funcs._evict(str(tmp_path), max_bytes=0)
+    assert live.is_dir() and young.is_dir()
+    assert not stale.exists()
+    assert not (tmp_path / 'old').exists()
+    assert entry_size > 0
+
+###
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # keep the weight cache of the tests out of the user's cache directory
+    monkeypatch.setattr(regrid_funcs, 'CACHE_DIR', str(tmp_path))
+    regrid_funcs.clear_weights()
+    return(str(tmp_path))
+
+def _field(lat, lon, seed=0):
+    data = np.random.default_rng(seed).random((3, lat.size, lon.size))
+    return(xr.DataArray(data, dims=['time', 'lat', 'lon'], coords={'time': np.arange(3), 'lat': lat, 'lon': lon}))
+
+def test_conservative_regrid_keeps_global_mean(cache_dir):
+    from data_funcs import area_weighted_mean
+    from regrid_funcs import regrid
+    lat_in, lon_in, lat_out, lon_out = _grids()
+    var = _field(lat_in, lon_in)
+    lat_o = xr.DataArray(lat_out, dims=['lat'], name='lat')
+    lon_o = xr.DataArray(lon_out, dims=['lon'], name='lon')
+    out = regrid(var, var['lat'], var['lon'], lat_o, lon_o, method='conservative')
+    assert out.dims == ('time', 'lat', 'lon') and out.shape == (3, lat_out.size, lon_out.size)
+    np.testing.assert_allclose(area_weighted_mean(out, out['lat'], out['lon']).values,
+                               area_weighted_mean(var, var['lat'], var['lon']).values, rtol=1e-10)
+
+def test_bilinear_regrid_is_exact_for_linear_fields(cache_dir):
+    from data_funcs import regrid_like
+    lat_in, lon_in, lat_out, lon_out = _grids()
+    src = xr.DataArray(2.*lat_in[:,None] + 0.*lon_in[None,:], dims=['lat', 'lon'], coords={'lat': lat_in, 'lon': lon_in})
+    ref = xr.DataArray(np.zeros((lat_out.size, lon_out.size)), dims=['lat', 'lon'], coords={'lat': lat_out, 'lon': lon_out})
+    out = regrid_like(ref, src, method='bilinear')
+    inside = np.abs(lat_out) < 88.
+    np.testing.assert_allclose(out.values[inside], (2.*lat_out[:,None]*np.ones(lon_out.size))[inside], atol=1e-10)
+
+def test_regrid_skips_missing_cells(cache_dir):
+    from regrid_funcs import regrid
+    lat_in, lon_in, lat_out, lon_out = _grids()
+    var = xr.ones_like(_field(lat_in, lon_in))
+    var[:, :10, :] = np.nan # missing cells are skipped and the weights renormalized
+    out = regrid(var, var['lat'], var['lon'], xr.DataArray(lat_out, dims=['lat'], name='lat'),
+                 xr.DataArray(lon_out, dims=['lon'], name='lon'))
+    valid = np.isfinite(out.values)
+    np.testing.assert_allclose(out.values[valid], 1.)
+    assert valid[:, -1].all() and not valid[:, 0].any()
+    # weights were built once and reused from memory
+    assert len(regrid_funcs._WEIGHTS) == 1
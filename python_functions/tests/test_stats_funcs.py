@@ -0,0 +1,99 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+from stats_funcs import significance_mask, ttest_paired, ttest_welch, resample_test, ensemble_bias
+
+###
+
+@pytest.mark.parametrize('method', ['fdr', 'wilks'])
+def test_significance_mask_zero_pvalues(method):
+    # p-values of exactly 0 are significant
+    pvals = xr.DataArray(np.zeros((2, 4, 5)), dims=['season', 'lat', 'lon'])
+    mask = significance_mask(pvals, alpha=0.05, method=method)
+    assert bool(mask.all())
+    assert np.all(mask.attrs['field_significant'])
+
+@pytest.mark.parametrize('method', ['fdr', 'wilks'])
+def test_significance_mask_no_rejection(method):
+    pvals = xr.DataArray(np.full((4, 5), 0.9), dims=['lat', 'lon'])
+    pvals[0, 0] = 0.
+    mask = significance_mask(pvals, alpha=0.05, method=method)
+    assert int(mask.sum()) == 1 and bool(mask[0, 0])
+    none = significance_mask(xr.DataArray(np.full((4, 5), 0.9), dims=['lat', 'lon']), alpha=0.05, method=method)
+    assert not bool(none.any())
+    assert not none.attrs['field_significant']
+    assert np.isnan(none.attrs['p_threshold'])
+
+###
+
+def _samples(n1=20, n2=25, seed=0):
+    rng = np.random.default_rng(seed)
+    # large offset relative to the spread checks the shifted moments
+    x1 = xr.DataArray(1e4 + rng.normal(0., 1., (n1, 3, 4)), dims=['year', 'lat', 'lon'])
+    x2 = xr.DataArray(1e4 + rng.normal(0.5, 2., (n2, 3, 4)), dims=['year', 'lat', 'lon'])
+    return(x1, x2)
+
+def test_ttests_match_scipy():
+    from scipy import stats
+    x1, x2 = _samples()
+    t, p = ttest_welch(x1, x2)
+    ref = stats.ttest_ind(x1.values, x2.values, axis=0, equal_var=False)
+    np.testing.assert_allclose(t.values, ref.statistic, rtol=1e-8)
+    np.testing.assert_allclose(p.values, ref.pvalue, rtol=1e-8)
+    t, p = ttest_paired(x1, x2.isel(year=slice(0, 20)))
+    ref = stats.ttest_rel(x1.values, x2.values[:20], axis=0)
+    np.testing.assert_allclose(t.values, ref.statistic, rtol=1e-8)
+    np.testing.assert_allclose(p.values, ref.pvalue, rtol=1e-8)
+
+def test_ttests_skip_missing_values():
+    from scipy import stats
+    x1, x2 = _samples()
+    x1[:5, 0, 0] = np.nan
+    x2[:, 1, 1] = np.nan
+    t, p = ttest_welch(x1, x2)
+    ref = stats.ttest_ind(x1.values[5:, 0, 0], x2.values[:, 0, 0], equal_var=False)
+    np.testing.assert_allclose([t.values[0, 0], p.values[0, 0]], [ref.statistic, ref.pvalue], rtol=1e-6)
+    # a point with no data in one sample has no p-value
+    assert np.isnan(p.values[1, 1])
+    assert np.isfinite(p.values[np.arange(3) != 1]).all()
+
+###
+
+@pytest.mark.parametrize('method', ['permutation', 'bootstrap'])
+@pytest.mark.parametrize('paired', [False, True])
+def test_resample_test_is_reproducible(method, paired):
+    x1, x2 = _samples(n1=20, n2=20)
+    kw = dict(method=method, paired=paired, n_resamples=200, block_size=2, seed=3)
+    diff, p = resample_test(x1, x2, workers=1, **kw)
+    # the same seed gives the same p-values, whatever the batching or number of workers
+    _, p_batched = resample_test(x1, x2, workers=1, batch_size=7, **kw)
+    _, p_pool = resample_test(x1, x2, workers=2, batch_size=50, **kw)
+    np.testing.assert_array_equal(p.values, p_batched.values)
+    np.testing.assert_array_equal(p.values, p_pool.values)
+    np.testing.assert_allclose(diff.values, (x1.mean('year') - x2.mean('year')).values)
+    assert ((p > 0) & (p <= 1)).all()
+
+def test_resample_test_detects_shift():
+    rng = np.random.default_rng(1)
+    x1 = xr.DataArray(rng.normal(0., 1., (30, 2)), dims=['year', 'x'])
+    x2 = x1.copy(data=rng.normal(0., 1., (30, 2)) + np.array([0., 3.]))
+    _, p = resample_test(x1, x2, n_resamples=500, workers=1)
+    assert p.values[0] > 0.05 and p.values[1] < 0.01
+
+###
+
+def test_ensemble_bias_skips_missing_months():
+    rng = np.random.default_rng(4)
+    coords = {'source_id': ['a', 'b', 'c'], 'month': np.arange(1, 13)}
+    models = xr.DataArray(rng.normal(size=(3, 12, 2, 2)), dims=['source_id', 'month', 'lat', 'lon'], coords=coords)
+    obs = xr.DataArray(rng.normal(size=(12, 2, 2)), dims=['month', 'lat', 'lon'], coords={'month': np.arange(1, 13)})
+    models[0, 0, 0, 0] = np.nan # January missing in one model
+    obs[6, 1, 1] = np.nan # July missing in the observations
+    out = ensemble_bias(models, obs)
+    assert out['model_bias'].dims == ('season', 'source_id', 'lat', 'lon')
+    djf = models.sel(month=[12, 1, 2]).mean('month') - obs.sel(month=[12, 1, 2]).mean('month')
+    jja = models.sel(month=[6, 7, 8]).mean('month') - obs.sel(month=[6, 7, 8]).mean('month')
+    np.testing.assert_allclose(out['model_bias'].isel(season=0).values, djf.values, rtol=1e-12)
+    np.testing.assert_allclose(out['model_bias'].isel(season=2).values, jja.values, rtol=1e-12)
+    assert np.isfinite(out['mean_bias'].values).all()